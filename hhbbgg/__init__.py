@@ -0,0 +1,5 @@
+# Columnar analysis tools for the HH/X->YH -> bbgg studies.
+#
+# The plot scripts in plots/ and notebooks/ loop over every event in PyROOT.
+# The modules in this package read the DiphotonTree branches as NumPy arrays
+# and do the same computations for whole chunks of events at once.
@@ -0,0 +1,217 @@
+"""Declarative analysis driven by config.json.
+
+Besides the samples, config.json can describe what to plot:
+
+    "observables": {"m_bb": {"expression": "m_bb", "bins": 20, "range": [80, 180], "label": "M_{bb} (GeV)"}},
+    "selections":  {"photon_id": "lead_mvaID_WP90 & sublead_mvaID_WP90"},
+    "blinding":    {"m_bb": [110, 140]},
+    "weights":     {"mc": ["genweight"], "data": []},
+    "preselection": ["photon_id"],
+    "weight_variations": {"nominal": "genweight * weight_central", "PhotonIDUp": "genweight * weight_PhotonIDUp"},
+    "sample_groups": {"H#rightarrow#gamma#gamma": ["GluGluHToGG", "ttHToGG"]},
+    "plots": [{"observable": "m_bb"}, {"observable": "m_bb", "selection": "photon_id"},
+              {"observables": ["m_gg", "m_bb"], "bins": [400, 500], "range": [[100, 180], [80, 180]]}]
+
+A plot with "observables" is an N-dimensional SparseHist (e.g. the m_gg x
+m_bb or M_X vs M_Y plane), which only stores the occupied bins;
+``hist.project("m_bb", where={"m_gg": (120, 130)})`` gives 1D slices.
+
+"derived": true (or a list of observables) reads the registered
+observables from the derived-column store instead of computing them on
+every run (see derived.py).
+
+"preselection" lists selections (names or expressions) applied to every
+plot. They are evaluated first, and the entries passing them are stored in
+the entry index (see entry_index.py), so later runs only read those entries.
+
+``"weight_variations": "auto"`` fills one variation per weight_*Up/Down
+branch found in every MC sample (see systematics.py) instead of a fixed list,
+with the "mc" weights as the nominal.
+
+Every plot of every sample is filled in one fused pass over each input file,
+so adding another plot costs a few more array operations per chunk and no
+additional reading.
+"""
+
+import os
+
+from . import config as config_module, derived, result_cache, scheduler, sumw_index, systematics
+
+
+def plot_name(plot):
+    if plot.get("name"):
+        return plot["name"]
+    observable = "_vs_".join(plot["observables"]) if "observables" in plot else plot["observable"]
+    return f"{observable}__{plot['selection']}" if plot.get("selection") else observable
+
+
+def histogram_requests(config):
+    """Compile the observables/selections/blinding/weights/plots sections into engine requests."""
+    observables = config.get("observables", {})
+    selections = config.get("selections", {})
+    blinding = config.get("blinding", {})
+    weights = config.get("weights", {})
+    plots = config.get("plots") or [{"observable": name} for name in observables]
+    variations = weight_variations(config)
+
+    requests = []
+    for plot in plots:
+        if "observables" in plot:
+            requests.append(_sparse_request(plot, observables, selections, blinding, weights))
+            continue
+        definition = observables[plot["observable"]]
+        request = {
+            "name": plot_name(plot),
+            "observable": definition.get("expression", plot["observable"]),
+            "weights": list(weights.get("mc", ["genweight"])),
+            "data_weights": list(weights.get("data", [])),
+        }
+        if "edges" in definition:
+            request["edges"] = list(definition["edges"])
+        else:
+            request["bins"] = definition["bins"]
+            request["range"] = tuple(definition["range"])
+        selection = plot.get("selection")
+        if selection:
+            request["selection"] = selections.get(selection, selection)
+        if variations:
+            request["variations"] = dict(variations)
+        blind = plot.get("blind", blinding.get(plot["observable"]))
+        if blind:
+            request["blind"] = tuple(blind)
+        requests.append(request)
+    return requests
+
+
+def preselection(config):
+    """Expressions of the "preselection" cuts, which every plot applies."""
+    names = config.get("preselection") or []
+    names = [names] if isinstance(names, str) else names
+    selections = config.get("selections", {})
+    return [selections.get(name, name) for name in names]
+
+
+def weight_variations(config):
+    """{name: weight expression} of "weight_variations", discovering them in the MC files for "auto"."""
+    variations = config.get("weight_variations")
+    if variations != "auto":
+        return variations
+    mc = [sample["file_path"] for sample in config_module.samples_from_config(config) if sample["kind"] == "mc"]
+    # The nominal row must be the plot drawn without variations, i.e. use the same MC weights
+    weights = config.get("weights", {}).get("mc", ["genweight"])
+    return systematics.discover_common(mc, config["tree_name"], weights)
+
+
+def _sparse_request(plot, observables, selections, blinding, weights):
+    # {"observables": ["m_gg", "m_bb"], "bins": [400, 500], "range": [[100, 180], [80, 180]]}:
+    # binning given in the plot wins over the one of each observable
+    names = plot["observables"]
+    definitions = [observables.get(name, {}) for name in names]
+    request = {
+        "name": plot_name(plot),
+        "observables": [definition.get("expression", name) for name, definition in zip(names, definitions)],
+        "axis_names": list(names),
+        "weights": list(weights.get("mc", ["genweight"])),
+        "data_weights": list(weights.get("data", [])),
+    }
+    if "edges" in plot:
+        request["edges"] = [list(edges) for edges in plot["edges"]]
+    else:
+        request["edges"] = [list(definition["edges"]) if "edges" in definition and "bins" not in plot else None for definition in definitions]
+        request["bins"] = list(plot.get("bins") or [definition.get("bins") for definition in definitions])
+        request["range"] = [tuple(r) if r is not None else None for r in (plot.get("range") or [definition.get("range") for definition in definitions])]
+    selection = plot.get("selection")
+    if selection:
+        request["selection"] = selections.get(selection, selection)
+    blind = plot.get("blind") or {name: blinding[name] for name in names if name in blinding}
+    if blind:
+        expression_of = dict(zip(names, request["observables"]))
+        request["blind"] = {expression_of.get(name, name): tuple(window) for name, window in blind.items()}
+    return request
+
+
+def luminosity(config):
+    return sum(config.get("integrated_luminosities", {}).values())
+
+
+def normalization(config):
+    """Return scale(sample): cross_section * luminosity / sum of genweight for MC with a cross section."""
+    tree_name = config["tree_name"]
+    total_luminosity = luminosity(config)
+
+    def scale(sample):
+        if sample["kind"] != "mc" or "cross_section" not in sample:
+            return 1.0
+        return sample["cross_section"] * total_luminosity / sumw_index.sum_genweight(sample["file_path"], tree_name)
+
+    return scale
+
+
+BACKENDS = ("numpy", "rdataframe")
+
+
+def run(config, n_workers=None, chunk_size=None, use_cache=True, backend="numpy"):
+    """Fill every plot for every sample; returns {group: {plot name: Hist1D}}.
+
+    ``config`` is a path to a config file or an already loaded config dict.
+    backend="rdataframe" fills the same plots with ROOT.RDataFrame and
+    ``n_workers`` threads instead (see rdf.py); its results are not cached.
+    """
+    if isinstance(config, str):
+        config = config_module.load_config(config)
+    samples = config_module.samples_from_config(config)
+    histograms = histogram_requests(config)
+    cuts = preselection(config)
+    if backend == "rdataframe":
+        from . import rdf
+
+        return rdf.run_groups(samples, config["tree_name"], histograms, n_threads=n_workers, scale=normalization(config), cuts=cuts)
+    if backend != "numpy":
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    groups = scheduler.run_groups(
+        samples,
+        config["tree_name"],
+        histograms,
+        n_workers=n_workers,
+        chunk_size=chunk_size,
+        use_cache=use_cache,
+        scale=normalization(config),
+        cuts=cuts,
+        derived=derived.config_columns(config),
+    )
+    if use_cache:
+        keys = {sample["name"]: scheduler.sample_key(sample, config["tree_name"], histograms, cuts) for sample in samples}
+        result_cache.save_manifest(_manifest_name(config), keys)
+    return groups
+
+
+def _manifest_name(config):
+    # One manifest per config file location and tree
+    return f"{config.get('_base_dir', os.getcwd())}:{config['tree_name']}"
+
+
+def status(config):
+    """What the next run would do for each sample: {name: "cached" | "new" | "changed" | "missing"}.
+
+    "new" samples were not in the config at the last run (e.g. a newly added
+    era); "changed" ones have a different input file or plot definitions.
+    Only cached samples are taken from disk, everything else is re-read;
+    "missing" means the input file itself is not there.
+    """
+    if isinstance(config, str):
+        config = config_module.load_config(config)
+    histograms = histogram_requests(config)
+    cuts = preselection(config)
+    previous = result_cache.load_manifest(_manifest_name(config))
+    result = {}
+    for sample in config_module.samples_from_config(config):
+        try:
+            key = scheduler.sample_key(sample, config["tree_name"], histograms, cuts)
+        except OSError:
+            result[sample["name"]] = "missing"
+            continue
+        if result_cache.contains(key):
+            result[sample["name"]] = "cached"
+        else:
+            result[sample["name"]] = "changed" if sample["name"] in previous else "new"
+    return result
@@ -0,0 +1,260 @@
+"""Throughput benchmark of the processing paths on synthetic DiphotonTree files.
+
+    python -m hhbbgg.benchmark --entries 1000000 --formats root parquet
+
+Each path fills the dijet mass histogram of every sample and runs in a fresh
+process so that its peak RSS is measured on its own. The PyROOT loop and
+RDataFrame paths need ROOT and are skipped when it is not installed.
+
+    python -m hhbbgg.benchmark --startup
+
+times the command-line entry point (main.py) instead, next to a bare
+``import ROOT`` and ``import numpy``, and lists the heavy modules that each
+command actually loaded.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+PATHS = ("pyroot", "columnar", "rdataframe", "parallel")
+
+HISTOGRAM = {"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180)}
+
+
+def _pyroot_loop(samples, tree_name, options):
+    # The per-event loop of the original plot scripts
+    import ROOT
+
+    hist = ROOT.TH1F("bench_pyroot", "", HISTOGRAM["bins"], *HISTOGRAM["range"])
+    for sample in samples:
+        file = ROOT.TFile(sample["file_path"], "READ")
+        tree = file.Get(tree_name)
+        for event in tree:
+            lv1 = ROOT.TLorentzVector()
+            lv1.SetPtEtaPhiM(event.lead_bjet_pt, event.lead_bjet_eta, event.lead_bjet_phi, event.lead_bjet_mass)
+            lv2 = ROOT.TLorentzVector()
+            lv2.SetPtEtaPhiM(event.sublead_bjet_pt, event.sublead_bjet_eta, event.sublead_bjet_phi, event.sublead_bjet_mass)
+            hist.Fill((lv1 + lv2).M(), getattr(event, "genweight", 1.0))
+        file.Close()
+    return hist.Integral()
+
+
+def _columnar(samples, tree_name, options):
+    from . import engine
+
+    total = 0.0
+    for sample in samples:
+        filled = engine.fill_streaming(sample["file_path"], tree_name, [HISTOGRAM], options.get("chunk_size"), is_data=sample["kind"] == "data")
+        total += filled["m_bb"].integral()
+    return total
+
+
+def _rdataframe(samples, tree_name, options):
+    from . import rdf
+
+    groups = rdf.run_groups(samples, tree_name, [HISTOGRAM], n_threads=options.get("workers"))
+    return sum(result["m_bb"].integral() for result in groups.values())
+
+
+def _parallel(samples, tree_name, options):
+    from . import scheduler
+
+    groups = scheduler.run_groups(samples, tree_name, [HISTOGRAM], n_workers=options.get("workers"), chunk_size=options.get("chunk_size"), use_cache=False)
+    return sum(result["m_bb"].integral() for result in groups.values())
+
+
+_RUNNERS = {
+    "pyroot": _pyroot_loop,
+    "columnar": _columnar,
+    "rdataframe": _rdataframe,
+    "parallel": _parallel,
+}
+
+
+def _needs_root(path):
+    return path in ("pyroot", "rdataframe")
+
+
+def root_available():
+    try:
+        import ROOT  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _measure(path, samples, tree_name, options):
+    # Runs in a fresh process; ru_maxrss is in kB on Linux
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    checksum = _RUNNERS[path](samples, tree_name, options)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"wall_s": wall, "cpu_s": cpu, "peak_rss_mb": max(self_rss, children_rss) / 1024.0, "checksum": checksum}
+
+
+def run_path(path, samples, tree_name=None, options=None):
+    """Time one processing path over ``samples`` in a separate process."""
+    # Imported here so that "main.py bench --help" does not load numpy
+    from . import reader
+
+    tree_name = tree_name or reader.DEFAULT_TREE
+    options = options or {}
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        result = pool.submit(_measure, path, samples, tree_name, options).result()
+    n_entries = sum(reader.num_entries(sample["file_path"], tree_name) for sample in samples)
+    n_bytes = sum(os.path.getsize(sample["file_path"]) for sample in samples)
+    result.update(
+        path=path,
+        entries=n_entries,
+        events_per_s=n_entries / result["wall_s"] if result["wall_s"] else 0.0,
+        mb_per_s=n_bytes / 1e6 / result["wall_s"] if result["wall_s"] else 0.0,
+    )
+    return result
+
+
+def format_table(rows):
+    header = f"{'format':<8} {'path':<11} {'entries':>10} {'wall [s]':>9} {'cpu [s]':>8} {'events/s':>12} {'MB/s':>8} {'peak RSS [MB]':>14}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['format']:<8} {row['path']:<11} {row['entries']:>10d} {row['wall_s']:>9.2f} {row['cpu_s']:>8.2f} "
+            f"{row['events_per_s']:>12.0f} {row['mb_per_s']:>8.1f} {row['peak_rss_mb']:>14.0f}"
+        )
+    return "\n".join(lines)
+
+
+def run(entries, formats=("root",), paths=PATHS, n_samples=5, extra_branches=100, workers=None, chunk_size=None, directory=None):
+    """Generate the synthetic samples and time every requested path; returns a list of rows."""
+    from . import synthetic
+
+    directory = directory or tempfile.mkdtemp(prefix="hhbbgg_bench_")
+    has_root = root_available()
+    options = {"workers": workers or os.cpu_count() or 1, "chunk_size": chunk_size}
+    names = ["Data_EraE", "Data_EraF", "GGJets", "GJetPt20To40", "GJetPt40", "GluGluHToGG", "ttHToGG", "VBFHToGG", "VHToGG", "GluGluToHH"][:n_samples]
+    rows = []
+    for file_format in formats:
+        samples = synthetic.make_samples(os.path.join(directory, file_format), entries, file_format, extra_branches, names)
+        for path in paths:
+            if _needs_root(path) and (not has_root or file_format != "root"):
+                print(f"Skipping {path} on {file_format} input (needs ROOT and .root files)", file=sys.stderr)
+                continue
+            row = run_path(path, samples, options=options)
+            row["format"] = file_format
+            rows.append(row)
+    return rows
+
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+HEAVY_MODULES = ("ROOT", "numpy", "pyarrow", "uproot")
+
+# Runs main.py with the given arguments and reports which heavy modules it imported
+_STARTUP_PROBE = """
+import os, runpy, sys
+# As if run as "python main.py", from any working directory
+sys.path.insert(0, os.path.dirname({script!r}))
+sys.argv = [{script!r}] + {argv!r}
+try:
+    runpy.run_path({script!r}, run_name="__main__")
+except SystemExit as error:
+    if error.code not in (None, 0):
+        raise
+print("loaded:" + ",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+STARTUP_COMMANDS = (("main.py --help", ["--help"]), ("main.py bench --help", ["bench", "--help"]), ("main.py cache info", ["cache", "info"]))
+
+
+def _time_python(code, repeats):
+    # Best of ``repeats`` wall times of a fresh interpreter running ``code``, and its output
+    best, output = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if completed.returncode != 0:
+            # A crash is not a startup time
+            last_line = (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]
+            raise RuntimeError(last_line)
+        best = wall if best is None else min(best, wall)
+        output = completed.stdout
+    return best, output
+
+
+def measure_startup(repeats=5):
+    """Startup time of the CLI commands and of the imports they avoid; returns a list of rows.
+
+    A command that fails gets wall_s None and the error in "loaded".
+    """
+    rows = []
+    for label, argv in STARTUP_COMMANDS:
+        try:
+            wall, output = _time_python(_STARTUP_PROBE.format(script=MAIN_SCRIPT, argv=argv, modules=HEAVY_MODULES), repeats)
+        except RuntimeError as error:
+            rows.append({"command": label, "wall_s": None, "loaded": f"failed: {error}"})
+            continue
+        loaded = [line[len("loaded:"):] for line in output.splitlines() if line.startswith("loaded:")]
+        rows.append({"command": label, "wall_s": wall, "loaded": (loaded[-1] if loaded else "?") or "-"})
+    for module in ("numpy", "ROOT"):
+        try:
+            wall, _ = _time_python(f"import {module}", repeats)
+        except RuntimeError:
+            continue
+        rows.append({"command": f"import {module}", "wall_s": wall, "loaded": module})
+    return rows
+
+
+def format_startup_table(rows):
+    header = f"{'command':<24} {'wall [s]':>9}  heavy modules loaded"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        wall = "failed" if row["wall_s"] is None else f"{row['wall_s']:.3f}"
+        lines.append(f"{row['command']:<24} {wall:>9}  {row['loaded']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=200_000, help="entries per synthetic sample")
+    parser.add_argument("--samples", type=int, default=5, help="number of samples (up to 10)")
+    parser.add_argument("--extra-branches", type=int, default=100, help="filler branches per tree")
+    parser.add_argument("--formats", nargs="+", default=["root"], choices=["root", "parquet"])
+    parser.add_argument("--paths", nargs="+", default=list(PATHS), choices=PATHS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--directory", default=None, help="where to write the synthetic files (default: a temporary directory)")
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    parser.add_argument("--startup", action="store_true", help="time the startup of the command-line entry point instead")
+    parser.add_argument("--repeats", type=int, default=5, help="runs per startup measurement (the best is kept)")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        rows = measure_startup(args.repeats)
+        print(format_startup_table(rows))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=1)
+        return 0
+
+    rows = run(args.entries, args.formats, args.paths, args.samples, args.extra_branches, args.workers, args.chunk_size, args.directory)
+    print(format_table(rows))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Sample definitions from config.json."""
+
+import json
+import os
+
+
+def load_config(path="config.json"):
+    with open(path) as f:
+        config = json.load(f)
+    # Input paths in config.json are relative to the config file itself
+    config["_base_dir"] = os.path.dirname(os.path.abspath(path))
+    return config
+
+
+def _resolve(config, file_path):
+    base_dir = config.get("_base_dir", "")
+    return file_path if os.path.isabs(file_path) else os.path.normpath(os.path.join(base_dir, file_path))
+
+
+def sample_name(file_path):
+    # "../output_root/Data_EraE.root" -> "Data_EraE"
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def _group_of(config, name):
+    # "sample_groups": {"H#rightarrow#gamma#gamma": ["GluGluHToGG", "ttHToGG", ...]}
+    for group, members in config.get("sample_groups", {}).items():
+        if name in members:
+            return group
+    return name
+
+
+def samples_from_config(config):
+    """Flat list of sample dicts (name, label, file_path, kind, group)."""
+    samples = []
+    for file_path in config.get("data_file_paths", []):
+        samples.append({
+            "name": sample_name(file_path),
+            "label": "Data",
+            "file_path": _resolve(config, file_path),
+            "kind": "data",
+            "group": "data",
+        })
+    for entry in config.get("background_files", []):
+        name = entry.get("sample", sample_name(entry["file_path"]))
+        sample = {
+            "name": name,
+            "label": entry.get("name", name),
+            "file_path": _resolve(config, entry["file_path"]),
+            "kind": "mc",
+            "group": entry.get("group", _group_of(config, name)),
+        }
+        if "cross_section" in entry:
+            sample["cross_section"] = entry["cross_section"]
+        samples.append(sample)
+    return samples
@@ -0,0 +1,298 @@
+"""Cut flows from one pass, with every cut evaluated once into a bitmask.
+
+Each named cut sets one bit of a per-event mask. Events are accumulated per
+distinct mask value - counts, sums of weights and the requested histograms -
+so that afterwards the cut flow in any order, and histograms for any subset
+of the cuts, can be built without reading the files again: a subset S is
+the sum over all masks that have every bit of S set.
+
+MC is weighted with the config.json "weights" of the histograms. Data only
+counts events outside every blinding window of the plots, so that no table
+shows a yield inside the blinded region.
+"""
+
+import functools
+
+import numpy as np
+
+from . import analysis, config as config_module, engine, instrument, observables as obs, reader, result_cache, scheduler, selection
+from .histogram import Hist1D
+
+
+MAX_CUTS = 63
+
+
+def evaluate_mask(cuts, columns, memo=None):
+    """Packed uint64 mask with bit i set where cut i passes."""
+    memo = {} if memo is None else memo
+    n_entries = len(next(iter(columns.values()))) if columns else 0
+    mask = np.zeros(n_entries, dtype=np.uint64)
+    for bit, expression in enumerate(cuts.values()):
+        passed = np.broadcast_to(np.asarray(obs.evaluate(expression, columns, memo), dtype=bool), (n_entries,))
+        mask |= passed.astype(np.uint64) << np.uint64(bit)
+    return mask
+
+
+class CutFlow:
+    def __init__(self, cut_names, histograms=()):
+        if len(cut_names) > MAX_CUTS:
+            raise ValueError(f"At most {MAX_CUTS} cuts fit in the bitmask")
+        self.cut_names = list(cut_names)
+        self.histograms = [dict(h) for h in histograms]
+        self._templates = {engine.histogram_name(h): Hist1D.from_spec(h) for h in self.histograms}
+        # mask value -> [n, sumw, sumw2]
+        self.counts = {}
+        # histogram name -> {mask value: Hist1D}
+        self.hists = {name: {} for name in self._templates}
+
+    def bits(self, cut_names):
+        result = 0
+        for name in cut_names:
+            result |= 1 << self.cut_names.index(name)
+        return result
+
+    def fill(self, mask, weight, values=None, keep=None):
+        """Add one chunk: ``mask`` per event, ``weight`` per event and histogram values.
+
+        ``values`` maps histogram name -> per-event values and ``keep`` maps
+        histogram name -> boolean array of events allowed into that histogram
+        (e.g. outside the blinding window for data).
+        """
+        unique, inverse = np.unique(mask, return_inverse=True)
+        n = np.bincount(inverse, minlength=len(unique))
+        sumw = np.bincount(inverse, weights=weight, minlength=len(unique))
+        sumw2 = np.bincount(inverse, weights=weight * weight, minlength=len(unique))
+        for i, value in enumerate(unique.tolist()):
+            entry = self.counts.setdefault(value, [0, 0.0, 0.0])
+            entry[0] += int(n[i])
+            entry[1] += float(sumw[i])
+            entry[2] += float(sumw2[i])
+
+        for name, template in self._templates.items():
+            if values is None or name not in values:
+                continue
+            selected = keep[name] if keep and name in keep else slice(None)
+            bin_index = template.bin_indices(values[name][selected])
+            slots = len(template.sumw)
+            # One bincount for all mask values: mask block * slots + bin
+            flat = inverse[selected] * slots + bin_index
+            w = weight[selected]
+            size = len(unique) * slots
+            block_w = np.bincount(flat, weights=w, minlength=size).reshape(len(unique), slots)
+            block_w2 = np.bincount(flat, weights=w * w, minlength=size).reshape(len(unique), slots)
+            for i, value in enumerate(unique.tolist()):
+                hist = self.hists[name].get(value)
+                if hist is None:
+                    hist = self.hists[name][value] = template.copy()
+                hist.sumw += block_w[i]
+                hist.sumw2 += block_w2[i]
+        return self
+
+    def passing(self, cut_names):
+        """(events, sum of weights, sum of squared weights) passing all ``cut_names``."""
+        required = self.bits(cut_names)
+        n, sumw, sumw2 = 0, 0.0, 0.0
+        for value, (count, w, w2) in self.counts.items():
+            if value & required == required:
+                n += count
+                sumw += w
+                sumw2 += w2
+        return n, sumw, sumw2
+
+    def table(self, order=None, weighted=True):
+        """Sequential cut flow as a list of rows, one per cut in ``order``.
+
+        The efficiencies are ratios of weighted yields, or of raw event
+        counts with weighted=False.
+        """
+        order = list(order or self.cut_names)
+        key = "weighted" if weighted else "events"
+        total_n, total_w, _ = self.passing([])
+        rows = [{"cut": "all", "events": total_n, "weighted": total_w, "efficiency": 1.0, "relative": 1.0}]
+        applied = []
+        for name in order:
+            applied.append(name)
+            n, w, _ = self.passing(applied)
+            row = {"cut": name, "events": n, "weighted": w}
+            row["efficiency"] = row[key] / rows[0][key] if rows[0][key] else 0.0
+            row["relative"] = row[key] / rows[-1][key] if rows[-1][key] else 0.0
+            rows.append(row)
+        return rows
+
+    def histogram(self, name, cut_names=()):
+        """Hist1D of histogram ``name`` for events passing all ``cut_names``."""
+        required = self.bits(cut_names)
+        result = self._templates[name].copy()
+        for value, hist in self.hists[name].items():
+            if value & required == required:
+                result += hist
+        return result
+
+    def _check_compatible(self, other):
+        if not isinstance(other, CutFlow):
+            return NotImplemented
+        if self.cut_names != other.cut_names or set(self.hists) != set(other.hists):
+            raise ValueError("Cannot add cut flows with different cuts or histograms")
+        return True
+
+    def __iadd__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        for value, (n, w, w2) in other.counts.items():
+            entry = self.counts.setdefault(value, [0, 0.0, 0.0])
+            entry[0] += n
+            entry[1] += w
+            entry[2] += w2
+        for name, by_mask in other.hists.items():
+            for value, hist in by_mask.items():
+                mine = self.hists[name].get(value)
+                self.hists[name][value] = hist.copy() if mine is None else mine + hist
+        return self
+
+    def __add__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        result = self.copy()
+        result += other
+        return result
+
+    def copy(self):
+        result = CutFlow(self.cut_names, self.histograms)
+        result.counts = {value: list(entry) for value, entry in self.counts.items()}
+        result.hists = {name: {value: hist.copy() for value, hist in by_mask.items()} for name, by_mask in self.hists.items()}
+        return result
+
+    def scale(self, factor):
+        for entry in self.counts.values():
+            entry[1] *= factor
+            entry[2] *= factor * factor
+        for by_mask in self.hists.values():
+            for hist in by_mask.values():
+                hist.scale(factor)
+        return self
+
+
+def fill_file(file_path, tree_name, cuts, histograms=(), chunk_size=reader.DEFAULT_CHUNK_SIZE, is_data=False, weights=("genweight",), stats=None, entry_start=None, entry_stop=None, blind=()):
+    """Cut flow of one file (or its entries in [entry_start, entry_stop)); ``cuts`` is an ordered {name: expression}.
+
+    ``blind`` are cuts (see blinding_cuts) that events must pass to be
+    counted at all; they are only applied to data.
+    """
+    flow = CutFlow(list(cuts), histograms)
+    blind = list(blind) if is_data else []
+    names = list(cuts.values()) + list(weights) + [h["observable"] for h in histograms] + blind
+    branches = obs.branches_for(names)
+    for _, columns in reader.iter_chunks(file_path, tree_name, branches, chunk_size, entry_start, entry_stop, defaults=engine.WEIGHT_DEFAULTS, stats=stats):
+        memo = {}
+        with instrument.stage("cutflow", events=len(next(iter(columns.values()), ()))):
+            if blind:
+                unblinded = np.ones(len(next(iter(columns.values()), ())), dtype=bool)
+                for cut in blind:
+                    unblinded &= np.asarray(obs.evaluate(cut, columns, memo), dtype=bool)
+                columns = {name: values[unblinded] for name, values in columns.items()}
+                memo = {}
+            mask = evaluate_mask(cuts, columns, memo)
+            weight = np.ones(len(mask), dtype=np.float64)
+            for name in weights:
+                weight = weight * obs.evaluate(name, columns, memo)
+            values, keep = {}, {}
+            for h in histograms:
+                name = engine.histogram_name(h)
+                values[name] = np.asarray(obs.evaluate(h["observable"], columns, memo))
+                if is_data and h.get("blind"):
+                    keep[name] = engine.blind_mask(values[name], h["blind"])
+            flow.fill(mask, weight, values, keep)
+    return flow
+
+
+def sample_weights(sample, weights=None):
+    # The config.json "weights" of the kind of sample, with the same defaults as analysis.histogram_requests
+    weights = weights or {}
+    if sample["kind"] == "data":
+        return tuple(weights.get("data", ()))
+    return tuple(weights.get("mc", engine.DEFAULT_WEIGHTS))
+
+
+def blinding_cuts(histograms):
+    """One cut per distinct blinding window of ``histograms``, as engine.histogram_cuts applies them to data."""
+    cuts = []
+    for h in histograms:
+        for observable, window in engine.blinding_windows(h):
+            cut = selection.blinding_cut(observable, window)
+            if cut not in cuts:
+                cuts.append(cut)
+    return cuts
+
+
+def fill_sample(sample, tree_name, cuts, histograms=(), chunk_size=None, use_cache=True, weights=None, blind=()):
+    """Cut flow of one sample; ``weights`` is the config.json "weights" section."""
+    is_data = sample["kind"] == "data"
+    weights = sample_weights(sample, weights)
+    blind = list(blind) if is_data else []
+
+    def compute():
+        stats = {} if instrument.enabled() else None
+        flow = fill_file(sample["file_path"], tree_name, cuts, histograms, chunk_size or reader.DEFAULT_CHUNK_SIZE, is_data, weights, stats, blind=blind)
+        instrument.add_io(stats)
+        return flow
+
+    with instrument.sample(sample["name"]):
+        if not use_cache:
+            return compute()
+        extra = {"cutflow": cuts, "is_data": is_data, "weights": weights, "blind": blind}
+        key = result_cache.cache_key([sample["file_path"]], tree_name, histograms, extra=extra)
+        return result_cache.cached(key, compute)
+
+
+def config_cuts(config):
+    # "cutflow": {"name": "expression", ...} in config.json, in order; falls back to the selections
+    return dict(config.get("cutflow") or config.get("selections", {}))
+
+
+def run(config, histograms=None, n_workers=None, chunk_size=None, use_cache=True):
+    """Cut flow of every sample in config.json; returns {sample name: CutFlow}.
+
+    MC yields are weighted and normalized to cross section and luminosity
+    like the plots; data is blinded with the windows of every plot.
+    """
+    if isinstance(config, str):
+        config = config_module.load_config(config)
+    cuts = config_cuts(config)
+    requests = analysis.histogram_requests(config)
+    if histograms is None:
+        # Every plot without its selection; the subsets come from the cut flow
+        histograms = []
+        for request in requests:
+            if request.get("selection") or "variations" in request or "observables" in request:
+                continue
+            histograms.append(request)
+    blind = blinding_cuts(list(requests) + list(histograms))
+    samples = config_module.samples_from_config(config)
+    task = functools.partial(
+        fill_sample, tree_name=config["tree_name"], cuts=cuts, histograms=histograms, chunk_size=chunk_size, use_cache=use_cache,
+        weights=config.get("weights"), blind=blind,
+    )
+    flows = scheduler.run_samples(samples, task, n_workers)
+    scale = analysis.normalization(config)
+    return {sample["name"]: flows[sample["name"]].copy().scale(scale(sample)) for sample in samples}
+
+
+def format_tables(flows, weighted=True):
+    """Side-by-side yields and cumulative efficiencies of every sample, one row per cut.
+
+    Both are weighted, or raw event counts with weighted=False.
+    """
+    names = list(flows)
+    if not names:
+        return ""
+    tables = {name: flow.table(weighted=weighted) for name, flow in flows.items()}
+    key = "weighted" if weighted else "events"
+    header = f"{'cut':<20}" + "".join(f"{name:>22}" for name in names)
+    lines = [header, "-" * len(header)]
+    for index, row in enumerate(tables[names[0]]):
+        cells = []
+        for name in names:
+            cell = tables[name][index]
+            cells.append(f"{cell[key]:>12.4g} ({100 * cell['efficiency']:5.1f}%)")
+        lines.append(f"{row['cut']:<20}" + "".join(f"{cell:>22}" for cell in cells))
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+"""Sidecar store of derived columns (m_bb, m_gg, eta_gg, dR, reduced M_X, ...).
+
+Once enabled, the chosen observables behave like native branches: readers
+ask the store for them and the store serves them from a parquet file next to
+the input in the cache directory, aligned entry by entry with the source
+tree. A column is computed over the whole file the first time it is asked
+for; later runs only read the stored values. Each sidecar is keyed by the
+source fingerprint, so a changed input gets new sidecars.
+
+Turn it on with ``"derived": true`` (the default DERIVED_COLUMNS) or
+``"derived": ["m_bb", "dR_bb"]`` in config.json, or ``main.py process
+--derived``. The names travel with every task (see scheduler.fill_sample and
+shards.run_shard) and each worker enables the store only while it runs the
+task with ``using``, so this works with any multiprocessing start method.
+In a single process, ``enable``/``disable`` switch it on and off for good.
+Values are stored in double precision so that histograms filled from the
+store are identical to the ones computed on the fly.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import engine, instrument, observables as obs, paths, reader
+
+
+DERIVED_COLUMNS = ("m_bb", "m_gg", "eta_gg", "pt_gg", "m_HH", "dR_gg", "dR_bb", "m_ggbb", "MX_reduced")
+
+STORE_VERSION = 2
+
+
+def enable(names=DERIVED_COLUMNS):
+    for name in names:
+        if name not in obs.OBSERVABLES:
+            raise KeyError(f"Only registered observables can be stored, not {name}")
+    obs.MATERIALIZED.update(names)
+    if wrap_source not in reader.SOURCE_WRAPPERS:
+        reader.SOURCE_WRAPPERS.append(wrap_source)
+
+
+def disable():
+    obs.MATERIALIZED.clear()
+    if wrap_source in reader.SOURCE_WRAPPERS:
+        reader.SOURCE_WRAPPERS.remove(wrap_source)
+
+
+@contextlib.contextmanager
+def using(names):
+    """Serve ``names`` from the store inside the block, then restore the previous state; no names do nothing."""
+    if not names:
+        yield
+        return
+    previous, wrapped = set(obs.MATERIALIZED), wrap_source in reader.SOURCE_WRAPPERS
+    enable(names)
+    try:
+        yield
+    finally:
+        obs.MATERIALIZED.clear()
+        obs.MATERIALIZED.update(previous)
+        if not wrapped:
+            reader.SOURCE_WRAPPERS.remove(wrap_source)
+
+
+def config_columns(config):
+    # "derived": true for DERIVED_COLUMNS, or a list of observables
+    value = config.get("derived")
+    if value is True:
+        return list(DERIVED_COLUMNS)
+    return list(value or [])
+
+
+def sidecar_dir(file_path, tree_name):
+    payload = {"version": STORE_VERSION, "file": paths.file_fingerprint(file_path), "tree": tree_name}
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]
+    return paths.cache_dir("derived", key)
+
+
+def sidecar_path(file_path, tree_name, name):
+    return os.path.join(sidecar_dir(file_path, tree_name), f"{name}.parquet")
+
+
+def materialize(file_path, tree_name, name, chunk_size=reader.DEFAULT_CHUNK_SIZE):
+    """Compute column ``name`` for every entry of the file and write its sidecar."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = sidecar_path(file_path, tree_name, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    branches = obs.OBSERVABLES[name][0]
+    source = reader.open_base_source(file_path, tree_name)
+    writer = None
+    try:
+        with instrument.stage("derive"):
+            n_entries = source.num_entries
+            for start in range(0, max(n_entries, 1), chunk_size):
+                stop = min(start + chunk_size, n_entries)
+                columns = reader.read_range(source, branches, start, stop, engine.WEIGHT_DEFAULTS)
+                values = np.asarray(obs.compute(name, columns), dtype=np.float64) if stop > start else np.zeros(0)
+                table = pa.table({name: values})
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+    finally:
+        source.close()
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+class DerivedSource:
+    """A source that also serves stored derived columns next to its own branches."""
+
+    def __init__(self, base, file_path, tree_name):
+        self.base = base
+        self.file_path = file_path
+        self.tree_name = tree_name
+        self.num_entries = base.num_entries
+        self.n_branches = base.n_branches
+        self._sidecars = {}
+
+    def __contains__(self, branch):
+        return branch in obs.MATERIALIZED or branch in self.base
+
+    def branch_names(self):
+        return self.base.branch_names() + sorted(obs.MATERIALIZED)
+
+    def _sidecar(self, name):
+        if name not in self._sidecars:
+            path = sidecar_path(self.file_path, self.tree_name, name)
+            if not os.path.exists(path):
+                materialize(self.file_path, self.tree_name, name)
+            self._sidecars[name] = reader.ParquetSource(path)
+        return self._sidecars[name]
+
+    def read(self, branches, start, stop, stats=None):
+        derived = [b for b in branches if b in obs.MATERIALIZED and b not in self.base]
+        columns = self.base.read([b for b in branches if b not in derived], start, stop, stats)
+        for name in derived:
+            columns[name] = self._sidecar(name).read([name], start, stop, stats)[name]
+        return columns
+
+    def close(self):
+        for sidecar in self._sidecars.values():
+            sidecar.close()
+        self.base.close()
+
+
+def wrap_source(source, file_path, tree_name):
+    return DerivedSource(source, file_path, tree_name)
@@ -0,0 +1,231 @@
+"""Single-pass reader: every requested quantity from one read of each tree.
+
+The plot scripts used to open a data file once for the dijet mass and once
+more for the HHbbggCandidate loop, and each background file once for the
+masses and once more to sum genweight. ``read_once`` takes the full list of
+observables, weights and sums and gets all of them out of a single read.
+"""
+
+import numpy as np
+
+from . import instrument, observables as obs, reader, selection
+from .events import EventBuffer
+from .histogram import Hist1D, HistVariations, SparseHist
+
+
+# Branches that are missing in data and default to 1.0, like
+# getattr(event, "genweight", 1.0) in the old loops
+WEIGHT_DEFAULTS = {"genweight": 1.0, "weight": 1.0, "weight_central": 1.0}
+
+
+def read_once(file_path, tree_name, observables, weights=("genweight",), sums=("genweight",), stats=None):
+    """Return observables, weights and sums of weights from one read of ``tree_name``.
+
+    The result is a dict with
+      "n_entries":   number of entries read
+      "observables": name -> array (one value per entry)
+      "weights":     name -> array
+      "sums":        name -> sum of that branch over all entries
+    """
+    branches = obs.required_branches(observables, list(weights) + list(sums))
+    columns = reader.read_columns(file_path, tree_name, branches, defaults=WEIGHT_DEFAULTS, stats=stats)
+    return summarize(columns, observables, weights, sums)
+
+
+def iter_results(file_path, tree_name, observables, weights=("genweight",), sums=(), chunk_size=reader.DEFAULT_CHUNK_SIZE, stats=None):
+    """Like ``read_once`` but yields one result per chunk of ``chunk_size`` entries."""
+    branches = obs.required_branches(observables, list(weights) + list(sums))
+    for _, columns in reader.iter_chunks(file_path, tree_name, branches, chunk_size, defaults=WEIGHT_DEFAULTS, stats=stats):
+        yield summarize(columns, observables, weights, sums)
+
+
+def collect(file_path, tree_name, observables, weights=("genweight",), chunk_size=reader.DEFAULT_CHUNK_SIZE, stats=None):
+    """Stream ``observables`` and ``weights`` of every entry into one EventBuffer.
+
+    Peak memory is one chunk of branches plus 4 bytes per observable and 8
+    per weight for each event; ``buffer.result(weights)`` feeds fill/fill_th1.
+    """
+    buffer = EventBuffer.for_observables(observables, weights)
+    for result in iter_results(file_path, tree_name, observables, weights, chunk_size=chunk_size, stats=stats):
+        buffer.extend({**result["observables"], **result["weights"]})
+    return buffer.trim()
+
+
+def summarize(columns, observables, weights=("genweight",), sums=("genweight",)):
+    n_entries = len(next(iter(columns.values()))) if columns else 0
+    return {
+        "n_entries": n_entries,
+        "observables": {name: obs.evaluate(name, columns) for name in observables},
+        "weights": {name: np.asarray(columns[name], dtype=np.float64) for name in weights},
+        "sums": {name: float(np.sum(columns[name], dtype=np.float64)) for name in sums},
+    }
+
+
+def weight_product(result, names):
+    weight = np.ones(result["n_entries"], dtype=np.float64)
+    for name in names:
+        weight = weight * result["weights"][name]
+    return weight
+
+
+def blind_mask(values, window):
+    # True for entries that are kept, i.e. outside [low, high]
+    if window is None:
+        return np.ones(len(values), dtype=bool)
+    low, high = window
+    return ~((values >= low) & (values <= high))
+
+
+def fill(result, observable, hist, weights=("genweight",), blind=None, scale=1.0, is_data=False):
+    """Fill ``hist`` (a Hist1D) with ``observable`` from one read/chunk.
+
+    ``blind`` is an optional (low, high) window removed before filling for
+    data, with the same inclusive edges as the blinding in the plot scripts.
+    """
+    values = result["observables"][observable]
+    weight = weight_product(result, weights) * scale
+    keep = blind_mask(values, blind if is_data else None)
+    return hist.fill(values[keep], weight[keep])
+
+
+def fill_th1(hist, result, observable, weights=("genweight",), blind=None, scale=1.0, is_data=False):
+    # Bulk fill of an existing ROOT histogram with FillN instead of one Fill per event.
+    # The blinding window is only ever applied to data.
+    values = np.ascontiguousarray(result["observables"][observable], dtype=np.float64)
+    weight = weight_product(result, weights) * scale
+    keep = blind_mask(values, blind if is_data else None)
+    values = np.ascontiguousarray(values[keep])
+    weight = np.ascontiguousarray(weight[keep])
+    if len(values):
+        hist.FillN(len(values), values, weight)
+    return hist
+
+
+DEFAULT_WEIGHTS = ("genweight",)
+
+
+def histogram_observables(histogram):
+    # One observable, or several for a sparse N-dimensional request ("observables")
+    return list(histogram["observables"]) if "observables" in histogram else [histogram["observable"]]
+
+
+def histogram_name(histogram):
+    return histogram.get("name", "_vs_".join(histogram_observables(histogram)))
+
+
+def blinding_windows(histogram):
+    # [(observable, (low, high))]; N-dimensional requests give {observable: window}
+    blind = histogram.get("blind")
+    if not blind:
+        return []
+    if "observables" in histogram:
+        return [(observable, tuple(window)) for observable, window in blind.items()]
+    return [(histogram["observable"], tuple(blind))]
+
+
+def histogram_branches(histograms, is_data=None):
+    """Branches needed to fill every histogram request in ``histograms``.
+
+    With is_data=True/False only the weights used for data/MC are included
+    (data trees have no weight variation branches); None includes both.
+    """
+    names = []
+    for h in histograms:
+        names.extend(histogram_observables(h))
+        if h.get("selection"):
+            names.append(h["selection"])
+        if is_data:
+            names.extend(h.get("data_weights", h.get("weights", DEFAULT_WEIGHTS)))
+            continue
+        names.extend(h.get("weights", DEFAULT_WEIGHTS))
+        names.extend(h.get("variations", {}).values())
+        if is_data is None:
+            names.extend(h.get("data_weights", ()))
+    return obs.branches_for(names)
+
+
+def new_histogram(histogram):
+    if "observables" in histogram:
+        if "variations" in histogram:
+            raise ValueError(f"Weight variations are not supported for the N-dimensional histogram {histogram_name(histogram)!r}")
+        return SparseHist.from_spec(histogram)
+    return HistVariations.from_spec(histogram) if "variations" in histogram else Hist1D.from_spec(histogram)
+
+
+def fill_chunk(columns, histograms, filled, is_data=False, memo=None):
+    """Fill the Hist1Ds in ``filled`` from one chunk of branch arrays.
+
+    Observables, selections and weights shared between histograms are
+    evaluated once per chunk through ``memo``.
+    """
+    memo = {} if memo is None else memo
+    for h in histograms:
+        with instrument.stage("compute", events=len(next(iter(columns.values()), ()))):
+            all_values = [np.asarray(obs.evaluate(observable, columns, memo)) for observable in histogram_observables(h)]
+            values = all_values[0]
+            weight = np.ones(len(values), dtype=np.float64)
+            weights = h.get("data_weights", h.get("weights", DEFAULT_WEIGHTS)) if is_data else h.get("weights", DEFAULT_WEIGHTS)
+            if "variations" in h and not is_data:
+                # (variations x events) matrix; data keeps its own weight in every row
+                weight = np.array([np.broadcast_to(obs.evaluate(expression, columns, memo), values.shape) for expression in h["variations"].values()], dtype=np.float64)
+                weights = ()
+            for name in weights:
+                weight = weight * obs.evaluate(name, columns, memo)
+            keep = np.ones(len(values), dtype=bool)
+            if h.get("selection"):
+                keep &= np.asarray(obs.evaluate(h["selection"], columns, memo), dtype=bool)
+            if is_data:
+                for observable, window in blinding_windows(h):
+                    keep &= blind_mask(np.asarray(obs.evaluate(observable, columns, memo)), window)
+        with instrument.stage("fill", events=int(keep.sum())):
+            if "observables" in h:
+                filled[histogram_name(h)].fill([axis_values[keep] for axis_values in all_values], weight[keep])
+            else:
+                filled[histogram_name(h)].fill(values[keep], weight[..., keep])
+    return filled
+
+
+def histogram_cuts(histogram, is_data=False):
+    """Cuts of one request: its selection plus, for data only, its blinding window."""
+    cuts = [histogram["selection"]] if histogram.get("selection") else []
+    if is_data:
+        cuts.extend(selection.blinding_cut(observable, window) for observable, window in blinding_windows(histogram))
+    return cuts
+
+
+def common_cuts(histograms, is_data=False, cuts=()):
+    # Cuts applied by every request can be pushed down into the reader
+    per_histogram = [set(selection.order_cuts(histogram_cuts(h, is_data))) for h in histograms]
+    shared = set.intersection(*per_histogram) if per_histogram else set()
+    return list(cuts) + sorted(shared)
+
+
+def fill_streaming(file_path, tree_name, histograms, chunk_size=reader.DEFAULT_CHUNK_SIZE, is_data=False, stats=None, cuts=(), entry_start=None, entry_stop=None, sums=None):
+    """Fill all ``histograms`` in one fused pass over the tree, chunk by chunk.
+
+    Each request is a dict with "observable" (a registered observable, branch
+    or expression), "bins"/"range" or "edges", and optionally "name",
+    "selection" (expression), "weights" (list of branches/expressions,
+    default genweight), "data_weights" (used instead of "weights" for data),
+    "variations" ({name: weight expression}, filled all at once into a
+    HistVariations; see systematics.py) and "blind" ((low, high), applied
+    only when ``is_data`` is set). A request with "observables" (a list)
+    instead of "observable" fills a SparseHist, with per-axis "bins"/"range"
+    or "edges" and "blind" as {observable: (low, high)}. The
+    union of the branches of all requests is read once.
+
+    ``cuts`` are applied to every request. They, and any selection or
+    blinding window shared by all requests, are evaluated first on their own
+    branches so that the other branches are only read for surviving entries.
+    Only entries in [entry_start, entry_stop) are read (see shards.py).
+    ``sums`` (a sumw_index.new_entry()) collects the sums of weights of every
+    entry read, so the normalization needs no separate scan of the file.
+    Returns {name: Hist1D or HistVariations}.
+    """
+    filled = {histogram_name(h): new_histogram(h) for h in histograms}
+    branches = histogram_branches(histograms, is_data)
+    pushed = common_cuts(histograms, is_data, cuts)
+    for _, _, columns, memo in selection.iter_selected(file_path, tree_name, pushed, branches, chunk_size, entry_start, entry_stop, defaults=WEIGHT_DEFAULTS, stats=stats, sums=sums):
+        fill_chunk(columns, histograms, filled, is_data, memo)
+        del columns, memo
+    return filled
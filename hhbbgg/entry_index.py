@@ -0,0 +1,69 @@
+"""Persisted lists of the entries passing a selection, per input file.
+
+Most iterations reuse the same preselection. The first pass over a file
+stores the entry numbers that passed it, delta-encoded and compressed
+(a few bits per passing entry), keyed by the file fingerprint (path, size,
+mtime), the tree name and the cuts. Later passes with the same selection
+read only those entries and skip evaluating the cuts. Changing the file or
+any cut gives a different key, so stale indices are never used.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import paths
+
+
+INDEX_VERSION = 2
+
+
+def index_key(file_path, tree_name, cuts):
+    payload = {
+        "version": INDEX_VERSION,
+        "file": paths.file_fingerprint(file_path),
+        "tree": tree_name,
+        "cuts": sorted(cuts),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _index_path(key):
+    return os.path.join(paths.cache_dir("entry_index"), f"{key}.npz")
+
+
+def encode(entries):
+    # Sorted entry numbers -> gaps between them, small enough for uint32
+    entries = np.asarray(entries, dtype=np.int64)
+    return np.diff(entries, prepend=0).astype(np.uint32)
+
+
+def decode(deltas):
+    return np.cumsum(np.asarray(deltas, dtype=np.int64))
+
+
+def load(file_path, tree_name, cuts):
+    """Entry numbers passing ``cuts`` in ``file_path``, or None if not indexed yet."""
+    path = _index_path(index_key(file_path, tree_name, cuts))
+    try:
+        with np.load(path) as data:
+            return decode(data["deltas"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save(file_path, tree_name, cuts, entries):
+    path = _index_path(index_key(file_path, tree_name, cuts))
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_path, deltas=encode(entries))
+    os.replace(tmp_path, path)
+    return path
+
+
+def clear():
+    directory = paths.cache_dir("entry_index")
+    for name in os.listdir(directory):
+        if name.endswith(".npz"):
+            os.remove(os.path.join(directory, name))
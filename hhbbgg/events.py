@@ -0,0 +1,114 @@
+"""Compact per-event storage for values that outlive a chunk.
+
+The old scripts kept ``(mass, genweight)`` tuples in a Python list - two
+boxed floats and a tuple, over 100 bytes per event - and looped over them
+again to fill. ``EventBuffer`` keeps one typed NumPy array per field
+instead (structure of arrays): float32 for kinematics and float64 for
+weights, i.e. 12 bytes per event for a mass and its weight. It grows by
+doubling as chunks are appended, and slicing it returns views, not copies.
+
+Float32 holds about 7 significant digits, well below the resolution of any
+mass or pT, but a value computed right at a bin edge (e.g. exactly at the
+blinding window) can round onto the edge.
+"""
+
+import numpy as np
+
+
+KINEMATICS_DTYPE = np.float32
+WEIGHT_DTYPE = np.float64
+
+
+class EventBuffer:
+    def __init__(self, fields, capacity=0):
+        # ``fields`` is {name: dtype}, in the order they should be listed
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in fields.items()}
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self._size = 0
+
+    @classmethod
+    def for_observables(cls, observables, weights=("genweight",), capacity=0):
+        fields = {name: KINEMATICS_DTYPE for name in observables}
+        fields.update((name, WEIGHT_DTYPE) for name in weights)
+        return cls(fields, capacity)
+
+    @classmethod
+    def _view(cls, dtypes, arrays):
+        buffer = cls.__new__(cls)
+        buffer.dtypes = dict(dtypes)
+        buffer._arrays = arrays
+        buffer._size = len(next(iter(arrays.values()))) if arrays else 0
+        return buffer
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(next(iter(self._arrays.values()))) if self._arrays else 0
+
+    @property
+    def fields(self):
+        return list(self.dtypes)
+
+    @property
+    def nbytes(self):
+        # Bytes used by the stored events (the spare capacity is not counted)
+        return sum(dtype.itemsize for dtype in self.dtypes.values()) * self._size
+
+    def __contains__(self, name):
+        return name in self.dtypes
+
+    def reserve(self, n_events):
+        """Make room for at least ``n_events`` without reallocating."""
+        if n_events <= self.capacity:
+            return self
+        capacity = max(n_events, 2 * self.capacity, 1024)
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[: self._size] = array[: self._size]
+            self._arrays[name] = grown
+        return self
+
+    def extend(self, columns):
+        """Append a chunk given as {field: array}; every field must be present."""
+        missing = [name for name in self.dtypes if name not in columns]
+        if missing:
+            raise KeyError(f"Missing fields {missing} when extending an EventBuffer with {self.fields}")
+        n_events = max((len(columns[name]) for name in self.dtypes if np.ndim(columns[name])), default=0)
+        self.reserve(self._size + n_events)
+        stop = self._size + n_events
+        for name, array in self._arrays.items():
+            # Scalars (e.g. a constant weight) are broadcast to the chunk length
+            array[self._size : stop] = columns[name]
+        self._size = stop
+        return self
+
+    def trim(self):
+        """Release the spare capacity."""
+        if self.capacity != self._size:
+            self._arrays = {name: array[: self._size].copy() for name, array in self._arrays.items()}
+        return self
+
+    def columns(self):
+        """{field: array} views of the stored events."""
+        return {name: array[: self._size] for name, array in self._arrays.items()}
+
+    def __getitem__(self, key):
+        # buffer["m_bb"] is the field, buffer[a:b] a view, buffer[mask] a copy
+        if isinstance(key, str):
+            return self._arrays[key][: self._size]
+        return self._view(self.dtypes, {name: array[key] for name, array in self.columns().items()})
+
+    def result(self, weights=("genweight",)):
+        """The buffer as a read_once-style result, for engine.fill and engine.fill_th1."""
+        columns = self.columns()
+        return {
+            "n_entries": self._size,
+            "observables": {name: array for name, array in columns.items() if name not in weights},
+            "weights": {name: columns[name] for name in weights},
+            "sums": {},
+        }
+
+    def __repr__(self):
+        return f"EventBuffer({self._size} events, fields={self.fields})"
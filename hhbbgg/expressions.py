@@ -0,0 +1,140 @@
+"""Small, safe expression language for observables and selections in config.json.
+
+Expressions are Python syntax restricted to names, numbers, arithmetic,
+comparisons, ``&``/``|``/``~`` (or ``and``/``or``/``not``) and a few NumPy
+functions, e.g. ``"lead_pt / m_gg"`` or
+``"lead_mvaID_WP90 & sublead_mvaID_WP90 & (m_gg > 100)"``. Names are
+resolved by the caller, so they can be branches or registered observables.
+"""
+
+import ast
+import functools
+import operator
+
+import numpy as np
+
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "log": np.log,
+    "exp": np.exp,
+    "cos": np.cos,
+    "sin": np.sin,
+    "cosh": np.cosh,
+    "sinh": np.sinh,
+    "arctan2": np.arctan2,
+    "hypot": np.hypot,
+    "minimum": np.minimum,
+    "maximum": np.maximum,
+    "where": np.where,
+}
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.BitAnd: np.logical_and,
+    ast.BitOr: np.logical_or,
+    ast.BitXor: np.logical_xor,
+}
+
+_UNARY = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Invert: np.logical_not,
+    ast.Not: np.logical_not,
+}
+
+_COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def parse(text):
+    """Parse and validate ``text``; returns the AST body."""
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as err:
+        raise ExpressionError(f"Invalid expression {text!r}: {err.msg}") from None
+    _validate(tree.body, text)
+    return tree.body
+
+
+def _validate(node, text):
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        _validate(node.left, text)
+        _validate(node.right, text)
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        _validate(node.operand, text)
+    elif isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _validate(value, text)
+    elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        for value in [node.left] + node.comparators:
+            _validate(value, text)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+        for arg in node.args:
+            _validate(arg, text)
+    elif isinstance(node, ast.Name):
+        pass
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+        pass
+    else:
+        raise ExpressionError(f"Unsupported syntax {ast.dump(node)[:40]}... in {text!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def names(text):
+    """Tuple of the variable names used in ``text``, in order of appearance."""
+    found = []
+    for node in ast.walk(parse(text)):
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in found:
+            found.append(node.id)
+    return tuple(found)
+
+
+def is_name(text):
+    return text.isidentifier()
+
+
+def evaluate(text, resolve):
+    """Evaluate ``text`` with ``resolve(name)`` returning the array for each name."""
+    return _evaluate(parse(text), resolve)
+
+
+def _evaluate(node, resolve):
+    if isinstance(node, ast.BinOp):
+        return _BINARY[type(node.op)](_evaluate(node.left, resolve), _evaluate(node.right, resolve))
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY[type(node.op)](_evaluate(node.operand, resolve))
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return functools.reduce(combine, (_evaluate(value, resolve) for value in node.values))
+    if isinstance(node, ast.Compare):
+        result = None
+        left = _evaluate(node.left, resolve)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, resolve)
+            part = _COMPARE[type(op)](left, right)
+            result = part if result is None else np.logical_and(result, part)
+            left = right
+        return result
+    if isinstance(node, ast.Call):
+        return FUNCTIONS[node.func.id](*(_evaluate(arg, resolve) for arg in node.args))
+    if isinstance(node, ast.Name):
+        return resolve(node.id)
+    return node.value
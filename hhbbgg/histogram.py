@@ -0,0 +1,394 @@
+"""NumPy-backed weighted histograms that can be merged across chunks and workers.
+
+Bins follow the ROOT convention: index 0 is the underflow, 1..n are the
+regular bins (lower edge included, upper edge excluded) and n+1 is the
+overflow. ``to_th1``/``from_th1`` convert to and from TH1F/TH1D so that the
+stacking and ratio code in the plot scripts keeps working. ``SparseHist``
+uses the same convention on every axis of an N-dimensional histogram.
+"""
+
+import numpy as np
+
+
+class Hist1D:
+    def __init__(self, bins, hist_range=None, edges=None):
+        """Either ``Hist1D(20, (80, 180))`` or ``Hist1D(edges=[...])`` for variable bins."""
+        if edges is None:
+            if hist_range is None:
+                raise ValueError("Hist1D needs either a range or explicit edges")
+            edges = np.linspace(hist_range[0], hist_range[1], int(bins) + 1)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        if self.edges.ndim != 1 or len(self.edges) < 2 or np.any(np.diff(self.edges) <= 0):
+            raise ValueError("Histogram edges must be increasing")
+        # Under- and overflow included
+        self.sumw = np.zeros(len(self.edges) + 1)
+        self.sumw2 = np.zeros(len(self.edges) + 1)
+
+    @classmethod
+    def from_spec(cls, spec):
+        # From a histogram request dict with "bins"/"range" or "edges"
+        if "edges" in spec:
+            return cls(None, edges=spec["edges"])
+        return cls(spec["bins"], spec["range"])
+
+    @property
+    def n_bins(self):
+        return len(self.edges) - 1
+
+    def bin_indices(self, values):
+        return np.searchsorted(self.edges, np.asarray(values, dtype=np.float64), side="right")
+
+    def fill(self, values, weights=None):
+        """Fill all ``values`` at once with optional per-value ``weights``."""
+        index = self.bin_indices(values)
+        size = len(self.sumw)
+        if weights is None:
+            counts = np.bincount(index, minlength=size).astype(np.float64)
+            self.sumw += counts
+            self.sumw2 += counts
+        else:
+            weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), index.shape)
+            self.sumw += np.bincount(index, weights=weights, minlength=size)
+            self.sumw2 += np.bincount(index, weights=weights * weights, minlength=size)
+        return self
+
+    def _check_compatible(self, other):
+        if not isinstance(other, Hist1D):
+            return NotImplemented
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot add histograms with different binning")
+        return True
+
+    def __add__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        result = self.copy()
+        result += other
+        return result
+
+    def __iadd__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        return self
+
+    def __radd__(self, other):
+        # Lets sum() start from 0
+        if isinstance(other, (int, float)) and other == 0:
+            return self.copy()
+        return NotImplemented
+
+    def copy(self):
+        result = Hist1D(None, edges=self.edges)
+        result.sumw = self.sumw.copy()
+        result.sumw2 = self.sumw2.copy()
+        return result
+
+    def scale(self, factor):
+        self.sumw *= factor
+        self.sumw2 *= factor * factor
+        return self
+
+    def values(self, flow=False):
+        return self.sumw if flow else self.sumw[1:-1]
+
+    def variances(self, flow=False):
+        return self.sumw2 if flow else self.sumw2[1:-1]
+
+    def errors(self, flow=False):
+        return np.sqrt(self.variances(flow))
+
+    def integral(self, flow=False):
+        return float(self.values(flow).sum())
+
+    def centers(self):
+        return 0.5 * (self.edges[1:] + self.edges[:-1])
+
+    def __eq__(self, other):
+        if not isinstance(other, Hist1D):
+            return NotImplemented
+        return np.array_equal(self.edges, other.edges) and np.array_equal(self.sumw, other.sumw) and np.array_equal(self.sumw2, other.sumw2)
+
+    def __repr__(self):
+        return f"Hist1D({self.n_bins} bins, [{self.edges[0]}, {self.edges[-1]}], integral={self.integral():.6g})"
+
+    def _is_uniform(self):
+        widths = np.diff(self.edges)
+        return np.allclose(widths, widths[0])
+
+    def to_th1(self, name, title="", kind="F"):
+        """Return a new ROOT TH1F (kind="F") or TH1D (kind="D") with the same content."""
+        import ROOT
+
+        cls = ROOT.TH1F if kind == "F" else ROOT.TH1D
+        if self._is_uniform():
+            hist = cls(name, title, self.n_bins, self.edges[0], self.edges[-1])
+        else:
+            hist = cls(name, title, self.n_bins, np.ascontiguousarray(self.edges))
+        hist.Sumw2()
+        for index in range(len(self.sumw)):
+            hist.SetBinContent(index, self.sumw[index])
+            hist.SetBinError(index, np.sqrt(self.sumw2[index]))
+        hist.SetEntries(self.integral(flow=True))
+        return hist
+
+    @classmethod
+    def from_th1(cls, hist):
+        axis = hist.GetXaxis()
+        n_bins = hist.GetNbinsX()
+        edges = [axis.GetBinLowEdge(i) for i in range(1, n_bins + 2)]
+        result = cls(None, edges=edges)
+        result.sumw = np.array([hist.GetBinContent(i) for i in range(n_bins + 2)], dtype=np.float64)
+        result.sumw2 = np.array([hist.GetBinError(i) ** 2 for i in range(n_bins + 2)], dtype=np.float64)
+        return result
+
+
+class HistVariations:
+    """One histogram per weight variation, all filled by the same call.
+
+    ``fill`` takes a (variations x events) weight matrix and fills every
+    variation with a single np.bincount, so adding systematics only adds
+    arithmetic and never another pass over the files. ``variation(name)``
+    returns the Hist1D of one variation.
+    """
+
+    def __init__(self, names, bins=None, hist_range=None, edges=None):
+        self.names = list(names)
+        self._template = Hist1D(bins, hist_range, edges)
+        self.edges = self._template.edges
+        shape = (len(self.names), len(self.edges) + 1)
+        self.sumw = np.zeros(shape)
+        self.sumw2 = np.zeros(shape)
+
+    @classmethod
+    def from_spec(cls, spec):
+        names = list(spec["variations"])
+        if "edges" in spec:
+            return cls(names, edges=spec["edges"])
+        return cls(names, spec["bins"], spec["range"])
+
+    def fill(self, values, weights):
+        """``weights`` has one row per variation (rows may be broadcast scalars)."""
+        index = self._template.bin_indices(values)
+        n_var, n_slots = self.sumw.shape
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), (n_var, len(index)))
+        # Shift the bin index of each variation into its own block of slots
+        flat_index = (index[np.newaxis, :] + n_slots * np.arange(n_var)[:, np.newaxis]).ravel()
+        flat_weights = weights.ravel()
+        size = n_var * n_slots
+        self.sumw += np.bincount(flat_index, weights=flat_weights, minlength=size).reshape(n_var, n_slots)
+        self.sumw2 += np.bincount(flat_index, weights=flat_weights * flat_weights, minlength=size).reshape(n_var, n_slots)
+        return self
+
+    def _check_compatible(self, other):
+        if not isinstance(other, HistVariations):
+            return NotImplemented
+        if self.names != other.names or not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot add histograms with different variations or binning")
+        return True
+
+    def __add__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        result = self.copy()
+        result += other
+        return result
+
+    def __iadd__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        return self
+
+    def __radd__(self, other):
+        if isinstance(other, (int, float)) and other == 0:
+            return self.copy()
+        return NotImplemented
+
+    def copy(self):
+        result = HistVariations(self.names, edges=self.edges)
+        result.sumw = self.sumw.copy()
+        result.sumw2 = self.sumw2.copy()
+        return result
+
+    def scale(self, factor):
+        self.sumw *= factor
+        self.sumw2 *= factor * factor
+        return self
+
+    def variation(self, name):
+        index = self.names.index(name)
+        result = Hist1D(None, edges=self.edges)
+        result.sumw = self.sumw[index].copy()
+        result.sumw2 = self.sumw2[index].copy()
+        return result
+
+    def __repr__(self):
+        return f"HistVariations({len(self.names)} variations, {len(self.edges) - 1} bins)"
+
+
+class SparseHist:
+    """N-dimensional weighted histogram that stores only the occupied bins.
+
+    Meant for finely binned planes such as m_gg x m_bb or M_X vs M_Y, where a
+    dense grid would be mostly empty. Occupied bins are kept as sorted linear
+    indices (COO) with their sums of weights and squared weights, so memory
+    follows the number of distinct occupied bins rather than the product of
+    the axis sizes. Each axis uses the ROOT convention of Hist1D (0 and n+1
+    are the under- and overflow). ``project`` gives Hist1D slices on demand.
+    """
+
+    def __init__(self, edges, names=None):
+        """``edges`` holds one array of bin edges per axis."""
+        self.edges = [Hist1D(None, edges=axis_edges).edges for axis_edges in edges]
+        self.names = list(names) if names is not None else [str(axis) for axis in range(len(self.edges))]
+        if len(self.names) != len(self.edges):
+            raise ValueError("SparseHist needs one name per axis")
+        self.shape = tuple(len(axis_edges) + 1 for axis_edges in self.edges)
+        self.index = np.zeros(0, dtype=np.int64)
+        self.sumw = np.zeros(0)
+        self.sumw2 = np.zeros(0)
+
+    @classmethod
+    def from_spec(cls, spec):
+        # From a request with "observables" and per-axis "bins"/"range" or "edges" (None falls back to bins/range)
+        n_axes = len(spec["observables"])
+        edges = list(spec.get("edges") or [None] * n_axes)
+        for axis in range(n_axes):
+            if edges[axis] is None:
+                edges[axis] = Hist1D(spec["bins"][axis], spec["range"][axis]).edges
+        return cls(edges, spec.get("axis_names", spec["observables"]))
+
+    @property
+    def ndim(self):
+        return len(self.edges)
+
+    @property
+    def nnz(self):
+        # Number of occupied bins
+        return len(self.index)
+
+    def _axis(self, axis):
+        return self.names.index(axis) if isinstance(axis, str) else axis
+
+    def bin_indices(self, values):
+        """Linear bin index of every entry; ``values`` holds one array per axis."""
+        if len(values) != self.ndim:
+            raise ValueError(f"Expected {self.ndim} arrays of values, got {len(values)}")
+        per_axis = [np.searchsorted(axis_edges, np.asarray(axis_values, dtype=np.float64), side="right") for axis_edges, axis_values in zip(self.edges, values)]
+        return np.ravel_multi_index(per_axis, self.shape).astype(np.int64)
+
+    def _merge(self, index, sumw, sumw2):
+        # Add (sorted, unique) occupied bins into this histogram
+        if not len(self.index):
+            # Copies, so that scaling one histogram never changes the one it was added from
+            self.index, self.sumw, self.sumw2 = index.copy(), sumw.copy(), sumw2.copy()
+            return self
+        merged, inverse = np.unique(np.concatenate([self.index, index]), return_inverse=True)
+        self.sumw = np.bincount(inverse, weights=np.concatenate([self.sumw, sumw]), minlength=len(merged))
+        self.sumw2 = np.bincount(inverse, weights=np.concatenate([self.sumw2, sumw2]), minlength=len(merged))
+        self.index = merged
+        return self
+
+    def fill(self, values, weights=None):
+        """Fill all entries at once; ``values`` holds one array per axis."""
+        index = self.bin_indices(values)
+        if not len(index):
+            return self
+        weights = np.ones(len(index)) if weights is None else np.broadcast_to(np.asarray(weights, dtype=np.float64), index.shape)
+        # Reduce the chunk to its occupied bins first, then merge those
+        occupied, inverse = np.unique(index, return_inverse=True)
+        sumw = np.bincount(inverse, weights=weights, minlength=len(occupied))
+        sumw2 = np.bincount(inverse, weights=weights * weights, minlength=len(occupied))
+        return self._merge(occupied, sumw, sumw2)
+
+    def _check_compatible(self, other):
+        if not isinstance(other, SparseHist):
+            return NotImplemented
+        if len(self.edges) != len(other.edges) or not all(np.array_equal(a, b) for a, b in zip(self.edges, other.edges)):
+            raise ValueError("Cannot add histograms with different binning")
+        return True
+
+    def __add__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        result = self.copy()
+        result += other
+        return result
+
+    def __iadd__(self, other):
+        if self._check_compatible(other) is NotImplemented:
+            return NotImplemented
+        return self._merge(other.index, other.sumw, other.sumw2)
+
+    def __radd__(self, other):
+        if isinstance(other, (int, float)) and other == 0:
+            return self.copy()
+        return NotImplemented
+
+    def copy(self):
+        result = SparseHist(self.edges, self.names)
+        result.index = self.index.copy()
+        result.sumw = self.sumw.copy()
+        result.sumw2 = self.sumw2.copy()
+        return result
+
+    def scale(self, factor):
+        self.sumw *= factor
+        self.sumw2 *= factor * factor
+        return self
+
+    def integral(self, flow=False):
+        if flow:
+            return float(self.sumw.sum())
+        inside = np.ones(len(self.index), dtype=bool)
+        for axis_index, size in zip(np.unravel_index(self.index, self.shape), self.shape):
+            inside &= (axis_index > 0) & (axis_index < size - 1)
+        return float(self.sumw[inside].sum())
+
+    def project(self, axis, where=None):
+        """Hist1D of ``axis`` (index or name), summed over the other axes.
+
+        ``where`` optionally restricts other axes to a value range, e.g.
+        ``h.project("m_bb", where={"m_gg": (120, 130)})`` for the dijet mass
+        in a diphoton mass window. A range covers the bins containing its
+        two ends, like TH2::ProjectionX with FindBin; a single value
+        (``(125, 125)``) selects one bin. Under- and overflow of the other
+        axes are included unless restricted.
+        """
+        axis = self._axis(axis)
+        per_axis = np.unravel_index(self.index, self.shape)
+        keep = np.ones(len(self.index), dtype=bool)
+        for other, (low, high) in (where or {}).items():
+            other = self._axis(other)
+            first, last = np.searchsorted(self.edges[other], [low, high], side="right")
+            keep &= (per_axis[other] >= first) & (per_axis[other] <= last)
+        result = Hist1D(None, edges=self.edges[axis])
+        result.sumw = np.bincount(per_axis[axis][keep], weights=self.sumw[keep], minlength=self.shape[axis])
+        result.sumw2 = np.bincount(per_axis[axis][keep], weights=self.sumw2[keep], minlength=self.shape[axis])
+        return result
+
+    def to_dense(self):
+        """(sumw, sumw2) as dense arrays including flow bins; only sensible for coarse binning."""
+        sumw = np.zeros(self.shape)
+        sumw2 = np.zeros(self.shape)
+        sumw.flat[self.index] = self.sumw
+        sumw2.flat[self.index] = self.sumw2
+        return sumw, sumw2
+
+    def __eq__(self, other):
+        if not isinstance(other, SparseHist):
+            return NotImplemented
+        return (
+            len(self.edges) == len(other.edges)
+            and all(np.array_equal(a, b) for a, b in zip(self.edges, other.edges))
+            and np.array_equal(self.index, other.index)
+            and np.array_equal(self.sumw, other.sumw)
+            and np.array_equal(self.sumw2, other.sumw2)
+        )
+
+    def __repr__(self):
+        bins = " x ".join(str(len(axis_edges) - 1) for axis_edges in self.edges)
+        return f"SparseHist({bins} bins over {self.names}, {self.nnz} occupied)"
@@ -0,0 +1,187 @@
+"""Opt-in timing and memory instrumentation of analysis stages.
+
+Enable with ``HHBBGG_PROFILE=1`` in the environment (or ``enable()``) and
+wrap work in ``with instrument.stage("read", events=n):``. For each
+(sample, stage) the wall time, CPU time, number of calls, events processed
+and peak RSS are accumulated. ``add_io`` adds the reader statistics of a
+sample (branches and bytes read against the file size, see reader.py).
+``write_report`` saves the stages as JSON or CSV and ``print_summary`` prints
+both at the end of a run. When disabled, ``stage`` and ``add_io`` do nothing.
+"""
+
+import contextlib
+import csv
+import json
+import os
+import resource
+import threading
+import time
+
+
+ENV_VAR = "HHBBGG_PROFILE"
+
+FIELDS = ("sample", "stage", "calls", "events", "wall_s", "cpu_s", "peak_rss_mb")
+
+_records = {}
+# sample -> reader statistics (see reader.init_stats)
+_io = {}
+_current_sample = [None]
+# Stages can also be recorded from the reader's prefetch thread
+_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+def enable(on=True):
+    # Through the environment so that worker processes inherit the setting
+    os.environ[ENV_VAR] = "1" if on else "0"
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def current_sample():
+    return _current_sample[0]
+
+
+@contextlib.contextmanager
+def sample(name):
+    """Attribute the stages run inside the block to sample ``name``."""
+    previous = _current_sample[0]
+    _current_sample[0] = name
+    try:
+        yield
+    finally:
+        _current_sample[0] = previous
+
+
+@contextlib.contextmanager
+def stage(name, events=0, sample_name=None):
+    if not enabled():
+        yield
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        record(
+            sample_name or _current_sample[0] or "-",
+            name,
+            wall=time.perf_counter() - wall_start,
+            cpu=time.process_time() - cpu_start,
+            events=events,
+        )
+
+
+def record(sample_name, stage_name, wall=0.0, cpu=0.0, events=0, calls=1, peak_rss_mb=None):
+    peak_rss_mb = peak_rss_mb if peak_rss_mb is not None else _peak_rss_mb()
+    with _lock:
+        entry = _records.setdefault((sample_name, stage_name), {"calls": 0, "events": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+        entry["calls"] += calls
+        entry["events"] += events
+        entry["wall_s"] += wall
+        entry["cpu_s"] += cpu
+        entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb)
+
+
+def add_event_count(events, stage_name="events"):
+    # Count events without timing anything, e.g. entries surviving a selection
+    if enabled():
+        record(_current_sample[0] or "-", stage_name, events=events, calls=0)
+
+
+def add_io(stats, sample_name=None):
+    """Add the ``stats`` a reader filled (bytes_read, entries_read, ...) to the I/O of a sample."""
+    if not enabled() or not stats:
+        return
+    with _lock:
+        total = _io.setdefault(sample_name or _current_sample[0] or "-", {})
+        for key in ("bytes_read", "entries_read", "file_size"):
+            total[key] = total.get(key, 0) + stats.get(key, 0)
+        total["branches_read"] = sorted(set(total.get("branches_read", [])) | set(stats.get("branches_read", [])))
+        total["branches_total"] = max(total.get("branches_total", 0), stats.get("branches_total", 0))
+
+
+def reset():
+    """Drop all records, e.g. the copies a forked worker inherits from its parent."""
+    with _lock:
+        _records.clear()
+        _io.clear()
+
+
+def take_records():
+    """Return and clear the records of this process (used to ship them from workers)."""
+    rows = rows_from(_records) + [{"sample": name, "stage": "io", "stats": stats} for name, stats in _io.items()]
+    reset()
+    return rows
+
+
+def call_and_take(task, argument):
+    """``(task(argument), records)``: runs in a worker, the parent passes the records to merge_records."""
+    result = task(argument)
+    return result, take_records()
+
+
+def rows_from(records):
+    return [dict(sample=key[0], stage=key[1], **values) for key, values in records.items()]
+
+
+def merge_records(rows):
+    # Add rows coming back from worker processes
+    for row in rows:
+        if "stats" in row:
+            add_io(row["stats"], row["sample"])
+            continue
+        record(row["sample"], row["stage"], row["wall_s"], row["cpu_s"], row["events"], row["calls"], row["peak_rss_mb"])
+
+
+def rows():
+    return sorted(rows_from(_records), key=lambda row: (row["sample"], row["stage"]))
+
+
+def write_report(path):
+    """Write the records to ``path``; CSV if it ends in .csv, JSON otherwise."""
+    data = rows()
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(data)
+    else:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
+    return path
+
+
+def summary_table():
+    data = rows()
+    header = f"{'sample':<20} {'stage':<12} {'calls':>6} {'events':>12} {'wall [s]':>9} {'cpu [s]':>9} {'peak RSS [MB]':>14}"
+    lines = [header, "-" * len(header)]
+    for row in data:
+        lines.append(
+            f"{row['sample']:<20} {row['stage']:<12} {row['calls']:>6d} {row['events']:>12d} "
+            f"{row['wall_s']:>9.2f} {row['cpu_s']:>9.2f} {row['peak_rss_mb']:>14.0f}"
+        )
+    return "\n".join(lines)
+
+
+def io_table():
+    from . import reader
+
+    return "\n".join(f"{name:<20} {reader.format_stats(stats)}" for name, stats in sorted(_io.items()))
+
+
+def print_summary(report_path=None):
+    """Print the summary table and the I/O per sample (and write a report) if instrumentation is on."""
+    if not enabled() or not (_records or _io):
+        return
+    print(summary_table())
+    if _io:
+        print(io_table())
+    report_path = report_path or os.environ.get("HHBBGG_PROFILE_REPORT")
+    if report_path:
+        write_report(report_path)
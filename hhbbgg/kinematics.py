@@ -0,0 +1,175 @@
+"""Vectorized four-vector kinematics for the DiphotonTree objects.
+
+Every function here works on NumPy arrays and gives the same numbers as
+building two ``ROOT.TLorentzVector`` objects per event with
+``create_lorentz_vector`` and asking for ``.M()``, ``.Pt()``, ``.Eta()``,
+``.Phi()`` or ``.Rapidity()`` of their sum.
+"""
+
+import numpy as np
+
+from . import reader
+
+
+# Objects stored in the DiphotonTree and the branch that holds their fourth
+# component. Photons carry their (raw) energy, used as in SetPtEtaPhiE like
+# the diphoton notebooks do; the jets and the candidate carry a mass.
+OBJECTS = {
+    "lead": "energyRaw",
+    "sublead": "energyRaw",
+    "lead_bjet": "mass",
+    "sublead_bjet": "mass",
+    "HHbbggCandidate": "mass",
+}
+
+# Pairs of objects combined by the plot scripts
+PAIRS = {
+    "diphoton": ("lead", "sublead"),
+    "dijet": ("lead_bjet", "sublead_bjet"),
+}
+
+# Value returned by TLorentzVector::Eta() for vectors along the beam axis
+_ETA_LIMIT = 10e10
+
+
+def is_energy(fourth):
+    # energy and energyRaw are energies, anything else (mass) a mass
+    return fourth.startswith("energy")
+
+
+def object_branches(prefix, fourth=None):
+    # Branch names (pt, eta, phi, mass/energy) of one object
+    fourth = fourth or OBJECTS.get(prefix, "mass")
+    return [f"{prefix}_pt", f"{prefix}_eta", f"{prefix}_phi", f"{prefix}_{fourth}"]
+
+
+def pair_branches(pair):
+    lead, sublead = PAIRS[pair]
+    return object_branches(lead) + object_branches(sublead)
+
+
+def p4_from_pt_eta_phi_m(pt, eta, phi, mass):
+    # Same convention as TLorentzVector::SetPtEtaPhiM
+    pt = np.abs(np.asarray(pt, dtype=np.float64))
+    eta = np.asarray(eta, dtype=np.float64)
+    phi = np.asarray(phi, dtype=np.float64)
+    mass = np.asarray(mass, dtype=np.float64)
+
+    px = pt * np.cos(phi)
+    py = pt * np.sin(phi)
+    pz = pt * np.sinh(eta)
+    p2 = px * px + py * py + pz * pz
+    m2 = mass * mass
+    energy = np.where(mass >= 0, np.sqrt(p2 + m2), np.sqrt(np.maximum(p2 - m2, 0.0)))
+    return px, py, pz, energy
+
+
+def p4_from_pt_eta_phi_e(pt, eta, phi, energy):
+    # Same convention as TLorentzVector::SetPtEtaPhiE
+    pt = np.abs(np.asarray(pt, dtype=np.float64))
+    eta = np.asarray(eta, dtype=np.float64)
+    phi = np.asarray(phi, dtype=np.float64)
+    energy = np.asarray(energy, dtype=np.float64)
+    return pt * np.cos(phi), pt * np.sin(phi), pt * np.sinh(eta), energy
+
+
+def p4_mass(px, py, pz, energy):
+    # TLorentzVector::M() returns -sqrt(-m2) for space-like vectors
+    m2 = energy * energy - (px * px + py * py + pz * pz)
+    # Massless photons often come out a rounding error below zero
+    return np.where(m2 < 0, -np.sqrt(np.abs(m2)), np.sqrt(np.abs(m2)))
+
+
+def p4_pt(px, py, pz, energy):
+    return np.hypot(px, py)
+
+
+def p4_phi(px, py, pz, energy):
+    return np.where((px == 0) & (py == 0), 0.0, np.arctan2(py, px))
+
+
+def p4_eta(px, py, pz, energy):
+    p = np.sqrt(px * px + py * py + pz * pz)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_theta = np.where(p == 0, 1.0, pz / p)
+        eta = -0.5 * np.log((1.0 - cos_theta) / (1.0 + cos_theta))
+    along_beam = cos_theta * cos_theta >= 1
+    beam_eta = np.where(pz == 0, 0.0, np.where(pz > 0, _ETA_LIMIT, -_ETA_LIMIT))
+    return np.where(along_beam, beam_eta, eta)
+
+
+def p4_rapidity(px, py, pz, energy):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 0.5 * np.log((energy + pz) / (energy - pz))
+
+
+_OBSERVABLES = {
+    "mass": p4_mass,
+    "pt": p4_pt,
+    "eta": p4_eta,
+    "phi": p4_phi,
+    "rapidity": p4_rapidity,
+}
+
+
+def kinematics(px, py, pz, energy, observables=None):
+    """Return a dict of observable name -> array for a set of four-vectors."""
+    names = observables or list(_OBSERVABLES)
+    return {name: _OBSERVABLES[name](px, py, pz, energy) for name in names}
+
+
+def delta_phi(phi1, phi2):
+    # Wrapped into [-pi, pi) like TVector2::Phi_mpi_pi
+    return (np.asarray(phi1, dtype=np.float64) - phi2 + np.pi) % (2 * np.pi) - np.pi
+
+
+def delta_r(eta1, phi1, eta2, phi2):
+    return np.hypot(np.asarray(eta1, dtype=np.float64) - eta2, delta_phi(phi1, phi2))
+
+
+def pair_delta_r(columns, pair):
+    lead, sublead = PAIRS[pair]
+    return delta_r(columns[f"{lead}_eta"], columns[f"{lead}_phi"], columns[f"{sublead}_eta"], columns[f"{sublead}_phi"])
+
+
+def four_body_p4(columns):
+    # Diphoton + dijet system, i.e. the X candidate
+    return tuple(a + b for a, b in zip(pair_p4(columns, "diphoton"), pair_p4(columns, "dijet")))
+
+
+def object_p4(columns, prefix, fourth=None):
+    # Four-vector of one object from a dict of branch arrays
+    fourth = fourth or OBJECTS.get(prefix, "mass")
+    pt, eta, phi, last = (columns[b] for b in object_branches(prefix, fourth))
+    if is_energy(fourth):
+        return p4_from_pt_eta_phi_e(pt, eta, phi, last)
+    return p4_from_pt_eta_phi_m(pt, eta, phi, last)
+
+
+def pair_p4(columns, pair):
+    lead, sublead = PAIRS[pair]
+    p1 = object_p4(columns, lead)
+    p2 = object_p4(columns, sublead)
+    return tuple(a + b for a, b in zip(p1, p2))
+
+
+def pair_kinematics(columns, pair, observables=None):
+    """Mass, pt, eta, phi and rapidity of the lead+sublead system of ``pair``."""
+    return kinematics(*pair_p4(columns, pair), observables)
+
+
+def candidate_kinematics(columns, prefix="HHbbggCandidate", observables=None):
+    """Kinematics of a single stored candidate such as HHbbggCandidate."""
+    return kinematics(*object_p4(columns, prefix), observables)
+
+
+def process_file(file_path, tree_name, pair="dijet", observables=("mass",)):
+    """Columnar replacement for the per-event ``process_file`` loops.
+
+    Returns a dict of observable -> array plus the ``genweight`` column
+    (1.0 where the tree has no genweight, as in data).
+    """
+    columns = reader.read_columns(file_path, tree_name, pair_branches(pair) + ["genweight"], defaults={"genweight": 1.0})
+    result = pair_kinematics(columns, pair, list(observables))
+    result["genweight"] = columns["genweight"]
+    return result
@@ -0,0 +1,119 @@
+"""Named observables that can be requested from the readers.
+
+Each observable is the list of branches it needs plus a function that takes a
+dict of branch arrays and returns one value per entry. Any name that is not
+registered here is treated as a plain branch of the tree, and anything that
+is not a plain name is an expression (see expressions.py) over branches and
+registered observables.
+"""
+
+from . import expressions, kinematics
+
+
+OBSERVABLES = {}
+
+# Observables that are read from the derived-column store as if they were
+# branches (see derived.py) instead of being computed from their inputs
+MATERIALIZED = set()
+
+# Nominal Higgs mass used in the reduced M_X
+HIGGS_MASS = 125.0
+
+
+def define_observable(name, branches, function):
+    OBSERVABLES[name] = (list(branches), function)
+
+
+def _pair_observable(pair, quantity):
+    return lambda columns: kinematics.pair_kinematics(columns, pair, [quantity])[quantity]
+
+
+def _candidate_observable(quantity):
+    return lambda columns: kinematics.candidate_kinematics(columns, observables=[quantity])[quantity]
+
+
+for _suffix, _pair in (("bb", "dijet"), ("gg", "diphoton")):
+    for _prefix, _quantity in (("m", "mass"), ("pt", "pt"), ("eta", "eta"), ("phi", "phi"), ("y", "rapidity")):
+        define_observable(f"{_prefix}_{_suffix}", kinematics.pair_branches(_pair), _pair_observable(_pair, _quantity))
+
+for _prefix, _quantity in (("m", "mass"), ("pt", "pt"), ("eta", "eta"), ("phi", "phi"), ("y", "rapidity")):
+    define_observable(f"{_prefix}_HH", kinematics.object_branches("HHbbggCandidate"), _candidate_observable(_quantity))
+
+define_observable("dR_gg", kinematics.pair_branches("diphoton"), lambda columns: kinematics.pair_delta_r(columns, "diphoton"))
+define_observable("dR_bb", kinematics.pair_branches("dijet"), lambda columns: kinematics.pair_delta_r(columns, "dijet"))
+
+_FOUR_BODY_BRANCHES = kinematics.pair_branches("diphoton") + kinematics.pair_branches("dijet")
+
+
+def _m_ggbb(columns):
+    return kinematics.p4_mass(*kinematics.four_body_p4(columns))
+
+
+def _reduced_mx(columns):
+    # M_X - (m_gg - m_H) - (m_bb - m_H), which removes most of the dijet and diphoton resolution
+    m_gg = kinematics.pair_kinematics(columns, "diphoton", ["mass"])["mass"]
+    m_bb = kinematics.pair_kinematics(columns, "dijet", ["mass"])["mass"]
+    return _m_ggbb(columns) - (m_gg - HIGGS_MASS) - (m_bb - HIGGS_MASS)
+
+
+define_observable("m_ggbb", _FOUR_BODY_BRANCHES, _m_ggbb)
+define_observable("MX_reduced", _FOUR_BODY_BRANCHES, _reduced_mx)
+
+
+def branches_for(names):
+    """Union of the branches needed by the observables/expressions ``names``, in order."""
+    branches = []
+    for name in names:
+        if name in MATERIALIZED:
+            needed = [name]
+        elif name in OBSERVABLES:
+            needed = OBSERVABLES[name][0]
+        elif expressions.is_name(name):
+            needed = [name]
+        else:
+            needed = branches_for(expressions.names(name))
+        for branch in needed:
+            if branch not in branches:
+                branches.append(branch)
+    return branches
+
+
+def compute(name, columns):
+    # Always compute a registered observable from its inputs, even if materialized
+    return OBSERVABLES[name][1](columns)
+
+
+def evaluate(name, columns, memo=None):
+    """Values of an observable, branch or expression for the entries in ``columns``.
+
+    ``memo`` is an optional dict shared between calls on the same chunk so
+    that an observable used by several plots or cuts is computed only once.
+    """
+    if memo is not None and name in memo:
+        return memo[name]
+    if name in MATERIALIZED and name in columns:
+        value = columns[name]
+    elif name in OBSERVABLES:
+        value = OBSERVABLES[name][1](columns)
+    elif expressions.is_name(name):
+        value = columns[name]
+    else:
+        value = expressions.evaluate(name, lambda sub: evaluate(sub, columns, memo))
+    if memo is not None:
+        memo[name] = value
+    return value
+
+
+def required_branches(observables=(), weights=(), cuts=()):
+    """Every branch needed for the given observables, weight branches and cuts.
+
+    Cuts are anything with a ``branches`` list (see the selection layer) or
+    plain branch/observable names.
+    """
+    names = list(observables) + list(weights)
+    branches = branches_for(names)
+    for cut in cuts:
+        for branch in getattr(cut, "branches", None) or branches_for([cut]):
+            if branch not in branches:
+                branches.append(branch)
+    return branches
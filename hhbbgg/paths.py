@@ -0,0 +1,19 @@
+import os
+
+
+def cache_dir(*parts):
+    """Directory for the package's on-disk caches, created on first use.
+
+    Defaults to ~/.cache/hhbbgg and can be moved with $HHBBGG_CACHE_DIR
+    (e.g. to a work area on batch nodes with a small home quota).
+    """
+    base = os.environ.get("HHBBGG_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "hhbbgg")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_fingerprint(file_path):
+    # (absolute path, size, mtime) identifies one version of an input file
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,384 @@
+"""RDataFrame backend for the histogram requests of engine.fill_streaming.
+
+For sites that have ROOT but cannot install uproot or pyarrow. The same
+requests - registered observables, config.json expressions, selections,
+blinding windows, weights and weight variations - are turned into a lazy
+``ROOT.RDataFrame`` graph of ``Define``/``Filter``/``Histo1D`` nodes:
+
+  * registered observables have a C++ twin in ``CXX_OBSERVABLES`` built on
+    TLorentzVector, the convention the NumPy kinematics reproduce;
+  * expressions (see expressions.py) are translated node by node to C++.
+
+Every histogram of every sample is booked before the single event loop
+starts (``ROOT.RDF.RunGraphs``), which runs with ``EnableImplicitMT``.
+Results are returned as Hist1D/HistVariations with the same binning as the
+NumPy backend, so both can be mixed, merged and cached interchangeably;
+bin contents agree up to floating-point summation order.
+
+N-dimensional requests ("observables") with two or three axes are filled
+into a dense TH2D/TH3D and returned as SparseHist. RDataFrame keeps one copy
+of every booked histogram per thread for every sample until the loop ends,
+so planes with more than ``max_dense_cells()`` bins (HHBBGG_RDF_MAX_CELLS),
+and requests with more axes, are skipped with a warning; fill those with the
+NumPy backend.
+
+Only ROOT files can be read; parquet inputs need the NumPy backend.
+"""
+
+import ast
+import os
+import warnings
+
+import numpy as np
+
+from . import engine, expressions, kinematics, observables as obs, reader, scheduler, sumw_index
+
+
+_CXX_HELPERS = r"""
+#include <cmath>
+#include "TLorentzVector.h"
+#include "TVector2.h"
+
+namespace hhbbgg {
+inline TLorentzVector p4(double pt, double eta, double phi, double last, bool is_energy) {
+    TLorentzVector v;
+    if (is_energy) v.SetPtEtaPhiE(pt, eta, phi, last);
+    else v.SetPtEtaPhiM(pt, eta, phi, last);
+    return v;
+}
+inline double delta_r(double eta1, double phi1, double eta2, double phi2) {
+    return std::hypot(eta1 - eta2, TVector2::Phi_mpi_pi(phi1 - phi2));
+}
+}
+"""
+
+_METHODS = (("m", "M"), ("pt", "Pt"), ("eta", "Eta"), ("phi", "Phi"), ("y", "Rapidity"))
+
+
+def _object_cxx(prefix):
+    fourth = kinematics.OBJECTS.get(prefix, "mass")
+    pt, eta, phi, last = kinematics.object_branches(prefix, fourth)
+    return f"hhbbgg::p4({pt}, {eta}, {phi}, {last}, {'true' if kinematics.is_energy(fourth) else 'false'})"
+
+
+def _pair_cxx(pair):
+    lead, sublead = kinematics.PAIRS[pair]
+    return f"({_object_cxx(lead)} + {_object_cxx(sublead)})"
+
+
+def _delta_r_cxx(pair):
+    lead, sublead = kinematics.PAIRS[pair]
+    return f"hhbbgg::delta_r({lead}_eta, {lead}_phi, {sublead}_eta, {sublead}_phi)"
+
+
+# C++ definitions of the observables registered in observables.py
+CXX_OBSERVABLES = {}
+for _suffix, _pair in (("bb", "dijet"), ("gg", "diphoton")):
+    for _prefix, _method in _METHODS:
+        CXX_OBSERVABLES[f"{_prefix}_{_suffix}"] = f"{_pair_cxx(_pair)}.{_method}()"
+for _prefix, _method in _METHODS:
+    CXX_OBSERVABLES[f"{_prefix}_HH"] = f"{_object_cxx('HHbbggCandidate')}.{_method}()"
+CXX_OBSERVABLES["dR_gg"] = _delta_r_cxx("diphoton")
+CXX_OBSERVABLES["dR_bb"] = _delta_r_cxx("dijet")
+CXX_OBSERVABLES["m_ggbb"] = f"({_pair_cxx('diphoton')} + {_pair_cxx('dijet')}).M()"
+CXX_OBSERVABLES["MX_reduced"] = (
+    f"{CXX_OBSERVABLES['m_ggbb']} - ({CXX_OBSERVABLES['m_gg']} - {obs.HIGGS_MASS}) - ({CXX_OBSERVABLES['m_bb']} - {obs.HIGGS_MASS})"
+)
+
+_CXX_FUNCTIONS = {
+    "abs": "std::abs",
+    "sqrt": "std::sqrt",
+    "log": "std::log",
+    "exp": "std::exp",
+    "cos": "std::cos",
+    "sin": "std::sin",
+    "cosh": "std::cosh",
+    "sinh": "std::sinh",
+    "arctan2": "std::atan2",
+    "hypot": "std::hypot",
+    "minimum": "std::fmin",
+    "maximum": "std::fmax",
+}
+
+_CXX_BINARY = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.BitAnd: "&&", ast.BitOr: "||"}
+
+_CXX_COMPARE = {ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=", ast.Eq: "==", ast.NotEq: "!="}
+
+
+def to_cxx(text, resolve=lambda name: name):
+    """C++ for an expression; ``resolve(name)`` gives the column of each name."""
+    return _to_cxx(expressions.parse(text), resolve)
+
+
+def _to_cxx(node, resolve):
+    if isinstance(node, ast.BinOp):
+        left, right = _to_cxx(node.left, resolve), _to_cxx(node.right, resolve)
+        if isinstance(node.op, ast.Div):
+            # Python division, also for two integer branches
+            return f"(double({left}) / ({right}))"
+        if isinstance(node.op, ast.Pow):
+            return f"std::pow({left}, {right})"
+        if isinstance(node.op, ast.Mod):
+            return f"std::fmod({left}, {right})"
+        if isinstance(node.op, ast.BitXor):
+            return f"(bool({left}) != bool({right}))"
+        return f"({left} {_CXX_BINARY[type(node.op)]} {right})"
+    if isinstance(node, ast.UnaryOp):
+        operand = _to_cxx(node.operand, resolve)
+        if isinstance(node.op, (ast.Invert, ast.Not)):
+            return f"(!{operand})"
+        return f"({'-' if isinstance(node.op, ast.USub) else '+'}{operand})"
+    if isinstance(node, ast.BoolOp):
+        joiner = " && " if isinstance(node.op, ast.And) else " || "
+        return "(" + joiner.join(_to_cxx(value, resolve) for value in node.values) + ")"
+    if isinstance(node, ast.Compare):
+        operands = [_to_cxx(value, resolve) for value in [node.left] + node.comparators]
+        parts = [f"({a} {_CXX_COMPARE[type(op)]} {b})" for op, a, b in zip(node.ops, operands, operands[1:])]
+        return parts[0] if len(parts) == 1 else "(" + " && ".join(parts) + ")"
+    if isinstance(node, ast.Call):
+        args = [_to_cxx(arg, resolve) for arg in node.args]
+        if node.func.id == "where":
+            return f"({args[0]} ? double({args[1]}) : double({args[2]}))"
+        return f"{_CXX_FUNCTIONS[node.func.id]}({', '.join(args)})"
+    if isinstance(node, ast.Name):
+        return resolve(node.id)
+    if isinstance(node.value, bool):
+        return "true" if node.value else "false"
+    return repr(float(node.value)) if isinstance(node.value, float) else str(node.value)
+
+
+_declared = []
+
+
+def _root():
+    import ROOT
+
+    if not _declared:
+        ROOT.gInterpreter.Declare(_CXX_HELPERS)
+        _declared.append(True)
+    return ROOT
+
+
+def enable_mt(n_threads=None):
+    """Turn on ROOT's implicit multithreading (all cores when n_threads is None or 0)."""
+    ROOT = _root()
+    if not ROOT.IsImplicitMTEnabled():
+        ROOT.EnableImplicitMT(n_threads or 0)
+
+
+class _Graph:
+    # Defines each observable, expression and weight product once per data frame
+
+    def __init__(self, df):
+        self.df = df
+        self.branches = {str(name) for name in df.GetColumnNames()}
+        self.columns = {}
+        self.sums = {}
+
+    def _define(self, key, expression):
+        column = f"hhbbgg_{len(self.columns)}"
+        self.df = self.df.Define(column, expression)
+        self.columns[key] = column
+        return column
+
+    def column(self, name):
+        if name in self.columns:
+            return self.columns[name]
+        if name in CXX_OBSERVABLES:
+            return self._define(name, CXX_OBSERVABLES[name])
+        if name in obs.OBSERVABLES:
+            raise ValueError(f"Observable {name!r} has no C++ definition; add it to rdf.CXX_OBSERVABLES")
+        if expressions.is_name(name):
+            if name in self.branches:
+                return name
+            if name in engine.WEIGHT_DEFAULTS:
+                return self._define(name, repr(float(engine.WEIGHT_DEFAULTS[name])))
+            raise KeyError(f"Branch {name!r} not found in the tree")
+        return self._define(name, to_cxx(name, self.column))
+
+    def weight(self, names):
+        key = ("weight",) + tuple(names)
+        if key not in self.columns:
+            factors = [self.column(name) for name in names]
+            self._define(key, " * ".join(f"double({factor})" for factor in factors) or "1.0")
+        return self.columns[key]
+
+    def filtered(self, df, cuts):
+        for cut in cuts:
+            df = df.Filter(f"bool({self.column(cut)})", cut)
+        return df
+
+
+# Axes of the N-dimensional histograms that RDataFrame can fill
+MAX_AXES = 3
+
+# Bins, flow included, of the largest dense plane booked: 1.6 MB with sumw2 per thread and sample
+DEFAULT_MAX_DENSE_CELLS = 100_000
+
+
+def max_dense_cells():
+    return int(os.environ.get("HHBBGG_RDF_MAX_CELLS", DEFAULT_MAX_DENSE_CELLS))
+
+
+def _unsupported(histogram):
+    # Why RDataFrame does not fill this request, or None
+    if "observables" not in histogram:
+        return None
+    if len(histogram["observables"]) > MAX_AXES:
+        return f"RDataFrame fills at most {MAX_AXES} axes"
+    cells = int(np.prod(engine.new_histogram(histogram).shape))
+    if cells > max_dense_cells():
+        return f"its {cells} bins exceed the dense-histogram budget of {max_dense_cells()} (HHBBGG_RDF_MAX_CELLS)"
+    return None
+
+
+def _model(ROOT, name, histogram):
+    template = engine.new_histogram(histogram)
+    if "observables" not in histogram:
+        edges = template.edges
+        return ROOT.RDF.TH1DModel(name, "", len(edges) - 1, edges.astype("float64"))
+    axes = []
+    for edges in template.edges:
+        axes.extend((len(edges) - 1, edges.astype("float64")))
+    model = ROOT.RDF.TH2DModel if template.ndim == 2 else ROOT.RDF.TH3DModel
+    return model(name, "", *axes)
+
+
+def _fill_node(node, model, values, weight):
+    # Histo1D/Histo2D/Histo3D by the number of value columns
+    method = {1: node.Histo1D, 2: node.Histo2D, 3: node.Histo3D}[len(values)]
+    return method(model, *values, weight)
+
+
+def book(file_path, tree_name, histograms, is_data=False, cuts=(), sums=False):
+    """Book every histogram of one file on one data frame; nothing runs yet.
+
+    Returns {histogram name: [Histo1D result, ...]} with one result per
+    weight variation (a single one otherwise); N-dimensional requests book a
+    Histo2D/Histo3D, and ones with more than MAX_AXES axes or
+    max_dense_cells() bins are left out. With ``sums`` the sums of
+    weights of sumw_index are booked too, on every entry (see ``collect_sums``).
+    """
+    if reader.is_parquet(file_path):
+        raise ValueError(f"The RDataFrame backend reads ROOT files only, not {file_path}")
+    ROOT = _root()
+    graph = _Graph(ROOT.RDataFrame(tree_name, file_path))
+    # Define every column first: filters branch off the graph as it is when they are added
+    for cut in cuts:
+        graph.column(cut)
+    requests = []
+    for h in histograms:
+        reason = _unsupported(h)
+        if reason:
+            warnings.warn(f"Skipping {engine.histogram_name(h)!r}: {reason}, use the NumPy backend", stacklevel=2)
+            continue
+        values = [graph.column(observable) for observable in engine.histogram_observables(h)]
+        if "variations" in h and not is_data:
+            weights = [graph.weight([expression]) for expression in h["variations"].values()]
+        else:
+            weights = [graph.weight(h.get("data_weights", h.get("weights", engine.DEFAULT_WEIGHTS)) if is_data else h.get("weights", engine.DEFAULT_WEIGHTS))]
+        request_cuts = engine.histogram_cuts(h, is_data)
+        for cut in request_cuts:
+            graph.column(cut)
+        requests.append((h, values, weights, request_cuts))
+
+    if sums:
+        graph.sums = {"n_entries": graph.df.Count()}
+        for name in sumw_index.WEIGHT_BRANCHES:
+            # Define first: every Define replaces graph.df with a new node
+            for key, factors in ((f"sum_{name}", [name]), (f"sum_{name}2", [name, name])):
+                column = graph.weight(factors)
+                graph.sums[key] = graph.df.Sum(column)
+
+    base = graph.filtered(graph.df, cuts)
+    booked = {}
+    for index, (h, values, weights, request_cuts) in enumerate(requests):
+        node = graph.filtered(base, request_cuts)
+        booked[engine.histogram_name(h)] = [_fill_node(node, _model(ROOT, f"hhbbgg_{index}_{i}", h), values, weight) for i, weight in enumerate(weights)]
+    # Keep the data frame alive until the results have been read
+    booked[None] = graph
+    return booked
+
+
+def collect(booked, histograms):
+    """Hist1D/HistVariations/SparseHist from booked results (runs the event loop if needed).
+
+    Requests that book() left out are missing from the result.
+    """
+    filled = {}
+    for h in histograms:
+        name = engine.histogram_name(h)
+        if name not in booked:
+            continue
+        result = engine.new_histogram(h)
+        if "observables" in h:
+            filled[name] = _sparse(result, booked[name][0].GetValue())
+            continue
+        contents = [_contents(handle.GetValue()) for handle in booked[name]]
+        if "variations" in h:
+            # Data books a single histogram that stands for every variation
+            for row in range(len(result.names)):
+                sumw, sumw2 = contents[row if len(contents) > 1 else 0]
+                result.sumw[row], result.sumw2[row] = sumw, sumw2
+        else:
+            result.sumw, result.sumw2 = contents[0]
+        filled[name] = result
+    return filled
+
+
+def collect_sums(booked):
+    """The sumw_index entry booked with book(..., sums=True)."""
+    sums = {key: float(handle.GetValue()) for key, handle in booked[None].sums.items()}
+    sums["n_entries"] = int(sums["n_entries"])
+    return sums
+
+
+def _buffer(array, size):
+    view = array.GetArray()
+    view.reshape((size,))
+    return np.array(view, dtype=np.float64)
+
+
+def _sparse(result, hist):
+    # Dense TH2D/TH3D -> the occupied bins of ``result``; ROOT's global bin runs fastest along x
+    sumw = _buffer(hist, hist.GetNcells())
+    sumw2 = _buffer(hist.GetSumw2(), hist.GetNcells()) if hist.GetSumw2N() else sumw.copy()
+    sumw = sumw.reshape(result.shape[::-1]).T.ravel()
+    sumw2 = sumw2.reshape(result.shape[::-1]).T.ravel()
+    result.index = np.flatnonzero((sumw != 0) | (sumw2 != 0)).astype(np.int64)
+    result.sumw, result.sumw2 = sumw[result.index], sumw2[result.index]
+    return result
+
+
+def _contents(hist):
+    n_slots = hist.GetNbinsX() + 2
+    sumw = np.array([hist.GetBinContent(i) for i in range(n_slots)], dtype=np.float64)
+    sumw2 = np.array([hist.GetBinError(i) ** 2 for i in range(n_slots)], dtype=np.float64)
+    return sumw, sumw2
+
+
+def fill_file(file_path, tree_name, histograms, is_data=False, cuts=()):
+    """Drop-in for engine.fill_streaming; returns {name: Hist1D, HistVariations or SparseHist}."""
+    return collect(book(file_path, tree_name, histograms, is_data, cuts), histograms)
+
+
+def run_samples(samples, tree_name, histograms, n_threads=None, cuts=()):
+    """Fill ``histograms`` for every sample in one multithreaded event loop; {sample name: result}.
+
+    ``cuts`` is a preselection applied to every histogram.
+    """
+    enable_mt(n_threads)
+    ROOT = _root()
+    # The sums of weights of MC come out of the same event loop, for the normalization
+    booked = {sample["name"]: book(sample["file_path"], tree_name, histograms, sample["kind"] == "data", cuts, sums=sample["kind"] != "data") for sample in samples}
+    handles = [handle for per_sample in booked.values() for name, results in per_sample.items() if name is not None for handle in results]
+    handles += [handle for per_sample in booked.values() for handle in per_sample[None].sums.values()]
+    if handles and hasattr(ROOT.RDF, "RunGraphs"):
+        ROOT.RDF.RunGraphs(handles)
+    sumw_index.store(tree_name, {sample["file_path"]: collect_sums(booked[sample["name"]]) for sample in samples if sample["kind"] != "data"})
+    return {name: collect(per_sample, histograms) for name, per_sample in booked.items()}
+
+
+def run_groups(samples, tree_name, histograms, n_threads=None, scale=None, cuts=()):
+    """Same result as scheduler.run_groups, filled by RDataFrame."""
+    return scheduler.merge_groups(samples, run_samples(samples, tree_name, histograms, n_threads, cuts), scale)
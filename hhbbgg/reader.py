@@ -0,0 +1,331 @@
+"""Columnar readers for the DiphotonTree.
+
+``read_columns`` loads a set of branches in one go; ``iter_chunks`` streams
+them in fixed-size entry chunks so that peak memory is set by the chunk size
+and not by the size of the sample.
+
+Both ROOT files and the HiggsDNA parquet outputs are accepted, so samples do
+not have to go through convert_parquet_to_root.py first. Parquet files are
+memory-mapped, read one row group at a time and only the requested columns
+are decoded; the tree name is ignored for them.
+
+While the caller works on one chunk, the next ones are read and
+decompressed on a background thread (see ``prefetch``), which hides most of
+the I/O latency when the inputs sit on EOS or AFS.
+
+Only the branches that are asked for are ever decompressed. Pass a ``stats``
+dict to see what that saves: it is filled with the compressed bytes of the
+baskets/column chunks that were read next to the size of the file.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+DEFAULT_TREE = "DiphotonTree/data_125_13TeV_NOTAG"
+
+# Entries per chunk; about 100 MB for a few dozen float branches
+DEFAULT_CHUNK_SIZE = 500_000
+
+# Chunks read ahead of the one being processed, and the memory they may take
+DEFAULT_PREFETCH = 1
+DEFAULT_PREFETCH_BYTES = 512 << 20
+
+
+def prefetch_depth():
+    return int(os.environ.get("HHBBGG_PREFETCH", DEFAULT_PREFETCH))
+
+
+def prefetch_bytes():
+    return int(os.environ.get("HHBBGG_PREFETCH_BYTES", DEFAULT_PREFETCH_BYTES))
+
+
+def _split_present(source, file_path, tree_name, branches, defaults):
+    present = [b for b in branches if b in source]
+    missing = [b for b in branches if b not in source]
+    for branch in missing:
+        if branch not in defaults:
+            raise KeyError(f"Branch {branch} not found in {file_path}:{tree_name}")
+    return present, missing
+
+
+def _add_defaults(columns, missing, defaults, n_entries):
+    for branch in missing:
+        columns[branch] = np.full(n_entries, defaults[branch], dtype=np.float64)
+    return columns
+
+
+def read_columns(file_path, tree_name, branches, entry_start=None, entry_stop=None, defaults=None, stats=None):
+    """Read ``branches`` of ``tree_name`` into a dict of NumPy arrays.
+
+    Branches listed in ``defaults`` that are missing from the tree (e.g.
+    genweight in data) are filled with the default value instead.
+    """
+    columns = {}
+    for _, chunk in iter_chunks(file_path, tree_name, branches, None, entry_start, entry_stop, defaults, stats):
+        for name, values in chunk.items():
+            columns.setdefault(name, []).append(values)
+    if not columns:
+        return {branch: np.zeros(0) for branch in branches}
+    return {name: parts[0] if len(parts) == 1 else np.concatenate(parts) for name, parts in columns.items()}
+
+
+def clip_range(n_entries, entry_start, entry_stop):
+    start = 0 if entry_start is None else min(max(entry_start, 0), n_entries)
+    stop = n_entries if entry_stop is None else min(max(entry_stop, start), n_entries)
+    return start, stop
+
+
+def is_parquet(file_path):
+    return file_path.endswith(".parquet")
+
+
+def init_stats(stats, file_path, present, n_branches):
+    if stats is None:
+        return
+    stats.setdefault("bytes_read", 0)
+    stats.setdefault("entries_read", 0)
+    stats["file_size"] = stats.get("file_size", 0) + os.path.getsize(file_path)
+    stats["branches_read"] = sorted(set(stats.get("branches_read", [])) | set(present))
+    stats["branches_total"] = max(stats.get("branches_total", 0), n_branches)
+
+
+def format_stats(stats):
+    fraction = stats["bytes_read"] / stats["file_size"] if stats.get("file_size") else 0.0
+    return (
+        f"read {len(stats['branches_read'])}/{stats['branches_total']} branches, "
+        f"{stats['entries_read']} entries, "
+        f"{stats['bytes_read'] / 1e6:.1f} MB of {stats['file_size'] / 1e6:.1f} MB ({100 * fraction:.1f}%)"
+    )
+
+
+class RootSource:
+    """An open TTree that can hand out any entry range of any set of branches."""
+
+    def __init__(self, file_path, tree_name):
+        import uproot
+
+        self.file_path = file_path
+        self.file = uproot.open(file_path)
+        self.tree = self.file[tree_name]
+        self.num_entries = self.tree.num_entries
+        self.n_branches = len(self.tree.keys(recursive=True))
+        self._baskets = {}
+        self._counted = set()
+
+    def __contains__(self, branch):
+        return branch in self.tree
+
+    def branch_names(self):
+        return list(self.tree.keys())
+
+    def read(self, branches, start, stop, stats=None):
+        if not branches:
+            return {}
+        columns = self.tree.arrays(list(branches), library="np", entry_start=start, entry_stop=stop)
+        if stats is not None:
+            stats["bytes_read"] += self._basket_bytes(branches, start, stop)
+        return dict(columns)
+
+    def _basket_bytes(self, branches, start, stop):
+        # Compressed size of the baskets overlapping [start, stop) not counted before
+        total = 0
+        for name in branches:
+            if name not in self._baskets:
+                branch = self.tree[name]
+                self._baskets[name] = [
+                    branch.basket_entry_start_stop(basket) + (branch.basket_compressed_bytes(basket),)
+                    for basket in range(branch.num_baskets)
+                ]
+            for basket, (basket_start, basket_stop, size) in enumerate(self._baskets[name]):
+                if basket_stop > start and basket_start < stop and (name, basket) not in self._counted:
+                    self._counted.add((name, basket))
+                    total += size
+        return total
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSource:
+    """A memory-mapped parquet file read one row group at a time."""
+
+    def __init__(self, file_path, tree_name=None):
+        import pyarrow.parquet as pq
+
+        self.file_path = file_path
+        self.file = pq.ParquetFile(file_path, memory_map=True)
+        self.metadata = self.file.metadata
+        self.num_entries = self.metadata.num_rows
+        self.names = set(self.file.schema_arrow.names)
+        self.n_branches = len(self.names)
+        self.group_starts = [0]
+        for group in range(self.metadata.num_row_groups):
+            self.group_starts.append(self.group_starts[-1] + self.metadata.row_group(group).num_rows)
+        self._last_group = None
+        self._counted = set()
+
+    def __contains__(self, branch):
+        return branch in self.names
+
+    def branch_names(self):
+        return list(self.file.schema_arrow.names)
+
+    def _row_group(self, group, branches, stats):
+        # Keep the last decoded row group: consecutive chunks often share it
+        key = (group, tuple(branches))
+        if self._last_group is None or self._last_group[0] != key:
+            self._last_group = (key, self.file.read_row_group(group, columns=list(branches)))
+            if stats is not None:
+                stats["bytes_read"] += self._row_group_bytes(group, branches)
+        return self._last_group[1]
+
+    def _row_group_bytes(self, group, branches):
+        row_group = self.metadata.row_group(group)
+        total = 0
+        for index in range(row_group.num_columns):
+            column = row_group.column(index)
+            name = column.path_in_schema.split(".")[0]
+            if name in branches and (group, name) not in self._counted:
+                self._counted.add((group, name))
+                total += column.total_compressed_size
+        return total
+
+    def read(self, branches, start, stop, stats=None):
+        if not branches:
+            return {}
+        parts = {name: [] for name in branches}
+        for group in range(self.metadata.num_row_groups):
+            group_start, group_stop = self.group_starts[group], self.group_starts[group + 1]
+            if group_stop <= start or group_start >= stop:
+                continue
+            table = self._row_group(group, branches, stats)
+            lo = max(start, group_start) - group_start
+            hi = min(stop, group_stop) - group_start
+            piece = table.slice(lo, hi - lo)
+            for name in branches:
+                parts[name].append(piece.column(name).to_numpy())
+        return {name: self._join(name, values) for name, values in parts.items()}
+
+    def _join(self, name, values):
+        # An empty range (start == stop, or an empty file) touches no row group
+        if not values:
+            return np.empty(0, dtype=self.file.schema_arrow.field(name).type.to_pandas_dtype())
+        return values[0] if len(values) == 1 else np.concatenate(values)
+
+    def close(self):
+        self._last_group = None
+
+
+# Callables (source, file_path, tree_name) -> source applied by open_source,
+# e.g. to serve derived columns next to the real branches (see derived.py)
+SOURCE_WRAPPERS = []
+
+
+def open_base_source(file_path, tree_name):
+    return ParquetSource(file_path) if is_parquet(file_path) else RootSource(file_path, tree_name)
+
+
+def open_source(file_path, tree_name):
+    source = open_base_source(file_path, tree_name)
+    for wrap in SOURCE_WRAPPERS:
+        source = wrap(source, file_path, tree_name)
+    return source
+
+
+def read_range(source, branches, start, stop, defaults=None, stats=None):
+    """Read ``branches`` for entries [start, stop) of an open source, filling defaults."""
+    defaults = defaults or {}
+    present, missing = _split_present(source, source.file_path, "", branches, defaults)
+    columns = source.read(present, start, stop, stats)
+    return _add_defaults(columns, missing, defaults, stop - start)
+
+
+def _nbytes(columns):
+    return sum(getattr(array, "nbytes", 0) for array in columns.values())
+
+
+def prefetch(read, ranges, depth=None, max_bytes=None):
+    """Yield (start, stop, read(start, stop)) for every range, reading ahead in the background.
+
+    Up to ``depth`` reads run ahead on one background thread - so reads of
+    a source never overlap each other, only the caller's processing - and
+    fewer once a chunk shows that ``depth`` of them would not fit in
+    ``max_bytes``. depth=0 reads synchronously. Defaults come from
+    $HHBBGG_PREFETCH and $HHBBGG_PREFETCH_BYTES.
+    """
+    depth = prefetch_depth() if depth is None else depth
+    max_bytes = prefetch_bytes() if max_bytes is None else max_bytes
+    ranges = iter(ranges)
+    if depth <= 0:
+        for start, stop in ranges:
+            yield start, stop, read(start, stop)
+        return
+
+    pending = deque()
+    allowed = depth
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="hhbbgg-prefetch") as pool:
+
+        def top_up():
+            while len(pending) < allowed:
+                next_range = next(ranges, None)
+                if next_range is None:
+                    return
+                pending.append((next_range, pool.submit(read, *next_range)))
+
+        try:
+            while True:
+                top_up()
+                if not pending:
+                    return
+                (start, stop), future = pending.popleft()
+                columns = future.result()
+                # Always keep at least one read in flight, even for chunks larger than the budget
+                allowed = max(1, min(depth, max_bytes // max(_nbytes(columns), 1)))
+                top_up()
+                yield start, stop, columns
+        finally:
+            # The caller stopped early: drop the reads that have not started
+            for _, future in pending:
+                future.cancel()
+
+
+def iter_chunks(file_path, tree_name, branches, chunk_size=DEFAULT_CHUNK_SIZE, entry_start=None, entry_stop=None, defaults=None, stats=None, depth=None):
+    """Yield (entry_start, columns) for consecutive chunks of ``chunk_size`` entries.
+
+    Each chunk is a fresh dict of arrays; nothing is kept once the caller
+    drops it. chunk_size=None reads the whole range as one chunk. The next
+    ``depth`` chunks are read ahead in the background (see ``prefetch``). If
+    ``stats`` is given it is updated with bytes_read, file_size,
+    entries_read, branches_read and branches_total (see format_stats).
+    """
+    defaults = defaults or {}
+    source = open_source(file_path, tree_name)
+    chunks = None
+    try:
+        present, missing = _split_present(source, file_path, tree_name, branches, defaults)
+        start, stop = clip_range(source.num_entries, entry_start, entry_stop)
+        chunk_size = chunk_size or max(stop - start, 1)
+        init_stats(stats, file_path, present, source.n_branches)
+        ranges = ((chunk_start, min(chunk_start + chunk_size, stop)) for chunk_start in range(start, stop, chunk_size))
+        chunks = prefetch(lambda lo, hi: source.read(present, lo, hi, stats), ranges, depth)
+        for chunk_start, chunk_stop, columns in chunks:
+            if stats is not None:
+                stats["entries_read"] += chunk_stop - chunk_start
+            yield chunk_start, _add_defaults(columns, missing, defaults, chunk_stop - chunk_start)
+    finally:
+        # Stop the background reads before the source goes away
+        if chunks is not None:
+            chunks.close()
+        source.close()
+
+
+def num_entries(file_path, tree_name):
+    source = open_source(file_path, tree_name)
+    try:
+        return source.num_entries
+    finally:
+        source.close()
@@ -0,0 +1,248 @@
+"""Headless rendering of stacked data/MC/ratio plots in parallel workers.
+
+A plot spec is a plain dict (picklable, so it can be sent to a worker):
+
+    {
+        "output": "plots/m_bb",              # written as plots/m_bb.pdf and .png
+        "data": Hist1D or None,
+        "backgrounds": [(label, Hist1D), ...],   # stacked in this order
+        "signal": (label, Hist1D) or None,
+        "signal_scale": 10,
+        "x_label": "M_{bb} (GeV)",
+        "ratio_range": (0.5, 1.5),
+    }
+
+Each worker runs ROOT in batch mode and builds the CMS style, labels and pad
+layout once; every plot after that only draws histograms into the cached
+template.
+"""
+
+import functools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from . import instrument
+from .histogram import Hist1D, HistVariations
+
+
+HEX_COLORS = ["#3f90da", "#ffa90e", "#bd1f01", "#94a4a2", "#832db6", "#a96b59", "#e76300", "#b9ac70", "#717581", "#92dadd"]
+
+FORMATS = ("pdf", "png")
+
+_template = {}
+
+
+def _root():
+    import ROOT
+
+    ROOT.gROOT.SetBatch(True)
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+    return ROOT
+
+
+def cms_template():
+    """Canvas, pads, legend and CMS labels, built once per process and reused."""
+    if _template:
+        return _template
+    ROOT = _root()
+    ROOT.gStyle.SetOptStat(0)
+    ROOT.gStyle.SetOptTitle(0)
+
+    canvas = ROOT.TCanvas("hhbbgg_canvas", "", 800, 800)
+    pad1 = ROOT.TPad("hhbbgg_pad1", "Main Plot", 0, 0.3, 1, 1)
+    pad1.SetBottomMargin(0.02)
+    pad1.SetTopMargin(0.1)
+    pad1.SetTicks(1, 1)
+    pad2 = ROOT.TPad("hhbbgg_pad2", "Ratio", 0, 0, 1, 0.3)
+    pad2.SetTopMargin(0.05)
+    pad2.SetBottomMargin(0.3)
+    pad2.SetTicks(1, 1)
+    # Grid from the pad instead of one TLine per grid line
+    pad2.SetGridx(True)
+    pad2.SetGridy(True)
+    canvas.cd()
+    pad1.Draw()
+    pad2.Draw()
+
+    labels = []
+    for text, font, size, x in (("CMS", 61, 0.04, 0.1), ("Work in Progress", 52, 0.03, 0.16), ("(13.6 TeV)", 42, 0.03, 0.83)):
+        label = ROOT.TLatex(x, 0.91, text)
+        label.SetNDC()
+        label.SetTextFont(font)
+        label.SetTextSize(size)
+        labels.append(label)
+
+    _template.update(ROOT=ROOT, canvas=canvas, pad1=pad1, pad2=pad2, labels=labels, colors=[ROOT.TColor.GetColor(h) for h in HEX_COLORS])
+    return _template
+
+
+def render(spec):
+    """Draw one plot spec into the template and write every requested format."""
+    template = cms_template()
+    ROOT = template["ROOT"]
+    name = os.path.basename(spec["output"])
+    keep = []
+
+    with instrument.stage("draw", sample_name=name):
+        pad1 = template["pad1"]
+        pad1.cd()
+        pad1.Clear()
+        pad1.SetLogy(bool(spec.get("log_y")))
+
+        stack = ROOT.THStack(f"stack_{name}", "")
+        legend = ROOT.TLegend(*spec.get("legend", (0.6, 0.6, 0.88, 0.88)))
+        legend.SetBorderSize(0)
+        legend.SetFillStyle(0)
+        mc_total = None
+        for index, (label, hist) in enumerate(spec.get("backgrounds", [])):
+            th1 = hist.to_th1(f"{name}_bkg{index}", label)
+            th1.SetFillColor(template["colors"][index % len(template["colors"])])
+            th1.SetLineColor(ROOT.kBlack)
+            stack.Add(th1)
+            keep.append(th1)
+            mc_total = hist if mc_total is None else mc_total + hist
+
+        data = spec["data"].to_th1(f"{name}_data", "Data") if spec.get("data") is not None else None
+        maximum = max(stack.GetMaximum() if mc_total is not None else 0.0, data.GetMaximum() if data else 0.0)
+        if mc_total is not None:
+            stack.SetMinimum(spec.get("y_min", 0.1 if spec.get("log_y") else 0))
+            stack.SetMaximum(maximum * (50 if spec.get("log_y") else 1.2))
+            stack.Draw("HIST")
+            stack.GetYaxis().SetTitle(spec.get("y_label", "Events"))
+            stack.GetYaxis().SetTitleSize(0.04)
+            stack.GetYaxis().SetTitleOffset(1.2)
+            stack.GetXaxis().SetLabelSize(0)
+        if data:
+            data.SetMarkerStyle(20)
+            data.SetMarkerSize(1.2)
+            data.SetMarkerColor(ROOT.kBlack)
+            data.Draw("SAME E1" if mc_total is not None else "E1")
+            legend.AddEntry(data, "Data", "lep")
+        if spec.get("signal"):
+            label, hist = spec["signal"]
+            signal_scale = spec.get("signal_scale", 1)
+            signal = hist.copy().scale(signal_scale).to_th1(f"{name}_signal", label)
+            signal.SetLineColor(ROOT.kRed)
+            signal.SetLineWidth(2)
+            signal.Draw("SAME HIST")
+            legend.AddEntry(signal, f"{label} (x{signal_scale})" if signal_scale != 1 else label, "l")
+            keep.append(signal)
+        for th1, (label, _) in zip(keep, spec.get("backgrounds", [])):
+            legend.AddEntry(th1, label, "f")
+        legend.Draw()
+        for label in template["labels"]:
+            label.Draw()
+
+        pad2 = template["pad2"]
+        pad2.cd()
+        pad2.Clear()
+        if data and mc_total is not None:
+            ratio = data.Clone(f"{name}_ratio")
+            ratio.Divide(mc_total.to_th1(f"{name}_mc", ""))
+            low, high = spec.get("ratio_range", (0.5, 1.5))
+            ratio.SetMinimum(low)
+            ratio.SetMaximum(high)
+            ratio.SetMarkerStyle(20)
+            ratio.SetMarkerSize(1.2)
+            ratio.GetXaxis().SetTitle(spec.get("x_label", ""))
+            ratio.GetXaxis().SetLabelSize(0.1)
+            ratio.GetXaxis().SetTitleSize(0.12)
+            ratio.GetYaxis().SetTitle("Data / MC")
+            ratio.GetYaxis().SetLabelSize(0.1)
+            ratio.GetYaxis().SetTitleSize(0.12)
+            ratio.GetYaxis().SetTitleOffset(0.4)
+            ratio.GetYaxis().SetNdivisions(505)
+            ratio.GetYaxis().CenterTitle(True)
+            ratio.Draw("EP")
+            axis = ratio.GetXaxis()
+            unity = ROOT.TLine(axis.GetXmin(), 1, axis.GetXmax(), 1)
+            unity.SetLineStyle(2)
+            unity.SetLineColor(ROOT.kRed)
+            unity.Draw()
+            keep.extend([ratio, unity])
+
+    with instrument.stage("print", sample_name=name):
+        directory = os.path.dirname(spec["output"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        canvas = template["canvas"]
+        canvas.cd()
+        canvas.Update()
+        outputs = []
+        for extension in spec.get("formats", FORMATS):
+            path = f"{spec['output']}.{extension}"
+            canvas.SaveAs(path)
+            outputs.append(path)
+    return outputs
+
+
+def _init_worker():
+    # Forked workers start with a copy of the parent's records; only ship their own
+    instrument.reset()
+    cms_template()
+
+
+def render_all(specs, n_workers=None):
+    """Render many plot specs in parallel worker processes; returns the written files."""
+    specs = list(specs)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(specs)) or 1
+    if n_workers == 1:
+        return [path for spec in specs for path in render(spec)]
+    # Several plots per task so the per-task overhead stays small next to drawing
+    chunksize = max(1, len(specs) // (4 * n_workers))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as pool:
+        if not instrument.enabled():
+            return [path for outputs in pool.map(render, specs, chunksize=chunksize) for path in outputs]
+        # Bring the draw/print stages of the workers back into the summary of this process
+        paths = []
+        for outputs, records in pool.map(functools.partial(instrument.call_and_take, render), specs, chunksize=chunksize):
+            instrument.merge_records(records)
+            paths.extend(outputs)
+        return paths
+
+
+def stack_specs(groups, config, output_dir="plots_output", signal_group=None, signal_scale=10, formats=FORMATS):
+    """Plot specs for every plot in ``groups`` as returned by analysis.run."""
+    from . import config as config_module
+
+    labels = {}
+    for sample in config_module.samples_from_config(config):
+        labels.setdefault(sample["group"], sample["label"] if sample["group"] == sample["name"] else sample["group"])
+    observables = config.get("observables", {})
+    backgrounds = [group for group in groups if group not in ("data", signal_group)]
+    # Only 1D histograms are stacked (the nominal row of weight variations);
+    # N-dimensional ones have to be projected by the caller first
+    plots = {}
+    for result in groups.values():
+        for name, hist in result.items():
+            plots.setdefault(name, []).append(hist)
+    skipped = sorted(name for name, hists in plots.items() if not all(isinstance(hist, (Hist1D, HistVariations)) for hist in hists))
+    if skipped:
+        warnings.warn(f"Not drawing {', '.join(skipped)}: only 1D histograms are stacked, project N-dimensional ones first", stacklevel=2)
+
+    def stacked(group, plot):
+        return nominal(groups[group][plot]) if plot in groups.get(group, {}) else None
+
+    specs = []
+    for plot in sorted(set(plots) - set(skipped)):
+        observable = plot.split("__")[0]
+        spec = {
+            "output": os.path.join(output_dir, plot),
+            "data": stacked("data", plot),
+            "backgrounds": [(labels.get(group, group), stacked(group, plot)) for group in backgrounds if plot in groups[group]],
+            "x_label": observables.get(observable, {}).get("label", observable),
+            "formats": formats,
+        }
+        if signal_group and plot in groups.get(signal_group, {}):
+            spec["signal"] = (labels.get(signal_group, signal_group), stacked(signal_group, plot))
+            spec["signal_scale"] = signal_scale
+        specs.append(spec)
+    return specs
+
+
+def nominal(hist):
+    """The Hist1D drawn for ``hist``: itself, or the nominal row of a HistVariations."""
+    if isinstance(hist, HistVariations):
+        return hist.variation("nominal" if "nominal" in hist.names else hist.names[0])
+    return hist
@@ -0,0 +1,143 @@
+"""On-disk cache of filled histograms, keyed by everything that went into them.
+
+The key is a hash of the input file fingerprints (path, size, mtime), the
+tree name and the histogram requests (observable and its branches, binning,
+cuts, blinding window, weights). Changing only drawing code - colours,
+legend position, ratio range - reuses the cached histograms instead of
+re-reading every tree. The cache is capped in size and evicts the least
+recently used entries.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+from . import engine, paths
+
+
+# Bump when the definition of a registered observable changes
+CACHE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def cache_path():
+    return paths.cache_dir("histograms")
+
+
+def max_bytes():
+    return int(os.environ.get("HHBBGG_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def _describe(histogram):
+    # Everything in a histogram request that changes its content
+    description = {key: value for key, value in histogram.items() if key != "name"}
+    description["branches"] = engine.histogram_branches([histogram])
+    return description
+
+
+def cache_key(file_paths, tree_name, histograms, extra=None):
+    payload = {
+        "version": CACHE_VERSION,
+        "files": [paths.file_fingerprint(file_path) for file_path in file_paths],
+        "tree": tree_name,
+        "histograms": [[engine.histogram_name(h), _describe(h)] for h in histograms],
+        "extra": extra,
+    }
+    text = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(cache_path(), f"{key}.pkl")
+
+
+def get(key):
+    """Return the cached object for ``key`` or None."""
+    path = _entry_path(key)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    # The modification time doubles as the last-used time for LRU eviction
+    os.utime(path)
+    return value
+
+
+def contains(key):
+    return os.path.exists(_entry_path(key))
+
+
+def put(key, value):
+    path = _entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    evict()
+
+
+def entries():
+    # (path, size, last used) of every cache entry, oldest first
+    result = []
+    for name in os.listdir(cache_path()):
+        if name.endswith(".pkl"):
+            path = os.path.join(cache_path(), name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((path, stat.st_size, stat.st_mtime))
+    return sorted(result, key=lambda entry: entry[2])
+
+
+def evict(limit=None):
+    """Remove least recently used entries until the cache fits in ``limit`` bytes."""
+    limit = max_bytes() if limit is None else limit
+    current = entries()
+    total = sum(size for _, size, _ in current)
+    for path, size, _ in current:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+    return total
+
+
+def clear():
+    return evict(0)
+
+
+def _manifest_path(name):
+    return os.path.join(paths.cache_dir("manifests"), f"{hashlib.sha256(name.encode()).hexdigest()[:16]}.json")
+
+
+def load_manifest(name):
+    """{sample name: cache key} recorded by the last run called ``name``."""
+    try:
+        with open(_manifest_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(name, keys):
+    path = _manifest_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(keys, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def cached(key, compute):
+    """Return the cached value for ``key``, computing and storing it if needed."""
+    value = get(key)
+    if value is None:
+        value = compute()
+        put(key, value)
+    return value
@@ -0,0 +1,164 @@
+"""Run per-sample processing in a process pool and merge the results.
+
+Samples are submitted largest file first (GJetPt40, Data_EraF, ...) so that
+the long jobs start immediately and the small ones fill the gaps at the end,
+which keeps all workers busy until about the same time.
+"""
+
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import derived as derived_store, engine, instrument, reader, result_cache, sumw_index
+
+
+def default_workers():
+    return int(os.environ.get("HHBBGG_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def _sample_size(sample):
+    try:
+        return os.path.getsize(sample["file_path"])
+    except OSError:
+        return 0
+
+
+def order_by_size(samples):
+    return sorted(samples, key=_sample_size, reverse=True)
+
+
+def fill_sample(sample, tree_name, histograms, chunk_size=None, use_cache=True, sums=None, cuts=(), derived=()):
+    """Fill the requested histograms of one sample, streaming it in chunks.
+
+    ``histograms`` is a list of requests as described in
+    engine.fill_streaming. Returns {name: Hist1D}. ``sums`` and ``cuts`` (a
+    preselection applied to every request) are passed on to
+    engine.fill_streaming; ``sums`` stays empty when the result comes from the cache.
+    The ``derived`` observables are read from the derived-column store.
+    """
+    chunk_size = chunk_size or reader.DEFAULT_CHUNK_SIZE
+    is_data = sample["kind"] == "data"
+
+    def compute():
+        # Bytes and branches read against the file size, for the --profile summary
+        stats = {} if instrument.enabled() else None
+        with derived_store.using(derived):
+            result = engine.fill_streaming(sample["file_path"], tree_name, histograms, chunk_size, is_data=is_data, stats=stats, cuts=cuts, sums=sums)
+        instrument.add_io(stats)
+        return result
+
+    with instrument.sample(sample["name"]):
+        if not use_cache:
+            return compute()
+        return result_cache.cached(sample_key(sample, tree_name, histograms, cuts), compute)
+
+
+def fill_and_sum(sample, tree_name, histograms, chunk_size=None, use_cache=True, cuts=(), derived=()):
+    """fill_sample plus the sumw_index entry of an MC sample read in full (None otherwise)."""
+    if sample["kind"] == "data":
+        return fill_sample(sample, tree_name, histograms, chunk_size, use_cache, cuts=cuts, derived=derived), None
+    sums = sumw_index.new_entry()
+    result = fill_sample(sample, tree_name, histograms, chunk_size, use_cache, sums, cuts, derived)
+    # Cached results, entry ranges and passes served from a stored entry index leave the sums incomplete
+    complete = sums.pop("complete", False)
+    return result, sums if complete else None
+
+
+def sample_key(sample, tree_name, histograms, cuts=()):
+    # Blinding only applies to data, so it is part of the key through is_data
+    return result_cache.cache_key([sample["file_path"]], tree_name, histograms, extra={"is_data": sample["kind"] == "data", "cuts": list(cuts)})
+
+
+def partition(samples, tree_name, histograms, cuts=()):
+    """Split samples into ({name: cached result}, [samples to process]).
+
+    A sample is reprocessed only when its input file (size, mtime) or the
+    histogram requests changed since its result was cached, so adding an
+    era or a background to config.json only reads the new files.
+    """
+    cached, stale = {}, []
+    for sample in samples:
+        result = result_cache.get(sample_key(sample, tree_name, histograms, cuts))
+        if result is None:
+            stale.append(sample)
+        else:
+            cached[sample["name"]] = result
+    return cached, stale
+
+
+def merge(a, b):
+    # Add two {name: Hist1D} results; histograms only in one of them are kept as they are
+    merged = dict(a)
+    for name, hist in b.items():
+        merged[name] = merged[name] + hist if name in merged else hist
+    return merged
+
+
+def run_samples(samples, task, n_workers=None):
+    """Run ``task(sample)`` for every sample and return {sample name: result}.
+
+    ``task`` must be picklable (a module-level function or a
+    functools.partial of one). With n_workers=1 everything runs in this
+    process, which is handy for debugging.
+    """
+    n_workers = n_workers or default_workers()
+    ordered = order_by_size(samples)
+    if n_workers == 1:
+        return {sample["name"]: task(sample) for sample in ordered}
+
+    results = {}
+    profiling = instrument.enabled()
+    # Forked workers start with a copy of this process's records; drop it so that they only ship their own
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(ordered)) or 1, initializer=instrument.reset if profiling else None) as pool:
+        if profiling:
+            futures = {pool.submit(instrument.call_and_take, task, sample): sample for sample in ordered}
+        else:
+            futures = {pool.submit(task, sample): sample for sample in ordered}
+        for future in as_completed(futures):
+            result = future.result()
+            if profiling:
+                result, records = result
+                instrument.merge_records(records)
+            results[futures[future]["name"]] = result
+    # Keep the input order so that stacks are drawn the same way every time
+    return {sample["name"]: results[sample["name"]] for sample in samples}
+
+
+def run_groups(samples, tree_name, histograms, n_workers=None, chunk_size=None, use_cache=True, scale=None, cuts=(), derived=()):
+    """Fill ``histograms`` for every sample in parallel and merge them per group.
+
+    All data eras end up in the "data" group; each background keeps its own
+    group unless config.json says otherwise. ``scale(sample)`` optionally
+    returns a factor applied to that sample before merging (e.g. the
+    cross-section normalization). Samples are always merged in the order
+    given, so a run that reuses cached results gives exactly the same
+    histograms as a full rerun. ``cuts`` is a preselection applied to every
+    histogram (see engine.fill_streaming); ``derived`` observables are read
+    from the derived-column store (see derived.py).
+    """
+    task = functools.partial(fill_and_sum, tree_name=tree_name, histograms=histograms, chunk_size=chunk_size, use_cache=use_cache, cuts=cuts, derived=list(derived))
+    if use_cache:
+        # Look up cached results here so that workers are only started for new or changed samples
+        per_sample, stale = partition(samples, tree_name, histograms, cuts)
+    else:
+        per_sample, stale = {}, samples
+    if stale:
+        filled = run_samples(stale, task, n_workers)
+        per_sample.update((name, result) for name, (result, _) in filled.items())
+        # The sums of weights were taken during the fill, so scale() does not read the files again
+        sumw_index.store(tree_name, {sample["file_path"]: filled[sample["name"]][1] for sample in stale if filled[sample["name"]][1] is not None})
+    return merge_groups(samples, per_sample, scale)
+
+
+def merge_groups(samples, per_sample, scale=None):
+    """Merge {sample name: result} into {group: result}, in the order of ``samples``."""
+    groups = {}
+    for sample in samples:
+        result = per_sample[sample["name"]]
+        factor = scale(sample) if scale else 1.0
+        if factor != 1.0:
+            # Scale copies so that results held by the cache are never modified
+            result = {name: hist.copy().scale(factor) for name, hist in result.items()}
+        group = sample["group"]
+        groups[group] = merge(groups.get(group, {}), result)
+    return groups
@@ -0,0 +1,190 @@
+"""Selections evaluated before the bulk of the branches is read.
+
+Cuts are expressions (see expressions.py). ``iter_selected`` evaluates them
+cut by cut, cheapest first, each one only on the entries that survived the
+previous ones and reading only the branches it needs. The remaining branches
+are read afterwards, limited to the entry range that still has survivors,
+and only the surviving entries are handed on. Chunks with no survivors never
+read anything beyond the cut branches.
+
+Blinding is a cut like any other, built with ``blinding_cut``; it is up to
+the caller to add it for data only (see engine.fill_streaming).
+
+The branches of the first cut (or all of them without cuts) of the next
+chunks are prefetched in the background while the current chunk is
+processed; reads of the other branches wait for the prefetch thread, so the
+source is never read from two threads at once.
+
+After a full pass the passing entry numbers are stored with entry_index, and
+later passes with the same cuts on the same file read only those entries.
+"""
+
+import ast
+import contextlib
+import threading
+
+import numpy as np
+
+from . import entry_index, expressions, instrument, observables as obs, reader, sumw_index
+
+
+def blinding_cut(observable, window):
+    # Keeps entries outside [low, high], the same inclusive edges as the plot scripts
+    low, high = window
+    return f"~((({observable}) >= {low}) & (({observable}) <= {high}))"
+
+
+def split_cut(cut):
+    """Split a top-level ``a & b & c`` into ["a", "b", "c"] so each part can be ordered on its own."""
+    node = expressions.parse(cut)
+    parts = []
+
+    def collect(node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+            collect(node.left)
+            collect(node.right)
+        elif isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            for value in node.values:
+                collect(value)
+        else:
+            parts.append(ast.unparse(node))
+
+    collect(node)
+    return parts
+
+
+def order_cuts(cuts):
+    """Split and deduplicate ``cuts`` and sort them by the number of branches they need."""
+    parts = []
+    for cut in cuts:
+        for part in split_cut(cut):
+            if part not in parts:
+                parts.append(part)
+    return sorted(parts, key=lambda part: len(obs.branches_for([part])))
+
+
+def _subset(arrays, keep):
+    return {name: value[keep] if np.ndim(value) else value for name, value in arrays.items()}
+
+
+# Surviving entries further apart than this are read as separate ranges, so
+# that long runs of rejected entries are not read just to be thrown away
+MAX_GAP = 20_000
+
+
+def iter_selected(file_path, tree_name, cuts, branches, chunk_size=reader.DEFAULT_CHUNK_SIZE, entry_start=None, entry_stop=None, defaults=None, stats=None, use_index=True, sums=None):
+    """Yield (chunk_start, index, columns, memo) for the entries passing all ``cuts``.
+
+    ``index`` holds the positions of the surviving entries inside the chunk,
+    ``columns`` every branch in ``branches`` (plus the cut branches) for those
+    entries only, and ``memo`` the already computed cut observables for the
+    same entries, ready to be passed on to observables.evaluate.
+
+    ``sums`` (a sumw_index.new_entry()) is updated with the sums of weights
+    of every entry read, before any cut, and gets ``"complete": True`` once
+    every entry of the file has been read. Passes served from a stored entry
+    index never see the rejected entries and leave it untouched.
+    """
+    cuts = order_cuts(cuts)
+    with instrument.stage("open"):
+        source = reader.open_source(file_path, tree_name)
+    chunks = None
+    try:
+        start, stop = reader.clip_range(source.num_entries, entry_start, entry_stop)
+        chunk_size = chunk_size or max(stop - start, 1)
+        all_branches = obs.branches_for(list(cuts)) + [b for b in branches if b not in obs.branches_for(list(cuts))]
+        reader.init_stats(stats, file_path, [b for b in all_branches if b in source], source.n_branches)
+
+        passing = entry_index.load(file_path, tree_name, cuts) if use_index and cuts else None
+        if passing is not None:
+            yield from _iter_indexed(source, passing, branches, start, stop, chunk_size, defaults, stats)
+            return
+
+        full_range = start == 0 and stop == source.num_entries
+        selected = []
+        lock = threading.Lock()
+        first = obs.branches_for([cuts[0]]) if cuts else list(branches)
+        if sums is not None:
+            first += [b for b in sumw_index.WEIGHT_BRANCHES if b not in first]
+        sample_name = instrument.current_sample()
+
+        def read_first(lo, hi):
+            with lock, instrument.stage("read", events=hi - lo, sample_name=sample_name):
+                return reader.read_range(source, first, lo, hi, defaults, stats)
+
+        ranges = ((chunk_start, min(chunk_start + chunk_size, stop)) for chunk_start in range(start, stop, chunk_size))
+        chunks = reader.prefetch(read_first, ranges)
+        for chunk_start, chunk_stop, columns in chunks:
+            if stats is not None:
+                stats["entries_read"] += chunk_stop - chunk_start
+            if sums is not None:
+                sumw_index.accumulate(sums, columns)
+            index = np.arange(chunk_stop - chunk_start)
+            memo = {}
+            for cut in cuts:
+                _load(source, columns, obs.branches_for([cut]), chunk_start, index, defaults, stats, lock)
+                with instrument.stage("select", events=len(index)):
+                    keep = np.asarray(obs.evaluate(cut, columns, memo), dtype=bool)
+                if np.ndim(keep) == 0:
+                    keep = np.full(len(index), bool(keep))
+                index = index[keep]
+                columns = _subset(columns, keep)
+                memo = _subset(memo, keep)
+                if not len(index):
+                    break
+            if cuts and use_index and full_range:
+                selected.append(chunk_start + index)
+            if not len(index):
+                continue
+            _load(source, columns, branches, chunk_start, index, defaults, stats, lock)
+            yield chunk_start, index, columns, memo
+
+        if sums is not None:
+            # Checked by the caller instead of opening the file again for its entry count
+            sums["complete"] = full_range
+        # Only a complete pass over the whole file gives a valid index
+        if cuts and use_index and full_range:
+            entry_index.save(file_path, tree_name, cuts, np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64))
+    finally:
+        # Stop the background reads before the source goes away
+        if chunks is not None:
+            chunks.close()
+        source.close()
+
+
+def _iter_indexed(source, passing, branches, start, stop, chunk_size, defaults, stats):
+    # Read only the entries listed in a stored entry index
+    passing = passing[(passing >= start) & (passing < stop)]
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        lo, hi = np.searchsorted(passing, [chunk_start, chunk_stop])
+        if lo == hi:
+            continue
+        index = passing[lo:hi] - chunk_start
+        if stats is not None:
+            stats["entries_read"] += len(index)
+        columns = _load(source, {}, branches, chunk_start, index, defaults, stats)
+        yield chunk_start, index, columns, {}
+
+
+def _spans(index, max_gap=MAX_GAP):
+    # Split sorted positions into (first, last + 1, positions) runs without large gaps
+    breaks = np.flatnonzero(np.diff(index) > max_gap) + 1
+    for part in np.split(index, breaks):
+        yield int(part[0]), int(part[-1]) + 1, part
+
+
+def _load(source, columns, branches, chunk_start, index, defaults, stats, lock=None):
+    # Read the branches not loaded yet, only over the spans of surviving entries
+    needed = [b for b in branches if b not in columns]
+    if not needed or not len(index):
+        return columns
+    parts = {name: [] for name in needed}
+    for lo, hi, part in _spans(index):
+        with lock or contextlib.nullcontext(), instrument.stage("read", events=hi - lo):
+            values = reader.read_range(source, needed, chunk_start + lo, chunk_start + hi, defaults, stats)
+        for name in needed:
+            parts[name].append(values[name][part - lo])
+    for name in needed:
+        columns[name] = parts[name][0] if len(parts[name]) == 1 else np.concatenate(parts[name])
+    return columns
@@ -0,0 +1,289 @@
+"""Split the input trees into entry-range shards that can run on any node.
+
+A shard is a self-contained, JSON-serializable task:
+
+    {"id": "GJetPt40.00003", "kind": "histograms", "sample": {...sample dict...},
+     "tree_name": "DiphotonTree/data_125_13TeV_NOTAG", "entry_start": 6000000,
+     "entry_stop": 8000000, "chunk_size": 500000, "histograms": [...], "cuts": {...},
+     "weights": {"mc": [...], "data": [...]}, "blind": [...], "preselection": [...],
+     "derived": [...]}
+
+``run_shard`` needs nothing but the task and the input file. Shards can be
+run locally with ``run_local`` or written to a ``FileQueue`` on shared
+storage (AFS/EOS/NFS work area) and drained by any number of nodes with
+
+    python -m hhbbgg.shards drain /path/to/queue --workers 8
+
+Partial results are merged per sample in entry order, whatever order the
+shards finished in. Entry counts, and therefore unweighted histograms and
+cut flows, are identical to a single-process run; sums of non-integer
+weights agree up to floating-point rounding, since the chunks are added in a
+different grouping.
+"""
+
+import argparse
+import contextlib
+import functools
+import glob
+import json
+import os
+import pickle
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import cutflow, derived as derived_store, engine, instrument, reader, scheduler
+
+
+DEFAULT_SHARD_SIZE = 2_000_000
+
+KINDS = ("histograms", "cutflow")
+
+# Seconds between two touches of a running shard by its worker
+HEARTBEAT = 60
+
+
+def make_shards(samples, tree_name, histograms=(), cuts=None, shard_size=DEFAULT_SHARD_SIZE, chunk_size=None, weights=None, blind=(), preselection=(), derived=()):
+    """One task per ``shard_size`` entries of every sample.
+
+    With ``cuts`` ({name: expression}) the tasks fill cut flows (see
+    cutflow.py) with the config.json ``weights`` and the data blinding cuts
+    ``blind``, otherwise the histograms of engine.fill_streaming, after the
+    ``preselection`` cuts. The ``derived`` observables are read from the
+    derived-column store (see derived.py).
+    """
+    chunk_size = chunk_size or reader.DEFAULT_CHUNK_SIZE
+    # Shard boundaries on chunk boundaries, so every shard reads the same chunks as a single pass
+    shard_size = max(chunk_size, shard_size // chunk_size * chunk_size)
+    tasks = []
+    for sample in samples:
+        n_entries = reader.num_entries(sample["file_path"], tree_name)
+        # An empty tree still gets one (empty) shard, so that every sample has a result
+        for index, start in enumerate(range(0, max(n_entries, 1), shard_size)):
+            tasks.append({
+                "id": f"{sample['name']}.{index:05d}",
+                "kind": "cutflow" if cuts is not None else "histograms",
+                "sample": sample,
+                "tree_name": tree_name,
+                "entry_start": start,
+                "entry_stop": min(start + shard_size, n_entries),
+                "chunk_size": chunk_size,
+                "histograms": list(histograms),
+                "cuts": dict(cuts) if cuts is not None else None,
+                "weights": weights,
+                "blind": list(blind),
+                "preselection": list(preselection),
+                "derived": list(derived),
+            })
+    return tasks
+
+
+def run_shard(task):
+    """Process one shard; returns {name: Hist1D} or a CutFlow."""
+    sample = task["sample"]
+    is_data = sample["kind"] == "data"
+    with instrument.sample(sample["name"]), derived_store.using(task.get("derived")):
+        if task["kind"] == "cutflow":
+            return cutflow.fill_file(
+                sample["file_path"], task["tree_name"], task["cuts"], task["histograms"], task["chunk_size"], is_data,
+                cutflow.sample_weights(sample, task.get("weights")), entry_start=task["entry_start"], entry_stop=task["entry_stop"],
+                blind=task.get("blind", ()),
+            )
+        if task["kind"] == "histograms":
+            return engine.fill_streaming(
+                sample["file_path"], task["tree_name"], task["histograms"], task["chunk_size"], is_data,
+                cuts=task.get("preselection", ()), entry_start=task["entry_start"], entry_stop=task["entry_stop"],
+            )
+    raise ValueError(f"Unknown shard kind {task['kind']!r}, expected one of {KINDS}")
+
+
+def merge_results(tasks, results):
+    """Merge shard results into {sample name: result}, in entry order.
+
+    ``results`` is {task id: result}; a missing shard is an error rather than
+    a silently incomplete histogram.
+    """
+    missing = [task["id"] for task in tasks if task["id"] not in results]
+    if missing:
+        raise ValueError(f"{len(missing)} shard(s) have no result, e.g. {missing[0]}")
+    merged = {}
+    for task in sorted(tasks, key=lambda task: (task["sample"]["name"], task["entry_start"])):
+        name = task["sample"]["name"]
+        result = results[task["id"]]
+        if name not in merged:
+            merged[name] = result
+        elif task["kind"] == "cutflow":
+            merged[name] = merged[name] + result
+        else:
+            merged[name] = scheduler.merge(merged[name], result)
+    return merged
+
+
+def run_local(tasks, n_workers=None):
+    """Run every shard in a local process pool; returns {task id: result}."""
+    n_workers = n_workers or scheduler.default_workers()
+    if n_workers == 1:
+        return {task["id"]: run_shard(task) for task in tasks}
+    if not instrument.enabled():
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)) or 1) as pool:
+            return dict(zip((task["id"] for task in tasks), pool.map(run_shard, tasks)))
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)) or 1, initializer=instrument.reset) as pool:
+        for task, (result, records) in zip(tasks, pool.map(functools.partial(instrument.call_and_take, run_shard), tasks)):
+            instrument.merge_records(records)
+            results[task["id"]] = result
+    return results
+
+
+class FileQueue:
+    """Shard queue in a directory on storage shared by all nodes.
+
+    pending/<id>.json are waiting, running/<id>.json are claimed (by an
+    atomic rename, so each shard is taken by exactly one worker) and
+    done/<id>.pkl hold the results. A worker touches its running file every
+    ``heartbeat`` seconds, so ``requeue`` only takes back shards whose
+    worker stopped, however long a live shard takes.
+    """
+
+    def __init__(self, directory, heartbeat=HEARTBEAT):
+        self.directory = directory
+        self.heartbeat = heartbeat
+        for state in ("pending", "running", "done"):
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, task_id, extension="json"):
+        return os.path.join(self.directory, state, f"{task_id}.{extension}")
+
+    def _ids(self, state, extension="json"):
+        return sorted(os.path.basename(path)[: -len(extension) - 1] for path in glob.glob(self._path(state, "*", extension)))
+
+    def submit(self, tasks):
+        for task in tasks:
+            path = self._path("pending", task["id"])
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(task, f)
+            os.replace(f"{path}.tmp", path)
+
+    def claim(self):
+        """Take one pending shard, or return None when there are none left."""
+        for task_id in self._ids("pending"):
+            running = self._path("running", task_id)
+            try:
+                os.rename(self._path("pending", task_id), running)
+            except FileNotFoundError:
+                # Another worker was faster
+                continue
+            # Touch so that requeue() can tell live shards from abandoned ones
+            os.utime(running)
+            with open(running) as f:
+                return json.load(f)
+        return None
+
+    def complete(self, task, result):
+        path = self._path("done", task["id"], "pkl")
+        tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        # A shard requeued meanwhile (e.g. a node that stalled) may be pending or running again
+        # elsewhere; that run gives the same result, so this one is kept
+        for state in ("running", "pending"):
+            try:
+                os.remove(self._path(state, task["id"]))
+            except FileNotFoundError:
+                continue
+
+    @contextlib.contextmanager
+    def beating(self, task):
+        """Touch the running file of ``task`` in the background until the block ends."""
+        path = self._path("running", task["id"])
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat):
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    # Requeued or completed elsewhere
+                    return
+
+        thread = threading.Thread(target=beat, name=f"hhbbgg-heartbeat-{task['id']}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def requeue(self, max_age=3600):
+        """Put shards without a heartbeat for ``max_age`` seconds (crashed nodes) back in pending.
+
+        ``max_age`` has to be well above the heartbeat interval.
+        """
+        now = time.time()
+        requeued = []
+        for task_id in self._ids("running"):
+            path = self._path("running", task_id)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.rename(path, self._path("pending", task_id))
+                    requeued.append(task_id)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def status(self):
+        return {state: len(self._ids(state, "pkl" if state == "done" else "json")) for state in ("pending", "running", "done")}
+
+    def results(self):
+        results = {}
+        for task_id in self._ids("done", "pkl"):
+            with open(self._path("done", task_id, "pkl"), "rb") as f:
+                results[task_id] = pickle.load(f)
+        return results
+
+    def drain(self):
+        """Process shards until the queue is empty; returns how many this worker did."""
+        n_done = 0
+        while True:
+            task = self.claim()
+            if task is None:
+                return n_done
+            with self.beating(task):
+                result = run_shard(task)
+            self.complete(task, result)
+            n_done += 1
+
+
+def _drain(directory):
+    return FileQueue(directory).drain()
+
+
+def drain(directory, n_workers=1):
+    """Drain the queue in ``directory`` with ``n_workers`` local processes."""
+    if n_workers == 1:
+        return _drain(directory)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        return sum(pool.map(_drain, [directory] * n_workers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work on a queue of hhbbgg shards on shared storage")
+    parser.add_argument("command", choices=["drain", "status", "requeue"])
+    parser.add_argument("directory", help="queue directory")
+    parser.add_argument("--workers", type=int, default=1, help="local processes draining the queue")
+    parser.add_argument("--max-age", type=float, default=3600, help=f"requeue shards without a heartbeat for this long [s] (workers beat every {HEARTBEAT} s)")
+    args = parser.parse_args(argv)
+
+    if args.command == "drain":
+        print(f"Processed {drain(args.directory, args.workers)} shard(s)")
+    elif args.command == "requeue":
+        print(f"Requeued {len(FileQueue(args.directory).requeue(args.max_age))} shard(s)")
+    print(json.dumps(FileQueue(args.directory).status()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
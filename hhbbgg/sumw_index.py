@@ -0,0 +1,130 @@
+"""Persistent index of entry counts and sums of weights per input file.
+
+The cross-section normalization ``cross_section * total_luminosity / n_events``
+needs the sum of genweight over the whole sample. Instead of looping over the
+tree on every run, the sums are computed once and stored in a small JSON
+index keyed by file path, tree name, size and mtime. A file that changes on
+disk no longer matches its entry and is scanned again. The histogram fill
+pass (engine.fill_streaming with ``sums``) takes the same sums on the way, so
+a file is only scanned on its own when no fill pass has read it.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from . import paths, reader
+
+
+INDEX_NAME = "sumw_index.json"
+
+# Branches summed for every file; the ones missing in a tree (e.g. in data)
+# count as 1.0 per entry, like getattr(event, "genweight", 1.0)
+WEIGHT_BRANCHES = ("genweight", "weight", "weight_central")
+
+
+def index_path():
+    return os.path.join(paths.cache_dir(), INDEX_NAME)
+
+
+def _load():
+    try:
+        with open(index_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(index):
+    # Write to a temporary file first so a crash never leaves a broken index
+    path = index_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _key(file_path, tree_name):
+    return f"{os.path.abspath(file_path)}::{tree_name}"
+
+
+def new_entry():
+    entry = {"n_entries": 0}
+    for name in WEIGHT_BRANCHES:
+        entry[f"sum_{name}"] = 0.0
+        entry[f"sum_{name}2"] = 0.0
+    return entry
+
+
+def accumulate(entry, columns):
+    """Add one chunk of WEIGHT_BRANCHES (missing ones filled with 1.0) to an index entry."""
+    entry["n_entries"] += len(columns[WEIGHT_BRANCHES[0]])
+    for name in WEIGHT_BRANCHES:
+        values = np.asarray(columns[name], dtype=np.float64)
+        entry[f"sum_{name}"] += float(values.sum())
+        entry[f"sum_{name}2"] += float((values * values).sum())
+    return entry
+
+
+def scan(file_path, tree_name):
+    """Compute the index entry of one file by streaming its weight branches."""
+    defaults = {name: 1.0 for name in WEIGHT_BRANCHES}
+    entry = new_entry()
+    for _, columns in reader.iter_chunks(file_path, tree_name, list(WEIGHT_BRANCHES), defaults=defaults):
+        accumulate(entry, columns)
+    return entry
+
+
+def cached(file_path, tree_name):
+    """The stored entry of ``file_path`` if it is still up to date, else None."""
+    _, size, mtime = paths.file_fingerprint(file_path)
+    entry = _load().get(_key(file_path, tree_name))
+    if entry and entry["size"] == size and entry["mtime_ns"] == mtime:
+        return entry
+    return None
+
+
+def store(tree_name, entries):
+    """Add {file_path: entry} computed elsewhere, e.g. during a fill pass, in one write."""
+    stored = {}
+    for file_path, entry in entries.items():
+        _, size, mtime = paths.file_fingerprint(file_path)
+        stored[file_path] = dict(entry, size=size, mtime_ns=mtime)
+    if stored:
+        index = _load()
+        index.update((_key(file_path, tree_name), entry) for file_path, entry in stored.items())
+        _save(index)
+    return stored
+
+
+def lookup(file_path, tree_name):
+    """Return the sums for ``file_path``, scanning it only if the index is stale.
+
+    The entry has n_entries and sum_<branch> / sum_<branch>2 for every branch
+    in WEIGHT_BRANCHES. scheduler.run_groups stores the sums taken during its
+    fill pass, so after a run this never reads the file again.
+    """
+    entry = cached(file_path, tree_name)
+    if entry is not None:
+        return entry
+    return store(tree_name, {file_path: scan(file_path, tree_name)})[file_path]
+
+
+def sum_genweight(file_path, tree_name):
+    # n_events used in the cross-section normalization of the plot scripts
+    return lookup(file_path, tree_name)["sum_genweight"]
+
+
+def normalization(file_path, tree_name, cross_section, luminosity):
+    return cross_section * luminosity / sum_genweight(file_path, tree_name)
+
+
+def invalidate(file_path=None):
+    """Drop the entries of ``file_path`` (all trees), or the whole index."""
+    if file_path is None:
+        _save({})
+        return
+    prefix = f"{os.path.abspath(file_path)}::"
+    index = {key: value for key, value in _load().items() if not key.startswith(prefix)}
+    _save(index)
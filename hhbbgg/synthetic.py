@@ -0,0 +1,97 @@
+"""Synthetic DiphotonTree files for benchmarks and offline checks.
+
+The generated files have the branches the analysis uses - lead/sublead
+photon and b-jet kinematics, photon MVA ID and its WP90 flag,
+HHbbggCandidate_*, genweight, weight and weight_central - plus any number of
+filler branches to mimic the hundreds of branches of a real HiggsDNA output.
+Nothing needs network or EOS access.
+"""
+
+import os
+
+import numpy as np
+
+from . import kinematics, reader
+
+
+def generate_columns(n_entries, n_extra_branches=0, seed=1, is_data=False):
+    """Dict of branch name -> array for ``n_entries`` synthetic events."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for prefix, pt_offset in (("lead", 35.0), ("sublead", 25.0)):
+        pt = pt_offset + rng.exponential(30.0, n_entries)
+        eta = rng.uniform(-2.5, 2.5, n_entries)
+        columns[f"{prefix}_pt"] = pt.astype(np.float32)
+        columns[f"{prefix}_eta"] = eta.astype(np.float32)
+        columns[f"{prefix}_phi"] = rng.uniform(-np.pi, np.pi, n_entries).astype(np.float32)
+        columns[f"{prefix}_energyRaw"] = (pt * np.cosh(eta)).astype(np.float32)
+        mva = rng.uniform(-1.0, 1.0, n_entries)
+        columns[f"{prefix}_mvaID"] = mva.astype(np.float32)
+        columns[f"{prefix}_mvaID_WP90"] = mva > -0.2
+    for prefix in ("lead_bjet", "sublead_bjet"):
+        columns[f"{prefix}_pt"] = (25.0 + rng.exponential(40.0, n_entries)).astype(np.float32)
+        columns[f"{prefix}_eta"] = rng.uniform(-2.5, 2.5, n_entries).astype(np.float32)
+        columns[f"{prefix}_phi"] = rng.uniform(-np.pi, np.pi, n_entries).astype(np.float32)
+        columns[f"{prefix}_mass"] = np.abs(rng.normal(12.0, 4.0, n_entries)).astype(np.float32)
+
+    # The HH candidate is the sum of the two photons and the two b-jets
+    p4 = [a + b for a, b in zip(kinematics.pair_p4(columns, "diphoton"), kinematics.pair_p4(columns, "dijet"))]
+    candidate = kinematics.kinematics(*p4, ["pt", "eta", "phi", "mass"])
+    for name, values in candidate.items():
+        columns[f"HHbbggCandidate_{name}"] = values.astype(np.float32)
+
+    if not is_data:
+        columns["genweight"] = rng.normal(1.0, 0.3, n_entries)
+        columns["weight_central"] = rng.normal(1.0, 0.05, n_entries).astype(np.float32)
+        columns["weight"] = (columns["genweight"] * columns["weight_central"]).astype(np.float32)
+    for index in range(n_extra_branches):
+        columns[f"extra_{index:03d}"] = rng.normal(0.0, 1.0, n_entries).astype(np.float32)
+    return columns
+
+
+def write_root(file_path, columns, tree_name=reader.DEFAULT_TREE, basket_size=100_000):
+    import uproot
+
+    n_entries = len(next(iter(columns.values())))
+    with uproot.recreate(file_path) as file:
+        file.mktree(tree_name, {name: values.dtype for name, values in columns.items()})
+        # Several extends so that every branch has several baskets, like real files
+        for start in range(0, n_entries, basket_size):
+            file[tree_name].extend({name: values[start:start + basket_size] for name, values in columns.items()})
+    return file_path
+
+
+def write_parquet(file_path, columns, row_group_size=100_000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table(columns)
+    pq.write_table(table, file_path, row_group_size=row_group_size)
+    return file_path
+
+
+def make_sample(directory, name, n_entries, file_format="root", n_extra_branches=0, seed=1, is_data=False):
+    """Write one synthetic sample and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    columns = generate_columns(n_entries, n_extra_branches, seed, is_data)
+    file_path = os.path.join(directory, f"{name}.{file_format}")
+    if file_format == "parquet":
+        return write_parquet(file_path, columns)
+    return write_root(file_path, columns)
+
+
+def make_samples(directory, n_entries, file_format="root", n_extra_branches=0, names=None):
+    """Synthetic stand-ins for the config.json samples; returns sample dicts."""
+    names = names or ["Data_EraE", "Data_EraF", "GGJets", "GJetPt20To40", "GJetPt40"]
+    samples = []
+    for seed, name in enumerate(names, start=1):
+        is_data = name.startswith("Data")
+        file_path = make_sample(directory, name, n_entries, file_format, n_extra_branches, seed, is_data)
+        samples.append({
+            "name": name,
+            "label": name,
+            "file_path": file_path,
+            "kind": "data" if is_data else "mc",
+            "group": "data" if is_data else name,
+        })
+    return samples
@@ -0,0 +1,64 @@
+"""Weight variations filled together with the nominal histogram.
+
+A variation is a name and a weight expression. ``weight_variations`` lists
+the nominal weight (the product of the MC weights), the genweight-only
+weight and one variation per ``weight_*Up``/``weight_*Down`` branch found in
+the file. A variation branch takes the place of weight_central in the MC
+weights, or multiplies them when weight_central is not among them.
+
+``"weight_variations": "auto"`` in config.json fills them for every MC
+sample with the config.json "weights" (see analysis.histogram_requests).
+"""
+
+import os
+
+from . import expressions, reader
+
+
+DEFAULT_WEIGHTS = ("genweight", "weight_central")
+
+
+def variation_branches(branch_names):
+    return sorted(name for name in branch_names if name.startswith("weight_") and name.endswith(("Up", "Down")))
+
+
+def product(weights):
+    # "genweight * weight_central"; expressions are parenthesized
+    return " * ".join(weight if expressions.is_name(weight) else f"({weight})" for weight in weights) or "1"
+
+
+def varied(weights, branch):
+    """The MC ``weights`` with variation ``branch`` instead of weight_central."""
+    if "weight_central" in weights:
+        return [branch if weight == "weight_central" else weight for weight in weights]
+    return list(weights) + [branch]
+
+
+def weight_variations(branch_names, weights=DEFAULT_WEIGHTS):
+    """Ordered {variation name: weight expression} for a tree with ``branch_names`` and MC ``weights``."""
+    variations = {"nominal": product(weights), "genweight_only": "genweight"}
+    for branch in variation_branches(branch_names):
+        variations[branch[len("weight_"):]] = product(varied(weights, branch))
+    return variations
+
+
+def discover(file_path, tree_name, weights=DEFAULT_WEIGHTS):
+    source = reader.open_source(file_path, tree_name)
+    try:
+        return weight_variations(source.branch_names(), weights)
+    finally:
+        source.close()
+
+
+def discover_common(file_paths, tree_name, weights=DEFAULT_WEIGHTS):
+    """Variations found in every one of ``file_paths``, so that each can be filled for all of them.
+
+    Files that do not exist yet are skipped; reading them fails later with a clearer message.
+    """
+    common = None
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            continue
+        variations = discover(file_path, tree_name, weights)
+        common = variations if common is None else {name: expression for name, expression in common.items() if name in variations}
+    return common if common is not None else weight_variations([], weights)
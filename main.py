@@ -1,88 +1,200 @@
-import ROOT
-import json
+"""Command-line entry point of the analysis.
 
+    python main.py process --config config.json --workers 8
+    python main.py plot --output-dir plots_output
+    python main.py cutflow
+    python main.py bench --entries 1000000
+    python main.py cache info
 
+Only the standard library is imported at startup. ROOT, NumPy and pyarrow
+are imported by the subcommand that needs them, so ``--help`` or
+``cache info`` return immediately.
+"""
 
-@lorentz_vector
-def create_lorentz_vector(pt, eta, phi, mass):
-    lv = ROOT.TLorentzVector()
-    lv.SetPtEtaPhiM(pt, eta, phi, mass)
-    return lv
+import argparse
+import os
+import pickle
+import sys
 
 
-@file_processing
 def process_file(file_path, tree_name):
-    file = ROOT.TFile(file_path, "READ")
-    tree = file.Get(tree_name)
+    # Diphoton eta and mass of every event, photons built from pt, eta, phi and energyRaw
+    from hhbbgg import kinematics
 
-    invariant_etas = []
-    invariant_masses = []
+    result = kinematics.process_file(file_path, tree_name, pair="diphoton", observables=("eta", "mass"))
+    return result["eta"], result["mass"]
 
-    if not tree:
-        print(f"Tree not found in file: {file_path}")
-    else:
-        for event in tree:
-            lead_pt = event.lead_pt
-            lead_eta = event.lead_eta
-            lead_phi = event.lead_phi
-            lead_energyRaw = event.lead_energyRaw
 
-            sublead_pt = event.sublead_pt
-            sublead_eta = event.sublead_eta
-            sublead_phi = event.sublead_phi
-            sublead_energyRaw = event.sublead_energyRaw
+def create_cms_style():
+    # Canvas, main pad and legend with the CMS labels already drawn
+    import ROOT
 
-            lv1 = create_lorentz_vector(lead_pt, lead_eta, lead_phi, lead_energyRaw)
-            lv2 = create_lorentz_vector(sublead_pt, sublead_eta, sublead_phi, sublead_energyRaw)
-            invariant_eta = (lv1 + lv2).Eta()
-            invariant_mass = (lv1 + lv2).M()
+    from hhbbgg import render
 
-            invariant_etas.append(invariant_eta)
-            invariant_masses.append(invariant_mass)
+    template = render.cms_template()
+    template["pad1"].cd()
+    for label in template["labels"]:
+        label.Draw()
+    legend = ROOT.TLegend(0.6, 0.6, 0.8, 0.8)
+    return template["canvas"], template["pad1"], legend
 
-    file.Close()
-    return invariant_etas, invariant_masses
 
+def _profile(args):
+    # --profile sets HHBBGG_PROFILE, which worker processes inherit
+    from hhbbgg import instrument
 
+    if args.profile:
+        instrument.enable()
+    return instrument
 
 
+def _load_config(args):
+    from hhbbgg import config as config_module
 
-@CMS_Style
+    config = config_module.load_config(args.config)
+    if args.derived:
+        config["derived"] = True
+    return config
 
-def create_cms_style():
-    # Create a canvas
-    canvas = ROOT.TCanvas("canvas", "Invariant Eta", 800, 800)
-
-    # Divide the canvas into two pads, one for the main plot and one for the ratio plot
-    pad1 = ROOT.TPad("pad1", "Main Plot", 0, 0.3, 1, 1)
-    pad1.SetBottomMargin(0.02)
-    pad1.SetTopMargin(0.1)
-    pad1.SetTicks(1, 1)
-    pad1.Draw()
-    pad1.cd()
-
-    # Create legend
-    legend = ROOT.TLegend(0.6, 0.6, 0.8, 0.8)
 
-    # Add CMS text
-    cms_label = ROOT.TLatex()
-    cms_label.SetNDC()
-    cms_label.SetTextFont(61)
-    cms_label.SetTextSize(0.04)
-    cms_label.DrawLatex(0.1, 0.91, "CMS")
-
-    # Add "Work in Progress"
-    work_label = ROOT.TLatex()
-    work_label.SetNDC()
-    work_label.SetTextFont(52)
-    work_label.SetTextSize(0.03)
-    work_label.DrawLatex(0.16, 0.91, "Work in Progress")
-
-    # Add energy information
-    energy_label = ROOT.TLatex()
-    energy_label.SetNDC()
-    energy_label.SetTextFont(42)
-    energy_label.SetTextSize(0.03)
-    energy_label.DrawLatex(0.83, 0.91, "(13.6 TeV)")
-
-    return canvas, pad1, legend
+def _process(args):
+    from hhbbgg import analysis
+
+    instrument = _profile(args)
+    groups = analysis.run(_load_config(args), n_workers=args.workers, chunk_size=args.chunk_size, use_cache=not args.no_cache, backend=args.backend)
+    if args.output:
+        with open(args.output, "wb") as f:
+            pickle.dump(groups, f, protocol=pickle.HIGHEST_PROTOCOL)
+    for group, result in groups.items():
+        for name, hist in sorted(result.items()):
+            print(f"{group:<30} {name:<30} {hist!r}")
+    instrument.print_summary()
+    return 0
+
+
+def _plot(args):
+    from hhbbgg import analysis, render
+
+    instrument = _profile(args)
+    config = _load_config(args)
+    if args.input:
+        with open(args.input, "rb") as f:
+            groups = pickle.load(f)
+    else:
+        groups = analysis.run(config, n_workers=args.workers, backend=args.backend)
+    specs = render.stack_specs(groups, config, args.output_dir, signal_group=args.signal_group, signal_scale=args.signal_scale, formats=args.formats)
+    for path in render.render_all(specs, n_workers=args.workers):
+        print(path)
+    instrument.print_summary()
+    return 0
+
+
+def _cutflow(args):
+    from hhbbgg import cutflow
+
+    instrument = _profile(args)
+    flows = cutflow.run(args.config, n_workers=args.workers, chunk_size=args.chunk_size, use_cache=not args.no_cache)
+    print(cutflow.format_tables(flows, weighted=not args.events))
+    instrument.print_summary()
+    return 0
+
+
+def _bench(args):
+    from hhbbgg import benchmark
+
+    return benchmark.main(args.bench_args)
+
+
+def _cache_entries():
+    from hhbbgg import paths
+
+    base = paths.cache_dir()
+    for name in sorted(os.listdir(base)):
+        path = os.path.join(base, name)
+        size, count = 0, 0
+        for root, _, files in os.walk(path) if os.path.isdir(path) else [(base, [], [name])]:
+            for file_name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                count += 1
+        yield name, path, count, size
+
+
+def _cache(args):
+    import shutil
+
+    entries = list(_cache_entries())
+    if args.action == "clear":
+        for name, path, _, _ in entries:
+            if args.what and name not in args.what:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            print(f"Removed {path}")
+        return 0
+    for name, path, count, size in entries:
+        print(f"{name:<20} {count:>8} files {size / 1e6:>10.1f} MB  {path}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="HH/X->YH->bbgg analysis")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def common(sub):
+        sub.add_argument("--config", default="config.json")
+        sub.add_argument("--workers", type=int, default=None, help="worker processes (threads for the rdataframe backend)")
+        sub.add_argument("--profile", action="store_true", help="print the time and memory of every stage at the end (same as HHBBGG_PROFILE=1)")
+        return sub
+
+    process = common(subparsers.add_parser("process", help="fill every plot of every sample"))
+    process.add_argument("--chunk-size", type=int, default=None)
+    process.add_argument("--no-cache", action="store_true", help="ignore and do not update the histogram cache")
+    process.add_argument("--backend", choices=["numpy", "rdataframe"], default="numpy")
+    process.add_argument("--derived", action="store_true", help="read the derived observables from the sidecar store (same as \"derived\": true in the config)")
+    process.add_argument("--output", default=None, help="pickle the histograms per group to this file")
+    process.set_defaults(func=_process)
+
+    plot = common(subparsers.add_parser("plot", help="render stacked data/MC/ratio plots"))
+    plot.add_argument("--input", default=None, help="histograms written by 'process --output' (default: process now, using the cache)")
+    plot.add_argument("--backend", choices=["numpy", "rdataframe"], default="numpy")
+    plot.add_argument("--derived", action="store_true", help="read the derived observables from the sidecar store (same as \"derived\": true in the config)")
+    plot.add_argument("--output-dir", default="plots_output")
+    plot.add_argument("--signal-group", default=None)
+    plot.add_argument("--signal-scale", type=float, default=10)
+    plot.add_argument("--formats", nargs="+", default=["pdf", "png"])
+    plot.set_defaults(func=_plot)
+
+    flow = common(subparsers.add_parser("cutflow", help="print the cut flow of every sample"))
+    flow.add_argument("--chunk-size", type=int, default=None)
+    flow.add_argument("--no-cache", action="store_true")
+    flow.add_argument("--events", action="store_true", help="raw event counts instead of weighted yields")
+    flow.set_defaults(func=_cutflow)
+
+    # Every option after "bench" is passed on to hhbbgg.benchmark, including --help
+    bench = subparsers.add_parser("bench", help="run the benchmarks (options as in python -m hhbbgg.benchmark)", add_help=False)
+    bench.set_defaults(func=_bench)
+
+    cache = subparsers.add_parser("cache", help="show or clear the on-disk caches")
+    cache.add_argument("action", choices=["info", "clear"])
+    cache.add_argument("what", nargs="*", help="only these caches (e.g. histograms entry_index derived)")
+    cache.set_defaults(func=_cache)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,22 @@
-import ROOT
-
-def create_lorentz_vector(pt, eta, phi, m):
-    lv = ROOT.TLorentzVector()
-    lv.SetPtEtaPhiM(pt, eta, phi, m)
-    return lv
-
-def process_file(file_path, tree_name, blind_mass=False):
-    file_1 = ROOT.TFile(file_path, "READ")
-    tree = file_1.Get(tree_name)
-
-    invariant_masses = []
-
-    if not tree:
-        print(f"Tree not found in file: {file_path}")
-    else:
-        for event in tree:
-            lead_bjet_pt = event.lead_bjet_pt
-            lead_bjet_eta = event.lead_bjet_eta
-            lead_bjet_phi = event.lead_bjet_phi
-            lead_bjet_mass = event.lead_bjet_mass
-            sublead_bjet_pt = event.sublead_bjet_pt
-            sublead_bjet_eta = event.sublead_bjet_eta
-            sublead_bjet_phi = event.sublead_bjet_phi
-            sublead_bjet_mass = event.sublead_bjet_mass
-
-            # Default genweight to 1.0 if not available
-            genweight = getattr(event, "genweight", 1.0)
-
-            lv1 = create_lorentz_vector(lead_bjet_pt, lead_bjet_eta, lead_bjet_phi, lead_bjet_mass)
-            lv2 = create_lorentz_vector(sublead_bjet_pt, sublead_bjet_eta, sublead_bjet_phi, sublead_bjet_mass)
+import os
+import sys
 
-            lv = lv1 + lv2
-            invariant_mass = lv.M()
-
-            # Apply blinding
-            if blind_mass and 110 <= invariant_mass <= 140:
-                continue
-
-            invariant_masses.append((invariant_mass, genweight))
+import ROOT
 
-    file_1.Close()
-    return invariant_masses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from hhbbgg import engine
 
-def process_signal_file(file_path, tree_name, blind_mass=False):
-    file_1 = ROOT.TFile(file_path, "READ")
-    tree = file_1.Get(tree_name)
+BLIND_WINDOW = (110, 140)
 
-    signal_masses = []
 
-    if not tree:
-        print(f"Tree not found in file: {file_path}")
-    else:
-        for event in tree:
-            pt = event.HHbbggCandidate_pt
-            eta = event.HHbbggCandidate_eta
-            phi = event.HHbbggCandidate_phi
-            mass = event.HHbbggCandidate_mass
-            genweight = getattr(event, "genweight", 1.0)
+def process_file(file_path, tree_name):
+    # Dijet mass (float32) and genweight (float64) of every event, 12 bytes each
+    return engine.collect(file_path, tree_name, ["m_bb"], weights=["genweight"])
 
-            # Apply blinding
-            if blind_mass and 110 <= mass <= 140:
-                continue
 
-            lv_signal = create_lorentz_vector(pt, eta, phi, mass)
-            signal_masses.append((lv_signal.M(), genweight))
+def process_signal_file(file_path, tree_name):
+    return engine.collect(file_path, tree_name, ["m_HH"], weights=["genweight"])
 
-    file_1.Close()
-    return signal_masses
 
 data_file_paths = ["../../output_root/Data_EraE.root", "../../output_root/Data_EraF.root", "../../output_root/Data_EraG.root"]
 
@@ -102,48 +52,23 @@ integrated_luminosities = {
 }
 
 blind_mass = True  # Set this to True to enable blinding
+blind_window = BLIND_WINDOW if blind_mass else None
 
-data_invariant_masses = []
-signal_masses = []
-
+hist_data = ROOT.TH1F("hist_data", "", 20, 80, 180)
 for data_file_path in data_file_paths:
-    data_sample_name = data_file_path.split("/")[-1].split(".")[0]
-    luminosity = integrated_luminosities.get(data_sample_name, 1.0)
-    data_invariant_masses.extend(process_file(data_file_path, tree_name, blind_mass))
-
-    file = ROOT.TFile(data_file_path, "READ")
-    tree = file.Get(tree_name)
-    if tree:
-        for event in tree:
-            pt = event.HHbbggCandidate_pt
-            eta = event.HHbbggCandidate_eta
-            phi = event.HHbbggCandidate_phi
-            mass = event.HHbbggCandidate_mass
-            genweight = getattr(event, "genweight", 1.0)  # Default genweight to 1.0 if not available
-
-            # Apply blinding
-            if blind_mass and 110 <= mass <= 140:
-                continue
-
-            lv_signal = create_lorentz_vector(pt, eta, phi, mass)
-            signal_masses.append((lv_signal.M(), genweight))
-    file.Close()
+    data_events = process_file(data_file_path, tree_name)
+    engine.fill_th1(hist_data, data_events.result(), "m_bb", blind=blind_window, is_data=True)
 
 # Signal and background processing
-signal_masses = process_signal_file(signal_file, tree_name)
-
-hist_data = ROOT.TH1F("hist_data", "", 20, 80, 180)
-for mass, genweight in data_invariant_masses:
-    hist_data.Fill(mass, genweight)
+signal_events = process_signal_file(signal_file, tree_name)
 
 hist_signal = ROOT.TH1F("hist_signal", "Signal", 20, 80, 180)
 total_luminosity = sum(integrated_luminosities.values())
-n_events_signal = sum([w for _, w in signal_masses])
+n_events_signal = float(signal_events["genweight"].sum())
 cross_section_signal = cross_sections["GluGluToHH"]
 weight_signal = cross_section_signal * total_luminosity / n_events_signal
 
-for mass, genweight in signal_masses:
-    hist_signal.Fill(mass, genweight * weight_signal)
+engine.fill_th1(hist_signal, signal_events.result(), "m_HH", scale=weight_signal)
 
 background_hists = {}
 
@@ -151,19 +76,15 @@ hex_colors = ["#3f90da", "#ffa90e", "#bd1f01", "#94a4a2", "#832db6", "#a96b59",
 rgb_colors = [(int(h[1:3], 16), int(h[3:5], 16), int(h[5:], 16)) for h in hex_colors]
 
 for idx, (background_file, bg_name) in enumerate(background_files):
-    bg_invariant_masses = process_file(background_file, tree_name)
+    bg_events = process_file(background_file, tree_name)
     bg_hist = ROOT.TH1F(f"hist_{bg_name}", f"{bg_name} Invariant Mass", 20, 80, 180)
     
-    file = ROOT.TFile.Open(background_file)
-    tree = file.Get(tree_name)
-    n_events = sum([getattr(event, "genweight", 1.0) for event in tree])
-    file.Close()
+    n_events = float(bg_events["genweight"].sum())
     
     cross_section = cross_sections.get(bg_name, 1.0)
     weight = cross_section * total_luminosity / n_events
     
-    for mass, genweight in bg_invariant_masses:
-        bg_hist.Fill(mass, genweight * weight)
+    engine.fill_th1(bg_hist, bg_events.result(), "m_bb", scale=weight)
     
     color_idx = idx % len(rgb_colors)
     color = ROOT.TColor.GetColor(*rgb_colors[color_idx])
@@ -0,0 +1,18 @@
+import pytest
+
+from hhbbgg import synthetic
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Every test gets its own, empty cache directory
+    path = tmp_path / "cache"
+    monkeypatch.setenv("HHBBGG_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def samples(tmp_path):
+    # Small synthetic data and MC samples with the DiphotonTree branches
+    pytest.importorskip("uproot")
+    return synthetic.make_samples(str(tmp_path / "samples"), 5_000, names=["Data_EraE", "GGJets", "GJetPt40"])
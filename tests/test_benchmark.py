@@ -0,0 +1,18 @@
+from hhbbgg import benchmark
+
+
+def test_startup_is_measured_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = {row["command"]: row for row in benchmark.measure_startup(repeats=1)}
+    for label, _ in benchmark.STARTUP_COMMANDS:
+        assert rows[label]["wall_s"] is not None, rows[label]["loaded"]
+    # The help of every command is printed without importing any heavy module
+    assert rows["main.py --help"]["loaded"] == "-"
+    assert rows["main.py bench --help"]["loaded"] == "-"
+
+
+def test_failed_commands_are_not_timed(monkeypatch):
+    monkeypatch.setattr(benchmark, "STARTUP_COMMANDS", (("main.py nonsense", ["nonsense"]),))
+    row = benchmark.measure_startup(repeats=1)[0]
+    assert row["wall_s"] is None and row["loaded"].startswith("failed")
+    assert "failed" in benchmark.format_startup_table([row])
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from hhbbgg import cutflow, engine, observables as obs, reader
+
+
+@pytest.fixture
+def config(samples):
+    return {
+        "data_file_paths": [sample["file_path"] for sample in samples if sample["kind"] == "data"],
+        "background_files": [{"file_path": sample["file_path"]} for sample in samples if sample["kind"] == "mc"],
+        "tree_name": reader.DEFAULT_TREE,
+        "weights": {"mc": ["genweight", "weight_central"], "data": []},
+        "cutflow": {"photon_id": "lead_mvaID_WP90 & sublead_mvaID_WP90", "lead_pt": "lead_pt > 50"},
+        "blinding": {"m_bb": [110, 140]},
+        "observables": {"m_bb": {"bins": 20, "range": [80, 180]}},
+    }
+
+
+def read(sample, branches):
+    columns = reader.read_columns(sample["file_path"], reader.DEFAULT_TREE, obs.branches_for(branches), defaults=engine.WEIGHT_DEFAULTS)
+    return {name: np.asarray(obs.evaluate(name, columns)) for name in branches}
+
+
+def test_mc_uses_the_config_weights(config, samples):
+    flows = cutflow.run(config, n_workers=1, use_cache=False)
+    values = read(samples[1], ["genweight", "weight_central"])
+    _, weighted, _ = flows["GGJets"].passing([])
+    assert weighted == pytest.approx(float(np.sum(values["genweight"] * values["weight_central"])))
+
+
+def test_data_is_blinded(config, samples):
+    flows = cutflow.run(config, n_workers=1, use_cache=False)
+    values = read(samples[0], ["m_bb", "lead_pt"])
+    outside = (values["m_bb"] < 110) | (values["m_bb"] > 140)
+    assert flows["Data_EraE"].passing([])[0] == int(outside.sum())
+    assert flows["Data_EraE"].passing(["lead_pt"])[0] == int((outside & (values["lead_pt"] > 50)).sum())
+
+
+def test_event_efficiencies_use_event_counts(config):
+    flows = cutflow.run(config, n_workers=1, use_cache=False)
+    for row in flows["GGJets"].table(weighted=False)[1:]:
+        assert row["efficiency"] == pytest.approx(row["events"] / flows["GGJets"].passing([])[0])
+    assert "%" in cutflow.format_tables(flows, weighted=False)
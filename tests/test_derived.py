@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pytest
+
+from hhbbgg import analysis, derived, observables as obs, paths, reader
+
+from test_incremental import make_config
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_run_from_sidecars_matches_on_the_fly(samples, n_workers):
+    pytest.importorskip("pyarrow")
+    config = dict(make_config(samples), plots=[{"observable": "m_bb"}, {"observable": "m_gg", "selection": "photon_id"}])
+    expected = analysis.run(config, n_workers=n_workers, use_cache=False)
+    assert not os.path.exists(paths.cache_dir("derived")) or not os.listdir(paths.cache_dir("derived"))
+    config["derived"] = ["m_bb", "m_gg"]
+    # Twice: the first run writes the sidecars, the second one only reads them
+    for _ in range(2):
+        filled = analysis.run(config, n_workers=n_workers, use_cache=False)
+        for sample in samples:
+            for name in config["derived"]:
+                assert os.path.exists(derived.sidecar_path(sample["file_path"], reader.DEFAULT_TREE, name))
+        for group, result in expected.items():
+            for name, hist in result.items():
+                np.testing.assert_array_equal(filled[group][name].sumw, hist.sumw)
+                np.testing.assert_array_equal(filled[group][name].sumw2, hist.sumw2)
+    # The store is only switched on while the tasks run
+    assert not obs.MATERIALIZED
+    assert derived.wrap_source not in reader.SOURCE_WRAPPERS
+
+
+def test_config_columns():
+    assert derived.config_columns({}) == []
+    assert derived.config_columns({"derived": True}) == list(derived.DERIVED_COLUMNS)
+    assert derived.config_columns({"derived": ["m_bb"]}) == ["m_bb"]
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from hhbbgg import engine, entry_index, reader, selection
+
+
+CUTS = ["lead_mvaID_WP90 & sublead_mvaID_WP90", "lead_pt > 50"]
+
+HISTOGRAMS = [
+    {"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180), "selection": CUTS[0]},
+    {"name": "m_gg", "observable": "m_gg", "bins": 20, "range": (80, 180), "selection": CUTS[0]},
+]
+
+
+def test_encode_decode_round_trip():
+    for entries in ([], [0], [3, 4, 5, 1_000_000, 4_000_000_000]):
+        np.testing.assert_array_equal(entry_index.decode(entry_index.encode(entries)), np.asarray(entries, dtype=np.int64))
+
+
+def test_save_load_round_trip(samples):
+    file_path = samples[1]["file_path"]
+    entries = np.array([1, 2, 10, 4_999], dtype=np.int64)
+    assert entry_index.load(file_path, reader.DEFAULT_TREE, CUTS) is None
+    entry_index.save(file_path, reader.DEFAULT_TREE, CUTS, entries)
+    np.testing.assert_array_equal(entry_index.load(file_path, reader.DEFAULT_TREE, CUTS), entries)
+    assert entry_index.load(file_path, reader.DEFAULT_TREE, CUTS[:1]) is None
+    # A changed input file gets a different key
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert entry_index.load(file_path, reader.DEFAULT_TREE, CUTS) is None
+
+
+def test_indexed_pass_matches_full_pass(samples):
+    file_path = samples[1]["file_path"]
+    first = engine.fill_streaming(file_path, reader.DEFAULT_TREE, HISTOGRAMS, chunk_size=1_000, cuts=CUTS[1:])
+    passing = entry_index.load(file_path, reader.DEFAULT_TREE, [CUTS[1]] + engine.common_cuts(HISTOGRAMS))
+    assert passing is not None and 0 < len(passing) < 5_000
+    stats = {}
+    second = engine.fill_streaming(file_path, reader.DEFAULT_TREE, HISTOGRAMS, chunk_size=1_000, cuts=CUTS[1:], stats=stats)
+    # Only the stored passing entries are read the second time
+    assert stats["entries_read"] == len(passing)
+    for name, hist in first.items():
+        np.testing.assert_array_equal(second[name].sumw, hist.sumw)
+        np.testing.assert_array_equal(second[name].sumw2, hist.sumw2)
+
+
+def test_config_preselection_uses_the_index(samples):
+    from hhbbgg import analysis
+    from test_incremental import make_config
+
+    config = dict(make_config(samples), preselection=["photon_id"])
+    first = analysis.run(config, n_workers=1, use_cache=False)
+    for sample in samples:
+        requests = analysis.histogram_requests(config)
+        cuts = selection.order_cuts(analysis.preselection(config) + engine.common_cuts(requests, sample["kind"] == "data"))
+        assert entry_index.load(sample["file_path"], reader.DEFAULT_TREE, cuts) is not None
+    # The same plots with the preselection as their own selection
+    selected = dict(make_config(samples), plots=[{"observable": "m_bb", "selection": "photon_id"}, {"observable": "m_gg", "selection": "photon_id"}])
+    expected = analysis.run(selected, n_workers=1, use_cache=False)
+    for run in (first, analysis.run(config, n_workers=1, use_cache=False)):
+        for group, result in expected.items():
+            for (name, hist), (_, want) in zip(run[group].items(), result.items()):
+                np.testing.assert_allclose(hist.sumw, want.sumw, rtol=1e-12)
+                np.testing.assert_allclose(hist.sumw2, want.sumw2, rtol=1e-12)
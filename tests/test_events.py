@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from hhbbgg import engine
+from hhbbgg.events import EventBuffer
+from hhbbgg.histogram import Hist1D
+
+
+def chunk(start, n):
+    values = np.arange(start, start + n, dtype=np.float64)
+    return {"m_bb": values + 0.25, "genweight": values / 10}
+
+
+def test_extend_grows_across_chunks():
+    buffer = EventBuffer.for_observables(["m_bb"])
+    for start in range(0, 5_000, 700):
+        buffer.extend(chunk(start, min(700, 5_000 - start)))
+    assert len(buffer) == 5_000 and buffer.capacity >= 5_000
+    np.testing.assert_array_equal(buffer["m_bb"], np.arange(5_000) + 0.25)
+    np.testing.assert_array_equal(buffer["genweight"], np.arange(5_000) / 10)
+    assert buffer["m_bb"].dtype == np.float32 and buffer["genweight"].dtype == np.float64
+    with pytest.raises(KeyError):
+        buffer.extend({"m_bb": np.zeros(3)})
+
+
+def test_scalars_are_broadcast():
+    buffer = EventBuffer.for_observables(["m_bb"]).extend({"m_bb": np.array([1.0, 2.0, 3.0]), "genweight": 1.0})
+    np.testing.assert_array_equal(buffer["genweight"], [1.0, 1.0, 1.0])
+    assert len(buffer) == 3
+
+
+def test_slices_are_views_and_masks_copies():
+    buffer = EventBuffer.for_observables(["m_bb"]).extend(chunk(0, 100))
+    view = buffer[10:20]
+    assert len(view) == 10
+    assert np.shares_memory(view["m_bb"], buffer["m_bb"])
+    view["m_bb"][0] = -1.0
+    assert buffer["m_bb"][10] == -1.0
+    selected = buffer[buffer["m_bb"] > 50]
+    assert not np.shares_memory(selected["m_bb"], buffer["m_bb"])
+
+
+def test_trim_and_nbytes():
+    buffer = EventBuffer.for_observables(["m_bb"]).extend(chunk(0, 1_000)).extend(chunk(1_000, 500))
+    assert buffer.capacity > 1_500
+    # A float32 mass and a float64 weight: 12 bytes per event, spare capacity not counted
+    assert buffer.nbytes == 12 * 1_500
+    values = buffer["m_bb"].copy()
+    buffer.trim()
+    assert buffer.capacity == len(buffer) == 1_500
+    np.testing.assert_array_equal(buffer["m_bb"], values)
+    assert sum(array.nbytes for array in buffer.columns().values()) == buffer.nbytes
+
+
+def test_result_fills_like_the_arrays():
+    buffer = EventBuffer.for_observables(["m_bb"]).extend(chunk(80, 100))
+    hist = engine.fill(buffer.result(), "m_bb", Hist1D(20, (80, 180)))
+    expected = Hist1D(20, (80, 180)).fill(np.arange(80, 180) + 0.25, np.arange(80, 180) / 10)
+    np.testing.assert_allclose(hist.sumw, expected.sumw)
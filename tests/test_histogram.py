@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from hhbbgg.histogram import Hist1D, SparseHist
+
+
+EDGES = [np.linspace(100, 180, 9), np.array([80.0, 100, 110, 140, 180])]
+
+# Lower edge of bin 1, an inner edge, the upper edge and values outside, as ROOT places them
+FLOW_VALUES = np.array([0.0, 1.0, 4.0, -0.5, 5.0, np.nan, 3.999])
+FLOW_SLOTS = [1, 2, 5, 0, 5, 5, 4]
+
+
+def test_flow_bins_follow_root():
+    hist = Hist1D(4, (0, 4)).fill(FLOW_VALUES)
+    np.testing.assert_array_equal(hist.bin_indices(FLOW_VALUES), FLOW_SLOTS)
+    # A value on the upper edge (and NaN) ends up in the overflow, not in the last bin
+    np.testing.assert_array_equal(hist.sumw, [1, 1, 1, 0, 1, 3])
+    assert hist.integral() == 3.0 and hist.integral(flow=True) == 7.0
+    np.testing.assert_array_equal(hist.values(), hist.sumw[1:-1])
+
+
+def test_variable_edges_and_weights():
+    hist = Hist1D(None, edges=[0.0, 1.0, 10.0, 100.0])
+    assert hist.n_bins == 3
+    hist.fill(np.array([0.5, 5.0, 9.99, 10.0, 50.0]), np.array([1.0, 2.0, 3.0, -1.0, 0.5]))
+    np.testing.assert_allclose(hist.sumw, [0, 1, 5, -0.5, 0])
+    np.testing.assert_allclose(hist.sumw2, [0, 1, 13, 1.25, 0])
+    np.testing.assert_allclose(hist.errors(), np.sqrt([1, 13, 1.25]))
+    np.testing.assert_allclose(hist.centers(), [0.5, 5.5, 55.0])
+    with pytest.raises(ValueError):
+        Hist1D(None, edges=[0.0, 2.0, 1.0])
+
+
+def test_add_sum_and_scale():
+    rng = np.random.default_rng(4)
+    values, weights = rng.uniform(-1, 5, 1_000), rng.normal(1.0, 0.3, 1_000)
+    whole = Hist1D(6, (0, 4)).fill(values, weights)
+    parts = [Hist1D(6, (0, 4)).fill(values[i:i + 250], weights[i:i + 250]) for i in range(0, 1_000, 250)]
+    merged = sum(parts)
+    np.testing.assert_allclose(merged.sumw, whole.sumw)
+    np.testing.assert_allclose(merged.sumw2, whole.sumw2)
+    added = parts[0] + parts[1]
+    # + copies; the operands keep their content
+    np.testing.assert_allclose(parts[0].sumw + parts[1].sumw, added.sumw)
+    scaled = whole.copy().scale(2.5)
+    np.testing.assert_allclose(scaled.sumw, 2.5 * whole.sumw)
+    np.testing.assert_allclose(scaled.sumw2, 6.25 * whole.sumw2)
+    with pytest.raises(ValueError):
+        whole + Hist1D(5, (0, 4))
+
+
+@pytest.mark.parametrize("edges", [np.linspace(0, 4, 5), np.array([0.0, 0.5, 2.0, 3.0, 4.0])])
+def test_th1_round_trip(edges):
+    ROOT = pytest.importorskip("ROOT")
+    values = np.array([0.0, 0.7, 1.0, 2.5, 4.0, -0.5, 3.999])
+    weights = np.array([1.0, 2.0, 0.5, 3.0, 1.5, 2.0, -1.0])
+    hist = Hist1D(None, edges=edges).fill(values, weights)
+    th1 = hist.to_th1("test_th1_round_trip", kind="D")
+    filled = ROOT.TH1D("test_th1_filled", "", len(edges) - 1, np.ascontiguousarray(edges))
+    filled.Sumw2()
+    for value, weight in zip(values, weights):
+        filled.Fill(value, weight)
+    for index in range(len(edges) + 1):
+        # The same bin, including the flow bins, as ROOT's own Fill
+        assert th1.GetBinContent(index) == pytest.approx(filled.GetBinContent(index))
+        assert th1.GetBinError(index) == pytest.approx(filled.GetBinError(index))
+    back = Hist1D.from_th1(th1)
+    np.testing.assert_allclose(back.edges, hist.edges)
+    np.testing.assert_allclose(back.sumw, hist.sumw)
+    np.testing.assert_allclose(back.sumw2, hist.sumw2)
+    assert Hist1D.from_th1(hist.to_th1("test_th1_float")).integral() == pytest.approx(hist.integral())
+
+
+def random_values(seed, n=2_000):
+    rng = np.random.default_rng(seed)
+    # Wider than the axes so that the flow bins are filled too
+    return [rng.uniform(90, 190, n), rng.uniform(70, 190, n)], rng.normal(1.0, 0.5, n)
+
+
+def dense(values, weights):
+    # Reference with explicit flow bins, like SparseHist.to_dense
+    edges = [np.concatenate([[-np.inf], axis_edges, [np.inf]]) for axis_edges in EDGES]
+    sumw, _ = np.histogramdd(values, bins=edges, weights=weights)
+    sumw2, _ = np.histogramdd(values, bins=edges, weights=weights * weights)
+    return sumw, sumw2
+
+
+def test_fill_matches_dense_histogram():
+    values, weights = random_values(1)
+    hist = SparseHist(EDGES, ["m_gg", "m_bb"]).fill(values, weights)
+    for got, want in zip(hist.to_dense(), dense(values, weights)):
+        np.testing.assert_allclose(got, want)
+    assert hist.integral(flow=True) == pytest.approx(weights.sum())
+
+
+def test_projections_match_dense_sums():
+    values, weights = random_values(2)
+    hist = SparseHist(EDGES, ["m_gg", "m_bb"]).fill(values, weights)
+    sumw, sumw2 = dense(values, weights)
+    projected = hist.project("m_bb")
+    np.testing.assert_allclose(projected.sumw, sumw.sum(axis=0))
+    np.testing.assert_allclose(projected.sumw2, sumw2.sum(axis=0))
+    np.testing.assert_allclose(hist.project(0).sumw, sumw.sum(axis=1))
+    # 120 and 135 fall in bins 3 and 4 of the 10 GeV axis (index 0 is the underflow)
+    window = hist.project("m_bb", where={"m_gg": (120, 135)})
+    np.testing.assert_allclose(window.sumw, sumw[3:5].sum(axis=0))
+    inside = (values[0] >= 120) & (values[0] < 140)
+    reference = Hist1D(None, edges=EDGES[1]).fill(values[1][inside], weights[inside])
+    np.testing.assert_allclose(window.sumw, reference.sumw)
+    np.testing.assert_allclose(window.sumw2, reference.sumw2)
+
+
+def test_chunked_fill_and_addition_match_one_fill():
+    values, weights = random_values(3)
+    whole = SparseHist(EDGES).fill(values, weights)
+    chunked = SparseHist(EDGES)
+    for start in range(0, len(weights), 300):
+        chunked.fill([axis_values[start:start + 300] for axis_values in values], weights[start:start + 300])
+    first = SparseHist(EDGES).fill([axis_values[:1000] for axis_values in values], weights[:1000])
+    second = SparseHist(EDGES).fill([axis_values[1000:] for axis_values in values], weights[1000:])
+    added = first + second
+    assert sum([first, second]).nnz == added.nnz
+    for hist in (chunked, added):
+        np.testing.assert_array_equal(hist.index, whole.index)
+        np.testing.assert_allclose(hist.sumw, whole.sumw)
+        np.testing.assert_allclose(hist.sumw2, whole.sumw2)
+    # Adding never changes the operands
+    np.testing.assert_allclose(first.integral(flow=True), weights[:1000].sum())
+
+
+def test_incompatible_binning_cannot_be_added():
+    with pytest.raises(ValueError):
+        SparseHist(EDGES) + SparseHist([EDGES[0], EDGES[1][1:]])
@@ -0,0 +1,37 @@
+import numpy as np
+
+from hhbbgg import analysis, reader
+
+
+def make_config(samples):
+    return {
+        "data_file_paths": [sample["file_path"] for sample in samples if sample["kind"] == "data"],
+        "background_files": [{"file_path": sample["file_path"], "cross_section": 10.0} for sample in samples if sample["kind"] == "mc"],
+        "tree_name": reader.DEFAULT_TREE,
+        "integrated_luminosities": {"Data_EraE": 2.0},
+        "selections": {"photon_id": "lead_mvaID_WP90 & sublead_mvaID_WP90"},
+        "blinding": {"m_bb": [110, 140]},
+        "observables": {"m_bb": {"bins": 20, "range": [80, 180]}, "m_gg": {"bins": 20, "range": [80, 180]}},
+        "plots": [{"observable": "m_bb"}, {"observable": "m_gg", "selection": "photon_id"}],
+    }
+
+
+def assert_same(a, b):
+    assert list(a) == list(b)
+    for group in a:
+        assert set(a[group]) == set(b[group])
+        for name, hist in a[group].items():
+            np.testing.assert_array_equal(b[group][name].sumw, hist.sumw)
+            np.testing.assert_array_equal(b[group][name].sumw2, hist.sumw2)
+
+
+def test_cached_rerun_matches_full_run(samples):
+    config = make_config(samples)
+    full = analysis.run(config, n_workers=1, use_cache=False)
+    # Cache all but the last sample, as if it had just been added to config.json
+    analysis.run(make_config(samples[:-1]), n_workers=1)
+    assert analysis.status(config) == {"Data_EraE": "cached", "GGJets": "cached", "GJetPt40": "new"}
+    incremental = analysis.run(config, n_workers=1)
+    assert set(analysis.status(config).values()) == {"cached"}
+    assert_same(full, incremental)
+    assert_same(full, analysis.run(config, n_workers=1))
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from hhbbgg import engine, instrument, reader, scheduler
+from hhbbgg.histogram import Hist1D
+
+
+HISTOGRAMS = [{"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180)}]
+
+
+def events(stage_name):
+    return {row["sample"]: row["events"] for row in instrument.rows() if row["stage"] == stage_name}
+
+
+def test_pooled_runs_count_each_event_once(samples, monkeypatch):
+    monkeypatch.setenv(instrument.ENV_VAR, "1")
+    instrument.reset()
+    expected = {sample["name"]: reader.num_entries(sample["file_path"], reader.DEFAULT_TREE) for sample in samples}
+    scheduler.run_groups(samples, reader.DEFAULT_TREE, HISTOGRAMS, n_workers=2, use_cache=False)
+    assert events("read") == expected
+    # The workers of a second pool must not send back the records of the first one
+    scheduler.run_groups(samples, reader.DEFAULT_TREE, HISTOGRAMS, n_workers=2, use_cache=False)
+    assert events("read") == {name: 2 * n for name, n in expected.items()}
+    instrument.reset()
+
+
+def test_pooled_shards_ship_their_records(samples, monkeypatch):
+    from hhbbgg import shards
+
+    monkeypatch.setenv(instrument.ENV_VAR, "1")
+    instrument.reset()
+    tasks = shards.make_shards(samples, reader.DEFAULT_TREE, HISTOGRAMS, shard_size=2_000)
+    shards.run_local(tasks, n_workers=2)
+    assert events("read") == {sample["name"]: reader.num_entries(sample["file_path"], reader.DEFAULT_TREE) for sample in samples}
+    instrument.reset()
+
+
+def test_pooled_rendering_ships_its_records(tmp_path, monkeypatch):
+    pytest.importorskip("ROOT")
+    from hhbbgg import render
+
+    monkeypatch.setenv(instrument.ENV_VAR, "1")
+    instrument.reset()
+    hist = Hist1D(4, (0, 4)).fill(np.array([0.5, 1.5, 2.5]))
+    specs = [
+        {"output": str(tmp_path / name), "data": hist, "backgrounds": [("MC", hist)], "x_label": name, "formats": ["png"]}
+        for name in ("a", "b", "c")
+    ]
+    render.render_all(specs, n_workers=2)
+    calls = {(row["sample"], row["stage"]): row["calls"] for row in instrument.rows()}
+    for name in ("a", "b", "c"):
+        assert calls[(name, "draw")] == 1
+        assert calls[(name, "print")] == 1
+    instrument.reset()
+
+
+def test_profile_summary_reports_the_bytes_read(samples, monkeypatch, capsys):
+    monkeypatch.setenv(instrument.ENV_VAR, "1")
+    instrument.reset()
+    scheduler.run_groups(samples, reader.DEFAULT_TREE, HISTOGRAMS, n_workers=2, use_cache=False)
+    instrument.print_summary()
+    lines = {line.split()[0]: line for line in capsys.readouterr().out.splitlines() if " MB of " in line}
+    assert set(lines) == {sample["name"] for sample in samples}
+    n_branches = len(engine.histogram_branches(HISTOGRAMS, is_data=False))
+    assert f" {n_branches}/" in lines["GGJets"] and "5000 entries" in lines["GGJets"]
+    instrument.reset()
@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+import pytest
+
+from hhbbgg import kinematics, synthetic
+
+
+class LorentzVector:
+    # Scalar transcription of the TLorentzVector methods used by the plot scripts
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, t=0.0):
+        self.x, self.y, self.z, self.t = x, y, z, t
+
+    @classmethod
+    def from_pt_eta_phi_m(cls, pt, eta, phi, m):
+        pt = abs(pt)
+        x, y, z = pt * math.cos(phi), pt * math.sin(phi), pt * math.sinh(eta)
+        p2 = x * x + y * y + z * z
+        return cls(x, y, z, math.sqrt(p2 + m * m) if m >= 0 else math.sqrt(max(p2 - m * m, 0.0)))
+
+    @classmethod
+    def from_pt_eta_phi_e(cls, pt, eta, phi, e):
+        pt = abs(pt)
+        return cls(pt * math.cos(phi), pt * math.sin(phi), pt * math.sinh(eta), e)
+
+    def __add__(self, other):
+        return LorentzVector(self.x + other.x, self.y + other.y, self.z + other.z, self.t + other.t)
+
+    def M(self):
+        m2 = self.t * self.t - (self.x * self.x + self.y * self.y + self.z * self.z)
+        return -math.sqrt(-m2) if m2 < 0 else math.sqrt(m2)
+
+    def Pt(self):
+        return math.hypot(self.x, self.y)
+
+    def Phi(self):
+        return 0.0 if self.x == 0 and self.y == 0 else math.atan2(self.y, self.x)
+
+    def Eta(self):
+        p = math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        cos_theta = 1.0 if p == 0 else self.z / p
+        if cos_theta * cos_theta < 1:
+            return -0.5 * math.log((1.0 - cos_theta) / (1.0 + cos_theta))
+        return 0.0 if self.z == 0 else math.copysign(10e10, self.z)
+
+    def Rapidity(self):
+        return 0.5 * math.log((self.t + self.z) / (self.t - self.z))
+
+
+METHODS = {"mass": "M", "pt": "Pt", "eta": "Eta", "phi": "Phi", "rapidity": "Rapidity"}
+
+
+def reference_pair(columns, pair, index, build):
+    vectors = []
+    for prefix in kinematics.PAIRS[pair]:
+        branches = kinematics.object_branches(prefix)
+        vectors.append(build(*(float(columns[branch][index]) for branch in branches)))
+    return vectors[0] + vectors[1]
+
+
+@pytest.fixture(scope="module")
+def columns():
+    return synthetic.generate_columns(500, seed=7)
+
+
+@pytest.mark.parametrize("pair, build", [
+    ("dijet", LorentzVector.from_pt_eta_phi_m),
+    ("diphoton", LorentzVector.from_pt_eta_phi_e),
+])
+def test_pair_kinematics_match_lorentz_vector(columns, pair, build):
+    result = kinematics.pair_kinematics(columns, pair)
+    for index in range(len(columns["lead_pt"])):
+        vector = reference_pair(columns, pair, index, build)
+        for name, method in METHODS.items():
+            assert result[name][index] == pytest.approx(getattr(vector, method)(), rel=1e-9, abs=1e-9)
+
+
+def test_photons_are_built_from_their_energy(columns):
+    # energyRaw is an energy: the synthetic photons are massless, so m_gg follows from the angles alone
+    lead = kinematics.candidate_kinematics(columns, "lead", ["mass"])["mass"]
+    assert np.all(np.abs(lead) < 1e-3 * columns["lead_energyRaw"])
+    expected = np.sqrt(
+        2 * columns["lead_pt"].astype(np.float64) * columns["sublead_pt"]
+        * (np.cosh(columns["lead_eta"].astype(np.float64) - columns["sublead_eta"])
+           - np.cos(columns["lead_phi"].astype(np.float64) - columns["sublead_phi"]))
+    )
+    m_gg = kinematics.pair_kinematics(columns, "diphoton", ["mass"])["mass"]
+    np.testing.assert_allclose(m_gg, expected, rtol=1e-3)
+
+
+def test_matches_root(columns):
+    ROOT = pytest.importorskip("ROOT")
+    result = kinematics.pair_kinematics(columns, "diphoton")
+    for index in range(50):
+        vector = ROOT.TLorentzVector()
+        for prefix in ("lead", "sublead"):
+            p4 = ROOT.TLorentzVector()
+            p4.SetPtEtaPhiE(*(float(columns[branch][index]) for branch in kinematics.object_branches(prefix)))
+            vector += p4
+        for name, method in METHODS.items():
+            assert result[name][index] == pytest.approx(getattr(vector, method)(), rel=1e-9, abs=1e-9)
@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from hhbbgg import analysis, engine, rdf, reader
+
+
+HISTOGRAMS = [
+    {"name": "m_gg", "observable": "m_gg", "bins": 20, "range": (80, 180), "blind": (115, 135)},
+    {"name": "MX_reduced", "observable": "MX_reduced", "bins": 30, "range": (200, 1200)},
+    {"name": "pt_ratio", "observable": "lead_pt / m_gg", "bins": 20, "range": (0, 2), "selection": "lead_mvaID_WP90 & (sublead_pt > 30)"},
+    {"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180), "weights": ["genweight", "weight_central"],
+     "variations": {"nominal": "genweight * weight_central", "genweight_only": "genweight"}},
+]
+
+
+def test_to_cxx():
+    assert rdf.to_cxx("lead_pt / 2 > 10") == "((double(lead_pt) / (2)) > 10)"
+    assert rdf.to_cxx("~a | (b ** 2)") == "((!a) || std::pow(b, 2))"
+    assert rdf.to_cxx("where(x < 1, 0.5, abs(y))") == "((x < 1) ? double(0.5) : double(std::abs(y)))"
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_rdataframe_matches_numpy(samples, index):
+    pytest.importorskip("ROOT")
+    sample = samples[index]
+    is_data = sample["kind"] == "data"
+    expected = engine.fill_streaming(sample["file_path"], reader.DEFAULT_TREE, HISTOGRAMS, is_data=is_data)
+    filled = rdf.fill_file(sample["file_path"], reader.DEFAULT_TREE, HISTOGRAMS, is_data=is_data)
+    for name, hist in expected.items():
+        np.testing.assert_allclose(filled[name].sumw, hist.sumw, rtol=1e-6, atol=1e-9)
+        np.testing.assert_allclose(filled[name].sumw2, hist.sumw2, rtol=1e-6, atol=1e-9)
+
+
+def test_run_samples_stores_the_sums_of_weights(samples):
+    pytest.importorskip("ROOT")
+    from hhbbgg import sumw_index
+
+    results = rdf.run_samples(samples, reader.DEFAULT_TREE, HISTOGRAMS[:2], n_threads=2)
+    assert list(results) == [sample["name"] for sample in samples]
+    for sample in samples[1:]:
+        stored = sumw_index.cached(sample["file_path"], reader.DEFAULT_TREE)
+        expected = sumw_index.scan(sample["file_path"], reader.DEFAULT_TREE)
+        assert stored["n_entries"] == expected["n_entries"]
+        assert stored["sum_genweight"] == pytest.approx(expected["sum_genweight"], rel=1e-9)
+
+
+SPARSE = [
+    {"name": "m_gg_vs_m_bb", "observables": ["m_gg", "m_bb"], "bins": [40, 50], "range": [[100, 180], [80, 180]], "blind": {"m_bb": (110, 140)}},
+    {"name": "MX_vs_m_bb_vs_pt", "observables": ["MX_reduced", "m_bb", "lead_pt"], "bins": [20, 15, 4], "range": [[200, 1200], [50, 800], [0, 200]]},
+]
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_rdataframe_fills_sparse_histograms(samples, index):
+    pytest.importorskip("ROOT")
+    sample = samples[index]
+    is_data = sample["kind"] == "data"
+    expected = engine.fill_streaming(sample["file_path"], reader.DEFAULT_TREE, SPARSE, is_data=is_data)
+    filled = rdf.fill_file(sample["file_path"], reader.DEFAULT_TREE, SPARSE, is_data=is_data)
+    for name, hist in expected.items():
+        for got, want in zip(filled[name].to_dense(), hist.to_dense()):
+            np.testing.assert_allclose(got, want, rtol=1e-6, atol=1e-9)
+
+
+def test_too_many_axes_are_skipped_with_a_warning(samples):
+    pytest.importorskip("ROOT")
+    request = {"name": "four", "observables": ["m_gg", "m_bb", "lead_pt", "sublead_pt"], "bins": [2, 2, 2, 2], "range": [[0, 200]] * 4}
+    with pytest.warns(UserWarning, match="four"):
+        filled = rdf.fill_file(samples[1]["file_path"], reader.DEFAULT_TREE, [request, HISTOGRAMS[0]])
+    assert list(filled) == ["m_gg"]
+
+
+def test_planes_above_the_cell_budget_are_skipped(samples, monkeypatch):
+    pytest.importorskip("ROOT")
+    monkeypatch.setenv("HHBBGG_RDF_MAX_CELLS", "2200")
+    with pytest.warns(UserWarning, match="MX_vs_m_bb_vs_pt"):
+        filled = rdf.fill_file(samples[1]["file_path"], reader.DEFAULT_TREE, SPARSE)
+    assert list(filled) == ["m_gg_vs_m_bb"]
+
+
+def test_default_config_runs_on_both_backends(samples):
+    pytest.importorskip("ROOT")
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")) as f:
+        config = json.load(f)
+    config.update(
+        data_file_paths=[sample["file_path"] for sample in samples if sample["kind"] == "data"],
+        background_files=[{"file_path": sample["file_path"], "cross_section": 10.0} for sample in samples if sample["kind"] == "mc"],
+        integrated_luminosities={"Data_EraE": 2.0},
+    )
+    expected = analysis.run(config, n_workers=1, use_cache=False)
+    # The default planes are too finely binned to be booked dense on every thread
+    with pytest.warns(UserWarning, match="HHBBGG_RDF_MAX_CELLS"):
+        filled = analysis.run(config, n_workers=2, backend="rdataframe")
+    planes = {name for name, hist in expected["data"].items() if hasattr(hist, "to_dense")}
+    assert planes == {"m_gg_vs_m_bb", "MX_reduced_vs_m_bb"}
+    assert list(filled) == list(expected)
+    for group, result in expected.items():
+        assert list(filled[group]) == [name for name in result if name not in planes]
+        for name, hist in filled[group].items():
+            np.testing.assert_allclose(hist.sumw, result[name].sumw, rtol=1e-6, atol=1e-9)
+            np.testing.assert_allclose(hist.sumw2, result[name].sumw2, rtol=1e-6, atol=1e-9)
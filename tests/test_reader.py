@@ -0,0 +1,67 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from hhbbgg import reader, synthetic
+
+
+@pytest.mark.parametrize("n_entries", [0, 300])
+def test_parquet_empty_range_is_typed(tmp_path, n_entries):
+    pytest.importorskip("pyarrow")
+    file_path = synthetic.write_parquet(str(tmp_path / "sample.parquet"), synthetic.generate_columns(n_entries))
+    source = reader.ParquetSource(file_path)
+    columns = source.read(["lead_pt", "lead_mvaID_WP90"], n_entries // 2, n_entries // 2)
+    assert columns["lead_pt"].dtype == np.float32 and len(columns["lead_pt"]) == 0
+    assert columns["lead_mvaID_WP90"].dtype == bool and len(columns["lead_mvaID_WP90"]) == 0
+
+
+def counted(ranges, pulled):
+    # Ranges handed to prefetch, counting how many reads it has submitted
+    for item in ranges:
+        pulled.append(item)
+        yield item
+
+
+def test_prefetched_chunks_match_synchronous_reads(samples):
+    branches = ["lead_pt", "sublead_pt", "genweight"]
+    sample = samples[1]
+    synchronous = list(reader.iter_chunks(sample["file_path"], reader.DEFAULT_TREE, branches, 700, depth=0))
+    for depth in (1, 3):
+        prefetched = list(reader.iter_chunks(sample["file_path"], reader.DEFAULT_TREE, branches, 700, depth=depth))
+        assert [start for start, _ in prefetched] == [start for start, _ in synchronous]
+        for (_, got), (_, want) in zip(prefetched, synchronous):
+            for name in branches:
+                np.testing.assert_array_equal(got[name], want[name])
+
+
+@pytest.mark.parametrize("max_bytes, ahead", [(1 << 30, 4), (1_500, 1)])
+def test_memory_budget_limits_reads_in_flight(max_bytes, ahead):
+    depth, n_chunks = 4, 12
+    pulled = []
+    ranges = counted(((i, i + 1) for i in range(n_chunks)), pulled)
+    # Every chunk takes 1000 bytes
+    read = lambda start, stop: {"x": np.zeros(125, dtype=np.float64)}
+    for index, (start, _, _) in enumerate(reader.prefetch(read, ranges, depth=depth, max_bytes=max_bytes)):
+        assert start == index
+        # The first chunk's size is not known before it arrives, so up to depth reads start at once
+        assert len(pulled) <= max(depth, min(index + 1 + ahead, n_chunks))
+        if ahead == depth:
+            assert len(pulled) == min(index + 1 + depth, n_chunks)
+
+
+def test_closing_early_cancels_pending_reads():
+    calls = []
+
+    def read(start, stop):
+        calls.append(start)
+        time.sleep(0.2)
+        return {"x": np.zeros(1)}
+
+    chunks = reader.prefetch(read, ((i, i + 1) for i in range(10)), depth=3)
+    assert next(chunks)[0] == 0
+    chunks.close()
+    # The read running when the caller stopped completes, the queued ones never start
+    assert len(calls) <= 2
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("hhbbgg-prefetch")]
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from hhbbgg import render
+from hhbbgg.histogram import Hist1D, HistVariations, SparseHist
+
+
+def test_stack_specs_draw_nominal_and_warn_about_skipped_plots():
+    hist = Hist1D(4, (0, 4)).fill(np.array([0.5, 1.5]))
+    variations = HistVariations(["genweight_only", "nominal"], 4, (0, 4)).fill(np.array([0.5]), np.array([[1.0], [2.0]]))
+    plane = SparseHist.from_spec({"observables": ["m_gg", "m_bb"], "bins": [4, 4], "range": [(0, 4), (0, 4)]})
+    groups = {
+        "data": {"m_bb": hist, "m_gg": hist, "m_gg_vs_m_bb": plane},
+        "GGJets": {"m_bb": hist, "m_gg": variations, "m_gg_vs_m_bb": plane},
+    }
+    with pytest.warns(UserWarning, match="m_gg_vs_m_bb"):
+        specs = render.stack_specs(groups, {}, "out")
+    assert [spec["output"] for spec in specs] == ["out/m_bb", "out/m_gg"]
+    label, background = specs[1]["backgrounds"][0]
+    assert isinstance(background, Hist1D) and background.integral() == 2.0
@@ -0,0 +1,30 @@
+import os
+
+from hhbbgg import result_cache
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    value = b"x" * 10_000
+    for number, key in enumerate("abc", start=1):
+        result_cache.put(key, value)
+        # Well separated last-used times, oldest first
+        os.utime(result_cache._entry_path(key), (number * 1000, number * 1000))
+    size = os.path.getsize(result_cache._entry_path("a"))
+    monkeypatch.setenv("HHBBGG_CACHE_MAX_BYTES", str(3 * size + size // 2))
+    # Using "a" makes "b" the least recently used entry
+    assert result_cache.get("a") == value
+    result_cache.put("d", value)
+    assert [result_cache.contains(key) for key in "abcd"] == [True, False, True, True]
+    assert sum(size for _, size, _ in result_cache.entries()) <= result_cache.max_bytes()
+
+
+def test_cached_computes_once():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"m_bb": 1.0}
+
+    assert result_cache.cached("key", compute) == result_cache.cached("key", compute) == {"m_bb": 1.0}
+    assert len(calls) == 1
+    assert result_cache.clear() == 0 and not result_cache.contains("key")
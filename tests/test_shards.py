@@ -0,0 +1,68 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from hhbbgg import cutflow, engine, reader, shards, synthetic
+
+
+HISTOGRAMS = [
+    {"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180), "blind": (110, 140)},
+    {"name": "lead_pt", "observable": "lead_pt", "bins": 40, "range": (0, 200), "selection": "lead_mvaID_WP90 & sublead_mvaID_WP90"},
+]
+
+CUTS = {"photon_id": "lead_mvaID_WP90 & sublead_mvaID_WP90", "lead_pt": "lead_pt > 50"}
+
+
+@pytest.fixture
+def all_samples(samples, tmp_path):
+    empty = synthetic.make_sample(str(tmp_path / "samples"), "Empty", 0, seed=9)
+    return samples + [{"name": "Empty", "label": "Empty", "file_path": empty, "kind": "mc", "group": "Empty"}]
+
+
+def test_merged_shards_match_single_pass(all_samples):
+    tasks = shards.make_shards(all_samples, reader.DEFAULT_TREE, HISTOGRAMS, shard_size=2_000, chunk_size=1_000)
+    assert len(tasks) == 3 * 3 + 1
+    merged = shards.merge_results(tasks, shards.run_local(tasks, n_workers=1))
+    assert set(merged) == {sample["name"] for sample in all_samples}
+    for sample in all_samples:
+        single = engine.fill_streaming(sample["file_path"], reader.DEFAULT_TREE, HISTOGRAMS, 1_000, sample["kind"] == "data")
+        for name, hist in single.items():
+            np.testing.assert_allclose(merged[sample["name"]][name].sumw, hist.sumw, rtol=1e-12)
+            np.testing.assert_allclose(merged[sample["name"]][name].sumw2, hist.sumw2, rtol=1e-12)
+
+
+def test_merged_cutflow_shards_match_single_pass(all_samples):
+    weights = {"mc": ["genweight", "weight_central"], "data": []}
+    blind = cutflow.blinding_cuts(HISTOGRAMS)
+    tasks = shards.make_shards(all_samples, reader.DEFAULT_TREE, cuts=CUTS, shard_size=2_000, chunk_size=1_000, weights=weights, blind=blind)
+    merged = shards.merge_results(tasks, shards.run_local(tasks, n_workers=1))
+    for sample in all_samples:
+        single = cutflow.fill_sample(sample, reader.DEFAULT_TREE, CUTS, chunk_size=1_000, use_cache=False, weights=weights, blind=blind)
+        for shard_row, row in zip(merged[sample["name"]].table(), single.table()):
+            assert shard_row["events"] == row["events"]
+            assert shard_row["weighted"] == pytest.approx(row["weighted"], rel=1e-12)
+
+
+def test_file_queue(all_samples, tmp_path):
+    tasks = shards.make_shards(all_samples[1:2], reader.DEFAULT_TREE, HISTOGRAMS, shard_size=2_000, chunk_size=1_000)
+    queue = shards.FileQueue(str(tmp_path / "queue"), heartbeat=0.05)
+    queue.submit(tasks)
+    task = queue.claim()
+    running = queue._path("running", task["id"])
+    claimed = os.path.getmtime(running)
+    with queue.beating(task):
+        time.sleep(0.3)
+        # A live shard keeps beating and is not taken back
+        assert queue.requeue(max_age=0.2) == []
+    assert os.path.getmtime(running) > claimed
+    # Requeued after all (e.g. a stalled node): completing it must not fail
+    os.utime(running, (claimed - 10, claimed - 10))
+    assert queue.requeue(max_age=1) == [task["id"]]
+    queue.complete(task, shards.run_shard(task))
+    assert queue.status() == {"pending": len(tasks) - 1, "running": 0, "done": 1}
+    assert queue.drain() == len(tasks) - 1
+    merged = shards.merge_results(tasks, queue.results())
+    single = engine.fill_streaming(all_samples[1]["file_path"], reader.DEFAULT_TREE, HISTOGRAMS, 1_000)
+    np.testing.assert_allclose(merged["GGJets"]["m_bb"].sumw, single["m_bb"].sumw, rtol=1e-12)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from hhbbgg import reader, scheduler, sumw_index
+
+
+HISTOGRAMS = [{"name": "m_bb", "observable": "m_bb", "bins": 20, "range": (80, 180)}]
+
+
+def test_scan_matches_branch_sums(samples):
+    sample = samples[1]
+    genweight = reader.read_columns(sample["file_path"], reader.DEFAULT_TREE, ["genweight"])["genweight"]
+    entry = sumw_index.lookup(sample["file_path"], reader.DEFAULT_TREE)
+    assert entry["n_entries"] == len(genweight)
+    assert entry["sum_genweight"] == pytest.approx(float(np.sum(genweight, dtype=np.float64)))
+    assert entry["sum_genweight2"] == pytest.approx(float(np.sum(genweight.astype(np.float64) ** 2)))
+
+
+def test_fill_pass_fills_the_index(samples, monkeypatch):
+    expected = {sample["file_path"]: sumw_index.scan(sample["file_path"], reader.DEFAULT_TREE) for sample in samples if sample["kind"] == "mc"}
+
+    def no_scan(file_path, tree_name):
+        raise AssertionError(f"{file_path} was scanned again")
+
+    monkeypatch.setattr(sumw_index, "scan", no_scan)
+    scheduler.run_groups(samples, reader.DEFAULT_TREE, HISTOGRAMS, n_workers=1, scale=lambda sample: 1.0)
+    for file_path, entry in expected.items():
+        stored = sumw_index.lookup(file_path, reader.DEFAULT_TREE)
+        assert stored["n_entries"] == entry["n_entries"]
+        for name in sumw_index.WEIGHT_BRANCHES:
+            assert stored[f"sum_{name}"] == pytest.approx(entry[f"sum_{name}"], rel=1e-12)
+    # Data needs no normalization and is not indexed
+    assert sumw_index.cached(samples[0]["file_path"], reader.DEFAULT_TREE) is None
+
+
+def test_fill_pass_opens_each_file_once(samples, monkeypatch):
+    opened = []
+    open_source = reader.open_source
+
+    def counting(file_path, *args, **kwargs):
+        opened.append(file_path)
+        return open_source(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(reader, "open_source", counting)
+    cuts = ["lead_pt > 50"]
+    for sample in samples[1:]:
+        result, sums = scheduler.fill_and_sum(sample, reader.DEFAULT_TREE, HISTOGRAMS, use_cache=False, cuts=cuts)
+        assert sums is not None and "complete" not in sums
+        assert sums["n_entries"] == 5_000
+    assert opened == [sample["file_path"] for sample in samples[1:]]
+    # The second pass reads only the entries of the stored entry index: no complete sums
+    result, sums = scheduler.fill_and_sum(samples[1], reader.DEFAULT_TREE, HISTOGRAMS, use_cache=False, cuts=cuts)
+    assert sums is None
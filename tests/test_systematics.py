@@ -0,0 +1,52 @@
+import numpy as np
+
+from hhbbgg import analysis, reader, synthetic
+
+
+def make_config(tmp_path, variations):
+    samples = []
+    for seed, (name, is_data) in enumerate([("Data_EraE", True), ("GGJets", False), ("GJetPt40", False)], start=1):
+        columns = synthetic.generate_columns(2_000, seed=seed, is_data=is_data)
+        if not is_data:
+            for shift in ("Up", "Down"):
+                columns[f"weight_PhotonID{shift}"] = np.full(2_000, 1.1 if shift == "Up" else 0.9, dtype=np.float32)
+            if name == "GGJets":
+                # Only in one sample: cannot be filled for all of them
+                columns["weight_PileupUp"] = np.ones(2_000, dtype=np.float32)
+        samples.append(synthetic.write_root(str(tmp_path / f"{name}.root"), columns))
+    return {
+        "data_file_paths": samples[:1],
+        "background_files": [{"file_path": path} for path in samples[1:]],
+        "tree_name": reader.DEFAULT_TREE,
+        "weights": {"mc": ["genweight"], "data": []},
+        "weight_variations": variations,
+        "observables": {"m_bb": {"bins": 20, "range": [80, 180]}},
+    }
+
+
+def test_auto_variations(tmp_path):
+    config = make_config(tmp_path, "auto")
+    assert list(analysis.weight_variations(config)) == ["nominal", "genweight_only", "PhotonIDDown", "PhotonIDUp"]
+    groups = analysis.run(config, n_workers=1, use_cache=False)
+    hist = groups["GGJets"]["m_bb"]
+    assert hist.names == ["nominal", "genweight_only", "PhotonIDDown", "PhotonIDUp"]
+    up, down = hist.sumw[hist.names.index("PhotonIDUp")], hist.sumw[hist.names.index("PhotonIDDown")]
+    np.testing.assert_allclose(up * 0.9, down * 1.1, rtol=1e-6)
+    # Data has no variation branches and fills the same value in every row
+    data = groups["data"]["m_bb"]
+    assert all(np.array_equal(row, data.sumw[0]) for row in data.sumw)
+
+
+def test_auto_nominal_uses_the_config_weights(tmp_path):
+    config = make_config(tmp_path, "auto")
+    for weights in (["genweight"], ["genweight", "weight_central"]):
+        config["weights"]["mc"] = weights
+        variations = analysis.weight_variations(config)
+        assert variations["nominal"] == " * ".join(weights)
+        assert variations["PhotonIDUp"] == "genweight * weight_PhotonIDUp"
+        with_variations = analysis.run(config, n_workers=1, use_cache=False)
+        without = analysis.run(dict(config, weight_variations=None), n_workers=1, use_cache=False)
+        for group in ("GGJets", "GJetPt40"):
+            hist = with_variations[group]["m_bb"]
+            np.testing.assert_allclose(hist.sumw[hist.names.index("nominal")], without[group]["m_bb"].sumw, rtol=1e-12)
+            np.testing.assert_allclose(hist.sumw2[hist.names.index("nominal")], without[group]["m_bb"].sumw2, rtol=1e-12)